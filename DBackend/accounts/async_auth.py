@@ -0,0 +1,33 @@
+"""
+JWT authentication for plain Django async views.
+
+DRF's APIView is synchronous, so the async endpoints are ordinary
+`async def` views and authenticate the Bearer token themselves with the
+same SimpleJWT settings the DRF views use.
+"""
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+_jwt = JWTAuthentication()
+
+
+def authenticate_jwt(request):
+    """Returns the user for the request's Bearer token, or None."""
+    header = _jwt.get_header(request)
+    if header is None:
+        return None
+    try:
+        # get_raw_token() rejects a malformed header ("Bearer" alone).
+        raw_token = _jwt.get_raw_token(header)
+        if raw_token is None:
+            return None
+        user = _jwt.get_user(_jwt.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+async def aauthenticate_jwt(request):
+    # get_user() hits the database, so run it on Django's sync thread.
+    return await sync_to_async(authenticate_jwt)(request)
@@ -1,3 +1,37 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .async_auth import aauthenticate_jwt
+
+
+class AsyncJWTAuthTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", password="pw-12345")
+
+    def authenticate(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        return async_to_sync(aauthenticate_jwt)(request)
+
+    def bearer(self, user):
+        return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    def test_valid_token(self):
+        self.assertEqual(self.authenticate(**self.bearer(self.user)), self.user)
+
+    def test_missing_malformed_or_invalid_token(self):
+        self.assertIsNone(self.authenticate())
+        self.assertIsNone(self.authenticate(Authorization="Bearer"))
+        self.assertIsNone(self.authenticate(Authorization="Basic dXNlcjpwdw=="))
+        self.assertIsNone(self.authenticate(Authorization="Bearer not-a-jwt"))
+
+    def test_inactive_or_deleted_user(self):
+        headers = self.bearer(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.authenticate(**headers))
+
+        self.user.delete()
+        self.assertIsNone(self.authenticate(**headers))
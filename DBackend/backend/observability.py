@@ -0,0 +1,374 @@
+"""
+Request tracing, structured logs and Prometheus metrics.
+
+- Every request gets an ID: the client's X-Request-ID when it looks sane,
+  else a fresh one. It is echoed in the response, added to every log
+  record (RequestIdFilter) and to the JSON event lines from log_event().
+- span(name) / record_span() time one piece of work (decode, preprocess,
+  inference, gemini, and the upload stages cnn / reasoning / storage /
+  db). The duration goes into the app_span_duration_seconds histogram
+  and into the current request's span totals, which
+  RequestTracingMiddleware logs as one "request" event, so the slow stage
+  of a particular request can be found in the logs.
+- count_cache(), count_error() and count_fallback() feed the counters.
+- metrics_view renders everything in the Prometheus text format at
+  /metrics (METRICS_TOKEN, when set, is required as a bearer token).
+
+Metrics live in process memory like the other *_stats endpoints: with
+several gunicorn workers, scrape each worker or expect per-worker values.
+Work handed to a thread pool only reports into the request's spans when
+submitted through contextvars.copy_context().run. A streaming response's
+content runs in the request's context too, and the request is logged
+(and its duration measured) when the response is closed.
+"""
+import hmac
+import json
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers cache hits (ms) up to slow Gemini calls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+
+_request_id = ContextVar("request_id", default=None)
+_spans = ContextVar("spans", default=None)
+
+
+# =========================================================
+# Metrics
+# =========================================================
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_series(list(zip(self.labels, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series["count"] if series else 0
+
+    def _render_series(self, labels, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series["buckets"]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get_or_create(Counter, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labels, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Zero every metric (tests)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by method, route and status.", ("method", "route", "status"),
+)
+HTTP_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time until the response is sent (streamed responses: until they close), by method and route.", ("method", "route"),
+)
+SPAN_DURATION = registry.histogram(
+    "app_span_duration_seconds", "Duration of traced units of work.", ("span",),
+)
+CACHE_LOOKUPS = registry.counter(
+    "app_cache_lookups_total", "Cache lookups by cache and outcome.", ("cache", "outcome"),
+)
+ERRORS = registry.counter("app_errors_total", "Failed stages.", ("stage",))
+FALLBACKS = registry.counter("app_fallbacks_total", "Degraded answers served instead of failing.", ("kind",))
+
+
+def count_cache(cache, outcome):
+    CACHE_LOOKUPS.inc(cache=cache, outcome=outcome)
+
+
+def count_error(stage):
+    ERRORS.inc(stage=stage)
+
+
+def count_fallback(kind):
+    FALLBACKS.inc(kind=kind)
+
+
+# =========================================================
+# Spans and request context
+# =========================================================
+
+def current_request_id():
+    return _request_id.get()
+
+
+def record_span(name, seconds):
+    SPAN_DURATION.observe(seconds, span=name)
+    spans = _spans.get()
+    if spans is not None:
+        spans[name] = round(spans.get(name, 0.0) + seconds * 1000.0, 2)
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def log_event(log, event, level=logging.INFO, **fields):
+    """One JSON line: {"event": ..., "request_id": ..., **fields}."""
+    log.log(level, json.dumps({"event": event, "request_id": current_request_id(), **fields}, default=str))
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` ("-" outside requests) to every record."""
+
+    def filter(self, record):
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+class RequestTracingMiddleware:
+    """
+    Assigns the request ID, collects the request's spans and records the
+    HTTP metrics. Requests that ran traced work, or failed with a 5xx, are
+    logged as a "request" event with their span totals.
+
+    A streaming response's generator runs after the view has returned, so
+    its chunks are produced in the request's context and the request is
+    only finished when the server closes the response.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self._start(request)
+        try:
+            return self._respond(request, self.get_response(request), state)
+        finally:
+            self._reset(state)
+
+    async def __acall__(self, request):
+        state = self._start(request)
+        try:
+            return self._respond(request, await self.get_response(request), state)
+        finally:
+            self._reset(state)
+
+    def _start(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        spans = {}
+        return {
+            "started": time.perf_counter(),
+            "request_id": request_id,
+            "spans": spans,
+            "tokens": (_request_id.set(request_id), _spans.set(spans)),
+            # Taken after the set() calls above: the streamed content runs in it.
+            "context": copy_context(),
+        }
+
+    def _reset(self, state):
+        request_token, spans_token = state["tokens"]
+        _spans.reset(spans_token)
+        _request_id.reset(request_token)
+
+    def _respond(self, request, response, state):
+        response[REQUEST_ID_HEADER] = state["request_id"]
+        if not response.streaming:
+            self._finish(request, response, state)
+            return response
+
+        context = state["context"]
+        if response.is_async:
+            response.streaming_content = _atraced(response.streaming_content, state)
+        else:
+            content = response.streaming_content
+            response.streaming_content = iter(lambda: context.run(next, content, None), None)
+
+        close = response.close
+        closing = []
+
+        def close_and_finish():
+            # Once only: closing the content can call response.close again
+            # (the test client's iterator wrapper does).
+            if closing:
+                return
+            closing.append(True)
+            # Generator cleanup (a client that disconnected mid-stream) is traced too.
+            try:
+                context.run(close)
+            finally:
+                context.run(self._finish, request, response, state)
+
+        response.close = close_and_finish
+        return response
+
+    def _finish(self, request, response, state):
+        duration = time.perf_counter() - state["started"]
+        match = getattr(request, "resolver_match", None)
+        # The URL pattern, not the path, so IDs don't explode the label set.
+        route = match.route if match else "unmatched"
+
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        HTTP_DURATION.observe(duration, method=request.method, route=route)
+
+        if state["spans"] or response.status_code >= 500:
+            log_event(
+                logger, "request", method=request.method, route=route, status=response.status_code,
+                duration_ms=round(duration * 1000.0, 2), spans_ms=state["spans"],
+            )
+
+
+async def _atraced(content, state):
+    # An async generator runs in the context of the task iterating it.
+    tokens = (_request_id.set(state["request_id"]), _spans.set(state["spans"]))
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        _spans.reset(tokens[1])
+        _request_id.reset(tokens[0])
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
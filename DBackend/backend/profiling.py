@@ -0,0 +1,232 @@
+"""
+Opt-in request profiling.
+
+With PROFILING on, ProfilingMiddleware runs a request under cProfile when
+
+- it carries "X-Profile: <PROFILING_TOKEN>" (privileged, on demand), or
+- it falls in the PROFILING_SAMPLE_RATE random sample.
+
+A profiled request also has its SQL counted and timed (every configured
+database). The cProfile stats are written to PROFILING_DIR as
+<id>.prof, loadable with pstats / snakeviz, next to <id>.json with the
+route, status, durations, SQL totals, the slowest queries and the top
+functions by cumulative time. The response carries X-Profile-Id. Only
+the newest PROFILING_MAX_PROFILES are kept.
+
+Staff users list the profiles at /api/profiles/ and download one at
+/api/profiles/<id>/ (?format=json for the summary).
+
+Cost: with PROFILING off the middleware removes itself at startup
+(MiddlewareNotUsed); on, an unsampled request pays one random() call and
+a header lookup. One request is profiled at a time per process; others
+arriving meanwhile run unprofiled. cProfile sees the request's own
+thread, so pipeline stages on the thread pool appear as the time spent
+waiting for them (see the span timings in backend.observability for
+their breakdown). Async views are never profiled: on the event loop the
+profile would mix in every other request.
+"""
+import cProfile
+import hmac
+import json
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, Http404
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_ID_RE = re.compile(r"^[\w.-]{1,128}$")
+
+TOP_FUNCTIONS = 30
+SLOWEST_QUERIES = 10
+
+_busy = threading.Lock()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000.0
+            self.count += 1
+            self.total_ms += elapsed
+            self.queries.append((elapsed, sql))
+
+    def summary(self):
+        slowest = sorted(self.queries, key=lambda q: q[0], reverse=True)[:SLOWEST_QUERIES]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "slowest": [{"ms": round(ms, 3), "sql": sql[:500]} for ms, sql in slowest],
+        }
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        _, calls, own_time, cumulative, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            "function": f"{filename}:{line}({name})" if line else name,
+            "calls": calls,
+            "own_ms": round(own_time * 1000.0, 3),
+            "cumulative_ms": round(cumulative * 1000.0, 3),
+        })
+    return rows
+
+
+def profile_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def profile_path(profile_id, suffix):
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    return profile_dir() / f"{profile_id}{suffix}"
+
+
+def prune_profiles(keep):
+    summaries = sorted(profile_dir().glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in summaries[keep:]:
+        old.with_suffix(".prof").unlink(missing_ok=True)
+        old.unlink(missing_ok=True)
+
+
+def list_profiles():
+    profiles = []
+    for path in sorted(profile_dir().glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: summary.get(key) for key in (
+            "id", "created_at", "trigger", "method", "path", "route", "status", "duration_ms",
+        )} | {"sql_queries": summary.get("sql", {}).get("count")})
+    return profiles
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.get_response(request)
+
+        trigger = self.trigger(request)
+        if trigger is None or not _busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, trigger)
+        finally:
+            _busy.release()
+
+    def trigger(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token and settings.PROFILING_TOKEN and hmac.compare_digest(
+            token.encode(), settings.PROFILING_TOKEN.encode(),
+        ):
+            return "header"
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    def profile(self, request, trigger):
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        now = datetime.now(dt_timezone.utc)
+        request_id = getattr(request, "request_id", None) or uuid.uuid4().hex
+        profile_id = f"{now:%Y%m%dT%H%M%S}-{request_id}"[:128]
+        summary = {
+            "id": profile_id,
+            "created_at": now.isoformat(),
+            "trigger": trigger,
+            "method": request.method,
+            "path": request.path,
+            "route": match.route if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000.0, 2),
+            "sql": recorder.summary(),
+            "top_functions": top_functions(profiler),
+        }
+
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(directory / f"{profile_id}.prof")
+        (directory / f"{profile_id}.json").write_text(json.dumps(summary, indent=2))
+        prune_profiles(settings.PROFILING_MAX_PROFILES)
+
+        response[PROFILE_ID_HEADER] = profile_id
+        return response
+
+
+# =========================================================
+# Admin endpoints
+# =========================================================
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """Stored profiles, newest first."""
+    if not profile_dir().is_dir():
+        return Response({"profiles": []})
+    return Response({"profiles": list_profiles()})
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    """The .prof file (cProfile/pstats format), or ?format=json for the summary."""
+    wants_json = request.query_params.get("format") == "json"
+    path = profile_path(profile_id, ".json" if wants_json else ".prof")
+    if path is None or not path.is_file():
+        raise Http404
+    if wants_json:
+        return Response(json.loads(path.read_text()))
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name,
+                        content_type="application/octet-stream")
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import cloudinary
 from dotenv import load_dotenv
 import os
@@ -56,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.observability.RequestTracingMiddleware',
+    'backend.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,13 +101,66 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_ENGINE=sqlite (default) keeps the single-file database for one-node
+# installs. The busy timeout makes a second writer wait for the lock
+# instead of failing with "database is locked". SQLITE_WAL=True adds WAL
+# (readers run alongside the writer) and BEGIN IMMEDIATE, which takes the
+# write lock up front so a read-then-write transaction cannot deadlock on
+# the upgrade. WAL is opt-in because it is a persistent property of the
+# database file: it rewrites db.sqlite3 and leaves -wal/-shm files next
+# to it.
+#
+# DB_ENGINE=postgresql is for several workers writing at once. Connections
+# are either kept open per worker thread (DB_CONN_MAX_AGE seconds) or,
+# with DB_POOL=True, drawn from a psycopg pool shared by the process.
+# Compare the options with `manage.py benchmark_db_writes`.
+
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DB_POOL = os.getenv("DB_POOL", "False") == "True"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("DB_NAME", "tumor_detection"),
+            'USER': os.getenv("DB_USER", "postgres"),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", "5432"),
+            # Django refuses persistent connections on top of a pool.
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+            },
+        }
     }
-}
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            'timeout': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+elif DB_ENGINE == "sqlite":
+    SQLITE_WAL = os.getenv("SQLITE_WAL", "False") == "True"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("DB_NAME") or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Seconds to wait for another connection's write lock.
+                'timeout': float(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+            },
+        }
+    }
+    if SQLITE_WAL:
+        DATABASES['default']['OPTIONS'].update({
+            'init_command': "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL",
+            'transaction_mode': "IMMEDIATE",
+        })
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}")
 
 
 # Password validation
@@ -152,7 +208,9 @@ cloudinary.config(
     cloud_name = os.getenv("CLOUD_NAME"),
     api_key = os.getenv("API_KEY"),
     api_secret = os.getenv("API_SECRET"),
-    secure= True
+    secure= True,
+    # Points uploads at another API host, e.g. a local fake for load tests.
+    upload_prefix = os.getenv("CLOUDINARY_UPLOAD_PREFIX") or None,
 )
 
 from datetime import timedelta
@@ -163,4 +221,209 @@ SIMPLE_JWT = {
 
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
-}
\ No newline at end of file
+}
+
+# Scan image storage (patients.storage). "cloudinary" uploads through the
+# SDK; "local" stores content-addressed files under SCAN_STORAGE_ROOT and
+# serves them at SCAN_STORAGE_BASE_URL (patients.views.serve_media).
+SCAN_STORAGE_BACKEND = os.getenv("SCAN_STORAGE_BACKEND", "cloudinary")
+SCAN_STORAGE_ROOT = os.getenv("SCAN_STORAGE_ROOT", str(BASE_DIR / "media" / "scans"))
+SCAN_STORAGE_BASE_URL = os.getenv("SCAN_STORAGE_BASE_URL", "http://127.0.0.1:8000/api/patients/media/")
+
+# Predictor / CNN inference
+# Micro-batching: concurrent predict_image() calls are grouped into one
+# forward pass, flushed at PREDICTOR_MAX_BATCH_SIZE images or after
+# PREDICTOR_MAX_WAIT_MS milliseconds.
+PREDICTOR_BATCHING = os.getenv("PREDICTOR_BATCHING", "False") == "True"
+PREDICTOR_MAX_BATCH_SIZE = int(os.getenv("PREDICTOR_MAX_BATCH_SIZE", "16"))
+PREDICTOR_MAX_WAIT_MS = float(os.getenv("PREDICTOR_MAX_WAIT_MS", "10"))
+PREDICTOR_BATCH_TIMEOUT = float(os.getenv("PREDICTOR_BATCH_TIMEOUT", "30"))
+
+# Prediction cache: CNN results keyed by a SHA-256 of the uploaded bytes
+# plus the model version. PREDICTOR_CACHE_PERSISTENT additionally stores
+# results in the predictor_predictionrecord table.
+PREDICTOR_CACHE = os.getenv("PREDICTOR_CACHE", "True") == "True"
+PREDICTOR_CACHE_SIZE = int(os.getenv("PREDICTOR_CACHE_SIZE", "1024"))
+PREDICTOR_CACHE_PERSISTENT = os.getenv("PREDICTOR_CACHE_PERSISTENT", "False") == "True"
+PREDICTOR_MODEL_VERSION = os.getenv("PREDICTOR_MODEL_VERSION", "")
+
+# Model loading. PREDICTOR_BACKEND is "keras" (predictor/model_fixed.h5)
+# or "tflite" (a model produced by `manage.py export_tflite`).
+# PREDICTOR_INFERENCE_MODE applies to the Keras backend and is one of
+# "predict" (Keras predict loop), "direct" (model(x) call) or "compiled"
+# (tf.function with a fixed input signature). PREDICTOR_WARMUP_ON_STARTUP
+# loads and warms the model in PredictorConfig.ready() instead of on the
+# first request.
+PREDICTOR_BACKEND = os.getenv("PREDICTOR_BACKEND", "keras")
+PREDICTOR_TFLITE_PATH = os.getenv("PREDICTOR_TFLITE_PATH", "")
+PREDICTOR_TFLITE_THREADS = int(os.getenv("PREDICTOR_TFLITE_THREADS", "0")) or None
+PREDICTOR_INFERENCE_MODE = os.getenv("PREDICTOR_INFERENCE_MODE", "compiled")
+PREDICTOR_WARMUP_ON_STARTUP = os.getenv("PREDICTOR_WARMUP_ON_STARTUP", "False") == "True"
+
+# Shared inference pool (`manage.py run_inference_pool`). When
+# PREDICTOR_POOL_ADDRESS is set, web workers send images to the pool over a
+# local socket instead of loading their own model copy. Requests beyond
+# PREDICTOR_POOL_MAX_PENDING are rejected with 503 + Retry-After.
+PREDICTOR_POOL_ADDRESS = os.getenv("PREDICTOR_POOL_ADDRESS", "")
+PREDICTOR_POOL_AUTHKEY = os.getenv("PREDICTOR_POOL_AUTHKEY", SECRET_KEY).encode()
+PREDICTOR_POOL_WORKERS = int(os.getenv("PREDICTOR_POOL_WORKERS", "2"))
+PREDICTOR_POOL_MAX_PENDING = int(os.getenv("PREDICTOR_POOL_MAX_PENDING", "32"))
+PREDICTOR_POOL_RETRY_AFTER = int(os.getenv("PREDICTOR_POOL_RETRY_AFTER", "2"))
+
+# Bulk scan upload (/api/patients/bulk-upload/)
+BULK_UPLOAD_MAX_ITEMS = int(os.getenv("BULK_UPLOAD_MAX_ITEMS", "500"))
+BULK_UPLOAD_MAX_ITEM_BYTES = int(os.getenv("BULK_UPLOAD_MAX_ITEM_BYTES", str(20 * 1024 * 1024)))
+# Decompressed total of one request; archive members are spooled to disk.
+BULK_UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("BULK_UPLOAD_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))
+# Django caps multipart uploads at 100 files by default.
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_UPLOAD_MAX_ITEMS + 10
+
+# Background scan analysis (patients.jobs). With SCAN_UPLOAD_ASYNC (or
+# async=true on the request) upload_scan returns 202 and a worker does the
+# CNN / Gemini / Cloudinary work. The in-process worker thread can be
+# disabled in favour of `manage.py run_scan_worker`.
+SCAN_UPLOAD_ASYNC = os.getenv("SCAN_UPLOAD_ASYNC", "False") == "True"
+SCAN_JOBS_IN_PROCESS_WORKER = os.getenv("SCAN_JOBS_IN_PROCESS_WORKER", "True") == "True"
+SCAN_JOBS_MAX_ATTEMPTS = int(os.getenv("SCAN_JOBS_MAX_ATTEMPTS", "3"))
+SCAN_JOBS_RETRY_BACKOFF = float(os.getenv("SCAN_JOBS_RETRY_BACKOFF", "5"))
+SCAN_JOBS_LOCK_TIMEOUT = float(os.getenv("SCAN_JOBS_LOCK_TIMEOUT", "300"))
+SCAN_JOBS_POLL_INTERVAL = float(os.getenv("SCAN_JOBS_POLL_INTERVAL", "1"))
+
+# Post-prediction fan-out (patients.pipeline): Gemini reasoning and the
+# image upload run concurrently with per-stage timeouts (seconds) and
+# a combined deadline, each on its own thread pool so slow Gemini calls
+# cannot starve uploads. SCAN_TIMING_HEADER adds a Server-Timing header.
+SCAN_PIPELINE_WORKERS = int(os.getenv("SCAN_PIPELINE_WORKERS", "8"))
+SCAN_REASONING_WORKERS = int(os.getenv("SCAN_REASONING_WORKERS", "8"))
+SCAN_REASONING_TIMEOUT = float(os.getenv("SCAN_REASONING_TIMEOUT", "20"))
+SCAN_STORAGE_TIMEOUT = float(os.getenv("SCAN_STORAGE_TIMEOUT", "30"))
+SCAN_POST_PREDICTION_DEADLINE = float(os.getenv("SCAN_POST_PREDICTION_DEADLINE", "35"))
+SCAN_TIMING_HEADER = os.getenv("SCAN_TIMING_HEADER", str(DEBUG)) == "True"
+
+# Image derivatives (patients.derivatives): a JPEG thumbnail for list
+# views and the 128x128 model-input rendition, made in the background on
+# a small pool. Beyond SCAN_DERIVATIVE_MAX_PENDING queued scans new work
+# is dropped and left to `manage.py backfill_derivatives`.
+SCAN_DERIVATIVES = os.getenv("SCAN_DERIVATIVES", "True") == "True"
+SCAN_DERIVATIVE_WORKERS = int(os.getenv("SCAN_DERIVATIVE_WORKERS", "2"))
+SCAN_DERIVATIVE_MAX_PENDING = int(os.getenv("SCAN_DERIVATIVE_MAX_PENDING", "64"))
+SCAN_THUMBNAIL_SIZE = int(os.getenv("SCAN_THUMBNAIL_SIZE", "256"))
+SCAN_THUMBNAIL_QUALITY = int(os.getenv("SCAN_THUMBNAIL_QUALITY", "75"))
+
+# Observability (backend.observability): request IDs on every log line,
+# per-request span timings and counters, exported for Prometheus at
+# /metrics. Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Request profiling (backend.profiling), off unless PROFILING=True. Then a
+# PROFILING_SAMPLE_RATE share of requests, and any request sent with
+# "X-Profile: <PROFILING_TOKEN>", runs under cProfile with its SQL timed.
+# The newest PROFILING_MAX_PROFILES are kept in PROFILING_DIR for staff to
+# download from /api/profiles/.
+PROFILING = os.getenv("PROFILING", "False") == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = os.getenv("PROFILING_DIR", str(BASE_DIR / "profiles"))
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "request_id": {"()": "backend.observability.RequestIdFilter"},
+    },
+    "formatters": {
+        "default": {"format": "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "filters": ["request_id"], "formatter": "default"},
+    },
+    "loggers": {
+        "backend": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "patients": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "predictor": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
+# Caches. "reasoning" holds Gemini clinical reasoning keyed by
+# (prompt version, tumor type, age band, gender); set
+# REASONING_CACHE_BACKEND=file to share it between workers on one host
+# (required by `manage.py warm_reasoning_cache`).
+REASONING_CACHE_ALIAS = "reasoning"
+REASONING_CACHE_TTL = int(os.getenv("REASONING_CACHE_TTL", str(7 * 24 * 3600)))
+REASONING_PROMPT_VERSION = os.getenv("REASONING_PROMPT_VERSION", "")
+REASONING_AGE_BAND_YEARS = int(os.getenv("REASONING_AGE_BAND_YEARS", "10"))
+REASONING_AGE_BAND_MAX = int(os.getenv("REASONING_AGE_BAND_MAX", "80"))
+
+# "responses" holds the JSON payloads of the patient/scan read endpoints
+# (patients.response_cache), invalidated on Patient / MRIScan /
+# DoctorReview writes. Invalidation only reaches the workers sharing the
+# cache, so it is on by default only with the shared file backend
+# (RESPONSE_CACHE_BACKEND=file); a per-process locmem cache is refused when
+# WEB_CONCURRENCY (gunicorn/uvicorn workers) is above 1, since the other
+# workers would serve stale patient data until RESPONSE_CACHE_TTL.
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "locmem")
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", str(RESPONSE_CACHE_BACKEND == "file")) == "True"
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+if RESPONSE_CACHE and RESPONSE_CACHE_BACKEND != "file" and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        "RESPONSE_CACHE with the per-process locmem backend serves stale data with "
+        "WEB_CONCURRENCY > 1; set RESPONSE_CACHE_BACKEND=file or RESPONSE_CACHE=False"
+    )
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    REASONING_CACHE_ALIAS: (
+        {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("REASONING_CACHE_DIR", str(BASE_DIR / "cache" / "reasoning")),
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+        if os.getenv("REASONING_CACHE_BACKEND", "locmem") == "file"
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "reasoning",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    ),
+    RESPONSE_CACHE_ALIAS: (
+        {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("RESPONSE_CACHE_DIR", str(BASE_DIR / "cache" / "responses")),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+        if RESPONSE_CACHE_BACKEND == "file"
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "responses",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    ),
+}
+
+# Gemini client (predictor.gemini). GEMINI_BASE_URL points the client at a
+# different endpoint (e.g. predictor.fake_gemini in tests / load tests).
+# The token bucket should match the project's quota; the circuit breaker
+# opens on 429 or after GEMINI_BREAKER_THRESHOLD consecutive failures.
+# Scans analysed while Gemini is limited are saved without reasoning;
+# `manage.py regenerate_reasoning` fills it in later.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "10"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+GEMINI_RATE_LIMIT_WAIT = float(os.getenv("GEMINI_RATE_LIMIT_WAIT", "2"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+# List endpoints (patients.pagination): keyset pages of LIST_PAGE_SIZE rows
+# by default; clients may ask for up to LIST_MAX_PAGE_SIZE with ?limit=.
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "200"))
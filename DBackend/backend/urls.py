@@ -17,11 +17,17 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 
+from .observability import metrics_view
+from .profiling import profile_download, profile_list
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('predictor.urls')), 
     path('api/auth/', include('accounts.urls')),
     path("api/patients/", include("patients.urls")),
+    path("metrics", metrics_view),
+    path("api/profiles/", profile_list),
+    path("api/profiles/<str:profile_id>/", profile_download),
 
 
 ]
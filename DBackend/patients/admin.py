@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Patient, MRIScan, DoctorReview, Report
+from .models import Patient, MRIScan, ScanJob, DoctorReview, Report
 
 admin.site.register(Patient)
 admin.site.register(MRIScan)
+admin.site.register(ScanJob)
 admin.site.register(DoctorReview)
 admin.site.register(Report)
@@ -0,0 +1,201 @@
+"""
+Request parsing for the bulk scan upload endpoint.
+
+A bulk request is either
+- multipart with several `files` plus a `manifest` form field, or
+- a single `archive` zip containing the images and a manifest.json /
+  manifest.csv (a `manifest` form field overrides the archived one).
+
+The manifest lists one entry per image:
+    [{"file": "scan_001.jpg", "patient_id": 12, "scan_date": "2025-01-31T10:00"}, ...]
+or, as CSV, the columns file,patient_id[,scan_date]. When every image
+belongs to the same patient a plain `patient_id` field may replace the
+manifest.
+
+Archive members are decompressed in bounded chunks into temporary files,
+so neither the member sizes declared in the zip nor the number of members
+decide how much is held in memory; BULK_UPLOAD_MAX_TOTAL_BYTES caps the
+decompressed total of one request. Images are matched to manifest entries
+by file name, so two images (or entries) sharing a base name are rejected.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+MANIFEST_NAMES = ("manifest.json", "manifest.csv")
+MANIFEST_MAX_BYTES = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class BulkUploadError(Exception):
+    pass
+
+
+class BulkItem:
+    __slots__ = ("index", "name", "file", "patient_id", "scan_date")
+
+    def __init__(self, index, name, file, patient_id, scan_date=None):
+        self.index = index
+        self.name = name
+        self.file = file
+        self.patient_id = patient_id
+        self.scan_date = scan_date
+
+
+def _parse_manifest(text, fmt):
+    if fmt == "csv":
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise BulkUploadError(f"Invalid manifest JSON: {e}")
+    if not isinstance(rows, list):
+        raise BulkUploadError("Manifest must be a list of entries")
+
+    manifest = {}
+    for row in rows:
+        if not isinstance(row, dict) or not row.get("file") or not row.get("patient_id"):
+            raise BulkUploadError("Every manifest entry needs 'file' and 'patient_id'")
+        name = os.path.basename(str(row["file"]))
+        if name in manifest:
+            raise BulkUploadError(f"Manifest lists {name} more than once")
+        manifest[name] = row
+    return manifest
+
+
+def _read_member(zf, info, limit, out):
+    """
+    Decompresses one member into `out`, at most `limit` bytes; the sizes
+    in the zip directory are not trusted. Returns the bytes written, or
+    None when the member is larger than `limit`.
+    """
+    written = 0
+    with zf.open(info) as member:
+        while chunk := member.read(min(CHUNK_SIZE, limit - written + 1)):
+            written += len(chunk)
+            if written > limit:
+                return None
+            out.write(chunk)
+    return written
+
+
+def _close_all(files):
+    for file in files:
+        file.close()
+
+
+def _read_archive(archive):
+    max_items = settings.BULK_UPLOAD_MAX_ITEMS
+    max_bytes = settings.BULK_UPLOAD_MAX_ITEM_BYTES
+    budget = settings.BULK_UPLOAD_MAX_TOTAL_BYTES
+
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BulkUploadError("archive is not a valid zip file")
+
+    files = []
+    names = set()
+    manifest_text = None
+    manifest_format = None
+    try:
+        with zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                if name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if name.lower() in MANIFEST_NAMES:
+                    out = io.BytesIO()
+                    if _read_member(zf, info, MANIFEST_MAX_BYTES, out) is None:
+                        raise BulkUploadError(f"{name} exceeds {MANIFEST_MAX_BYTES} bytes")
+                    manifest_text = out.getvalue().decode("utf-8-sig")
+                    manifest_format = name.lower().rsplit(".", 1)[1]
+                    continue
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if name in names:
+                    raise BulkUploadError(f"Archive holds more than one image named {name}")
+                if len(files) >= max_items:
+                    raise BulkUploadError(f"Archive holds more than {max_items} images")
+                names.add(name)
+
+                file = TemporaryUploadedFile(name, "application/octet-stream", 0, None)
+                files.append(file)
+                size = _read_member(zf, info, min(max_bytes, budget), file)
+                if size is None:
+                    if budget < max_bytes:
+                        raise BulkUploadError(f"Archive exceeds {settings.BULK_UPLOAD_MAX_TOTAL_BYTES} bytes in total")
+                    raise BulkUploadError(f"{name} exceeds {max_bytes} bytes")
+                budget -= size
+                file.size = size
+                file.seek(0)
+    except BulkUploadError:
+        _close_all(files)
+        raise
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, EOFError, OSError) as e:
+        _close_all(files)
+        raise BulkUploadError(f"archive could not be read: {e}")
+    return files, manifest_text, manifest_format
+
+
+def _check_files(files):
+    if sum(file.size for file in files) > settings.BULK_UPLOAD_MAX_TOTAL_BYTES:
+        raise BulkUploadError(f"Upload exceeds {settings.BULK_UPLOAD_MAX_TOTAL_BYTES} bytes in total")
+    names = set()
+    for file in files:
+        name = os.path.basename(file.name)
+        if file.size > settings.BULK_UPLOAD_MAX_ITEM_BYTES:
+            raise BulkUploadError(f"{name} exceeds {settings.BULK_UPLOAD_MAX_ITEM_BYTES} bytes")
+        if name in names:
+            raise BulkUploadError(f"More than one file named {name}")
+        names.add(name)
+
+
+def parse_bulk_request(request):
+    """
+    Returns the list of BulkItem in upload order, or raises BulkUploadError.
+    """
+    manifest_text = request.data.get("manifest")
+    manifest_format = "json"
+
+    archive = request.FILES.get("archive")
+    if archive:
+        files, archived_text, archived_format = _read_archive(archive)
+        if not manifest_text and archived_text:
+            manifest_text, manifest_format = archived_text, archived_format
+    else:
+        files = request.FILES.getlist("files")
+        if len(files) > settings.BULK_UPLOAD_MAX_ITEMS:
+            raise BulkUploadError(f"At most {settings.BULK_UPLOAD_MAX_ITEMS} files per request")
+        _check_files(files)
+
+    if not files:
+        raise BulkUploadError("No images supplied (send 'files' or an 'archive' zip)")
+
+    manifest = _parse_manifest(manifest_text, manifest_format) if manifest_text else {}
+    default_patient = request.data.get("patient_id")
+
+    items = []
+    for index, file in enumerate(files):
+        name = os.path.basename(file.name)
+        entry = manifest.get(name) or {}
+        patient_id = entry.get("patient_id") or default_patient
+        if not patient_id:
+            raise BulkUploadError(f"No manifest entry or patient_id for {name}")
+        items.append(BulkItem(
+            index=index,
+            name=name,
+            file=file,
+            patient_id=str(patient_id).strip(),
+            scan_date=entry.get("scan_date") or request.data.get("scan_date"),
+        ))
+    return items
@@ -0,0 +1,146 @@
+"""
+Derived images for stored scans.
+
+Each scan gets two renditions next to the original, stored through
+patients.storage (so local or Cloudinary, like the original):
+
+- a JPEG thumbnail no larger than SCAN_THUMBNAIL_SIZE, used by the list
+  views instead of downloading the full MRI;
+- the 128x128 RGB image the CNN sees (predictor.preprocessing), saved as
+  PNG so it can be re-run through the model without decoding the
+  original again.
+
+Uploads call schedule_derivatives() once the scan row has its image. The
+work runs in the background on a small dedicated pool, so the upload
+response does not wait for it; at most
+SCAN_DERIVATIVE_MAX_PENDING scans wait at a time, beyond that the scan is
+skipped and `manage.py backfill_derivatives` picks it up later.
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from backend.observability import count_error, span
+from predictor.preprocessing import REDUCING_GAP, model_input_image
+
+from .models import MRIScan
+from .response_cache import scan_changed
+from .storage import LocalStorage, get_storage, store_image
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FOLDER = "mri_thumbnails"
+MODEL_INPUT_FOLDER = "mri_model_inputs"
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def make_thumbnail(data, size=None, quality=None):
+    size = size or settings.SCAN_THUMBNAIL_SIZE
+    img = Image.open(BytesIO(data))
+    if img.format == "JPEG":
+        img.draft(img.mode if img.mode in ("L", "RGB") else "RGB", (size, size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    img.thumbnail((size, size), reducing_gap=REDUCING_GAP)
+
+    out = BytesIO()
+    img.save(out, "JPEG", quality=quality or settings.SCAN_THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def make_model_input(data):
+    out = BytesIO()
+    model_input_image(BytesIO(data)).save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+
+def load_original(url):
+    """Bytes of a stored original: read from disk for local URLs, else fetched."""
+    storage = get_storage()
+    if isinstance(storage, LocalStorage) and url.startswith(storage.base_url):
+        folder, _, key = url[len(storage.base_url):].partition("/")
+        path = storage.path(folder, key)
+        if path is not None and path.is_file():
+            return path.read_bytes()
+    response = requests.get(url, timeout=settings.SCAN_STORAGE_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def generate_derivatives(scan_id, data=None):
+    """
+    Makes and stores both renditions for one scan and saves their URLs.
+    `data` is the original's bytes; without it the original is loaded from
+    mri_image_url. Returns (thumbnail_url, model_input_url).
+    """
+    scan = MRIScan.objects.only("id", "patient_id", "uploaded_by_id", "mri_image_url").get(id=scan_id)
+    if data is None:
+        data = load_original(scan.mri_image_url)
+
+    thumbnail_url = store_image(BytesIO(make_thumbnail(data)), folder=THUMBNAIL_FOLDER)
+    model_input_url = store_image(BytesIO(make_model_input(data)), folder=MODEL_INPUT_FOLDER)
+
+    MRIScan.objects.filter(id=scan_id).update(thumbnail_url=thumbnail_url, model_input_url=model_input_url)
+    scan_changed(scan.patient_id, scan.uploaded_by_id)
+    return thumbnail_url, model_input_url
+
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SCAN_DERIVATIVE_WORKERS,
+                thread_name_prefix="scan-derivatives",
+            )
+            _slots = threading.BoundedSemaphore(settings.SCAN_DERIVATIVE_MAX_PENDING)
+    return _executor, _slots
+
+
+def _run(scan_id, data):
+    close_old_connections()
+    try:
+        with span("derivatives"):
+            generate_derivatives(scan_id, data)
+    except Exception:
+        logger.exception("Derivatives failed for scan %s", scan_id)
+        count_error("derivatives")
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(scan_id, file):
+    """
+    Queues derivative generation for a scan whose original is `file`.
+    Never blocks: returns None when disabled or when the queue is full,
+    else the Future.
+    """
+    if not settings.SCAN_DERIVATIVES:
+        return None
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        logger.warning("Derivative queue full; scan %s left for backfill_derivatives", scan_id)
+        return None
+
+    try:
+        file.seek(0)
+        data = file.read()
+        file.seek(0)
+        # Copied context: failures are logged with the upload's request ID.
+        future = executor.submit(contextvars.copy_context().run, _run, scan_id, data)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
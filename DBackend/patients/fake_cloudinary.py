@@ -0,0 +1,87 @@
+"""
+Minimal local stand-in for the Cloudinary upload API.
+
+Used by the load tests: set CLOUDINARY_UPLOAD_PREFIX to
+`FakeCloudinaryServer().url` (and any CLOUD_NAME / API_KEY / API_SECRET)
+and cloudinary.uploader.upload talks to it. Every upload answers with a
+`secure_url` derived from a hash of the request body, after `delay`
+seconds. Uploads are counted in `uploads`.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_UPLOAD_PATH = re.compile(r"/v1_1/([^/]+)/([^/]+)/upload")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeCloudinary/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        with fake.lock:
+            fake.uploads += 1
+            fake.bytes_received += len(body)
+            delay = fake.delay
+
+        if delay:
+            time.sleep(delay)
+
+        match = _UPLOAD_PATH.search(self.path)
+        if not match:
+            return self._send_json(404, {"error": {"message": "Unknown endpoint"}})
+
+        cloud_name, resource_type = match.groups()
+        public_id = "mri_scans/" + hashlib.sha256(body).hexdigest()[:20]
+        self._send_json(200, {
+            "public_id": public_id,
+            "resource_type": resource_type,
+            "format": "jpg",
+            "bytes": len(body),
+            "secure_url": f"{fake.url}/{cloud_name}/{resource_type}/upload/{public_id}.jpg",
+        })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeCloudinaryServer:
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0):
+        self.delay = delay
+        self.uploads = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-cloudinary", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
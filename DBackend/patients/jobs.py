@@ -0,0 +1,234 @@
+"""
+DB-backed background queue for scan analysis.
+
+upload_scan (in async mode) stores the scan as PENDING together with a
+ScanJob holding the uploaded bytes and returns 202. A worker - either the
+in-process thread started on first use (SCAN_JOBS_IN_PROCESS_WORKER) or
+`manage.py run_scan_worker` - claims queued jobs, runs CNN, Gemini and
+the image upload, and marks the scan COMPLETED. Failed attempts are
+retried with exponential backoff up to `max_attempts`; RUNNING jobs whose
+worker died are reclaimed after SCAN_JOBS_LOCK_TIMEOUT seconds. Every
+claim counts as an attempt, so a job that keeps killing its worker ends
+up FAILED too.
+
+No broker is needed: claiming is a conditional UPDATE, so several worker
+processes can share the table safely. Results are written the same way:
+a worker whose stale claim was taken over discards its attempt instead of
+overwriting the new owner's.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from backend.observability import count_error, span
+
+from .derivatives import schedule_derivatives
+from .models import MRIScan, ScanJob
+from .pipeline import run_post_prediction, stored_reasoning
+from .response_cache import scan_changed
+from .stats import tracked
+from predictor.utils import predict_image
+
+logger = logging.getLogger(__name__)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue_scan(scan, file):
+    file.seek(0)
+    job = ScanJob.objects.create(
+        scan=scan,
+        image=file.read(),
+        image_name=getattr(file, "name", "") or "",
+        max_attempts=settings.SCAN_JOBS_MAX_ATTEMPTS,
+        available_at=timezone.now(),
+    )
+    if settings.SCAN_JOBS_IN_PROCESS_WORKER:
+        ensure_worker_started()
+    return job
+
+
+def _stale(now):
+    return now - timedelta(seconds=settings.SCAN_JOBS_LOCK_TIMEOUT)
+
+
+def _due(now):
+    return (
+        Q(status="QUEUED", available_at__lte=now)
+        | Q(status="RUNNING", locked_at__lt=_stale(now), attempts__lt=F("max_attempts"))
+    )
+
+
+def due_jobs(now=None):
+    """Queued jobs that are due plus RUNNING jobs whose worker went stale."""
+    return ScanJob.objects.filter(_due(now or timezone.now())).order_by("available_at", "id")
+
+
+def fail_abandoned_jobs(now=None):
+    """
+    Marks FAILED the stale RUNNING jobs that already used their last
+    attempt: a job whose worker keeps dying (e.g. the image crashes the
+    model) must not be reclaimed forever. Returns the number failed.
+    """
+    now = now or timezone.now()
+    abandoned = (
+        ScanJob.objects
+        .filter(status="RUNNING", locked_at__lt=_stale(now), attempts__gte=F("max_attempts"))
+        .select_related("scan")
+    )
+    failed = 0
+    for job in abandoned:
+        with transaction.atomic():
+            updated = ScanJob.objects.filter(id=job.id, status="RUNNING", locked_at=job.locked_at).update(
+                status="FAILED", last_error="Worker stopped during the last attempt",
+                locked_at=None, updated_at=now,
+            )
+            if updated:
+                MRIScan.objects.filter(id=job.scan_id).update(status="FAILED")
+        if updated:
+            logger.warning("Scan job %s: worker stopped during attempt %s/%s", job.id, job.attempts, job.max_attempts)
+            count_error("scan_job")
+            scan_changed(job.scan.patient_id, job.scan.uploaded_by_id)
+            failed += 1
+    return failed
+
+
+def _claimed(job):
+    """The job row, as long as the claim this worker made is still its own."""
+    return ScanJob.objects.filter(id=job.id, status="RUNNING", locked_at=job.locked_at)
+
+
+def _lost_claim(job):
+    logger.warning("Scan job %s: claim was taken over by another worker; discarding attempt %s",
+                   job.id, job.attempts)
+
+
+def claim_next_job():
+    """
+    Atomically moves one due job to RUNNING and returns it, or None. The
+    claim counts as an attempt, so a job whose worker dies mid-run (and is
+    reclaimed once its lock goes stale) still runs out of attempts.
+    """
+    now = timezone.now()
+    fail_abandoned_jobs(now)
+    due = _due(now)
+
+    for job_id in due_jobs(now).values_list("id", flat=True)[:5]:
+        claimed = (
+            ScanJob.objects
+            .filter(due, id=job_id)
+            .update(status="RUNNING", attempts=F("attempts") + 1, locked_at=now, updated_at=now)
+        )
+        if claimed:
+            return ScanJob.objects.select_related("scan__patient").get(id=job_id)
+    return None
+
+
+def run_job(job):
+    scan = job.scan
+    patient = scan.patient
+    file = SimpleUploadedFile(job.image_name or f"scan_{scan.id}", bytes(job.image))
+
+    try:
+        with span("cnn"):
+            tumor_type, confidence = predict_image(file)
+        clinical_reasoning, mri_url = run_post_prediction(patient, file, tumor_type, confidence)
+    except Exception as e:
+        _record_failure(job, e)
+        return False
+
+    with transaction.atomic(), tracked(scan.id):
+        won = _claimed(job).update(
+            status="DONE",
+            image=None,
+            last_error=None,
+            locked_at=None,
+            updated_at=timezone.now(),
+        )
+        if won:
+            MRIScan.objects.filter(id=scan.id).update(
+                mri_image_url=mri_url,
+                tumor_type=tumor_type,
+                confidence=confidence,
+                clinical_reasoning=stored_reasoning(clinical_reasoning),
+                status="COMPLETED",
+            )
+    if not won:
+        _lost_claim(job)
+        return False
+    scan_changed(scan.patient_id, scan.uploaded_by_id)
+    schedule_derivatives(scan.id, file)
+    return True
+
+
+def _record_failure(job, error):
+    attempts = job.attempts
+    now = timezone.now()
+    logger.warning("Scan job %s: attempt %s/%s failed: %s", job.id, attempts, job.max_attempts, error)
+    count_error("scan_job")
+
+    if attempts >= job.max_attempts:
+        with transaction.atomic():
+            updated = _claimed(job).update(
+                status="FAILED", last_error=str(error),
+                locked_at=None, updated_at=now,
+            )
+            if updated:
+                MRIScan.objects.filter(id=job.scan_id).update(status="FAILED")
+        if updated:
+            scan_changed(job.scan.patient_id, job.scan.uploaded_by_id)
+    else:
+        backoff = settings.SCAN_JOBS_RETRY_BACKOFF * (2 ** (attempts - 1))
+        updated = _claimed(job).update(
+            status="QUEUED", last_error=str(error),
+            available_at=now + timedelta(seconds=backoff), locked_at=None, updated_at=now,
+        )
+    if not updated:
+        _lost_claim(job)
+
+
+def run_pending_jobs(limit=None):
+    """
+    Processes due jobs until the queue is empty (or `limit` jobs ran).
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def work_forever(poll_interval=None, stop_event=None):
+    poll_interval = poll_interval or settings.SCAN_JOBS_POLL_INTERVAL
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        try:
+            processed = run_pending_jobs()
+        except Exception:
+            logger.exception("Scan worker error")
+            processed = 0
+        if not processed:
+            time.sleep(poll_interval)
+    close_old_connections()
+
+
+def ensure_worker_started():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=work_forever, name="scan-job-worker", daemon=True)
+            _worker.start()
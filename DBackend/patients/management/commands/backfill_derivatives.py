@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from patients.derivatives import generate_derivatives
+from patients.models import MRIScan
+
+
+def _generate(scan_id):
+    close_old_connections()
+    try:
+        return generate_derivatives(scan_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the thumbnail and model-input renditions for stored scans that "
+        "do not have them yet (scans uploaded before derivatives existed, or "
+        "skipped while the derivative queue was full)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, help="Process at most this many scans.")
+        parser.add_argument("--workers", type=int, default=4, help="Scans processed at once (1 runs them in this thread).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the scans to process.")
+
+    def handle(self, *args, **options):
+        scans = (
+            MRIScan.objects.filter(thumbnail_url__isnull=True, mri_image_url__isnull=False)
+            .exclude(status="PENDING").order_by("id").values_list("id", flat=True)
+        )
+        if options["limit"]:
+            scans = scans[:options["limit"]]
+        scan_ids = list(scans)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(scan_ids)} scans need derivatives")
+            return
+
+        started = time.perf_counter()
+        self.done = self.failed = 0
+        if options["workers"] <= 1:
+            for scan_id in scan_ids:
+                self.collect(scan_id, lambda: generate_derivatives(scan_id))
+        else:
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                futures = {executor.submit(_generate, scan_id): scan_id for scan_id in scan_ids}
+                for future in as_completed(futures):
+                    self.collect(futures[future], future.result)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated derivatives for {self.done} scans ({self.failed} failed) "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
+
+    def collect(self, scan_id, result):
+        try:
+            result()
+            self.done += 1
+        except Exception as e:
+            self.failed += 1
+            self.stderr.write(f"Scan {scan_id}: {e}")
@@ -0,0 +1,218 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from patients.models import MRIScan, Patient
+from patients.seeding import REASONING_SAMPLE, clear_seeded, seed_patients, seed_users
+from predictor.benchmarking import summarize_ms
+
+PREFIX = "DBW-"
+
+# Environment overrides for each configuration; see DATABASES in settings.
+# The SQLite ones run against a fresh temporary file, the PostgreSQL ones
+# against the server described by the DB_* variables.
+CONFIGS = {
+    # What settings.py hard-coded before: rollback journal, deferred
+    # transactions, the sqlite3 module's 5 s lock wait.
+    "sqlite-legacy": {"DB_ENGINE": "sqlite", "SQLITE_WAL": "False", "SQLITE_BUSY_TIMEOUT": "5"},
+    "sqlite-wal": {"DB_ENGINE": "sqlite", "SQLITE_WAL": "True"},
+    "postgresql": {"DB_ENGINE": "postgresql", "DB_POOL": "False"},
+    "postgresql-pool": {"DB_ENGINE": "postgresql", "DB_POOL": "True"},
+}
+
+
+def insert_scan(patient_uid, user):
+    """
+    One upload's worth of writes, bracketed by close_old_connections() the
+    way Django brackets a request, so CONN_MAX_AGE and pooling apply.
+    """
+    close_old_connections()
+    try:
+        with transaction.atomic():
+            patient = Patient.objects.get(patient_uid=patient_uid)
+            MRIScan.objects.create(
+                patient=patient,
+                uploaded_by=user,
+                mri_image_url="https://res.cloudinary.com/demo/image/upload/mri_scans/bench.jpg",
+                tumor_type="glioma",
+                confidence=0.93,
+                clinical_reasoning=REASONING_SAMPLE,
+                status="COMPLETED",
+                scan_date=timezone.now(),
+            )
+    finally:
+        close_old_connections()
+
+
+def run_writers(writers, inserts, patient_uids, users):
+    """
+    Starts `writers` threads together, each inserting `inserts` scans.
+    Returns (latencies_ms, errors Counter, wall seconds).
+    """
+    barrier = threading.Barrier(writers + 1)
+    lock = threading.Lock()
+    latencies = []
+    errors = Counter()
+
+    def writer(index):
+        user = users[index % len(users)]
+        mine = []
+        try:
+            barrier.wait()
+            for i in range(inserts):
+                uid = patient_uids[(index * inserts + i) % len(patient_uids)]
+                started = time.perf_counter()
+                try:
+                    insert_scan(uid, user)
+                except DatabaseError as e:
+                    with lock:
+                        errors[str(e).splitlines()[0][:80]] += 1
+                    continue
+                mine.append((time.perf_counter() - started) * 1000.0)
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+
+    threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def describe_database():
+    db = settings.DATABASES["default"]
+    options = db.get("OPTIONS", {})
+    return {
+        "vendor": connection.vendor,
+        "conn_max_age": db.get("CONN_MAX_AGE", 0),
+        "pool": bool(options.get("pool")),
+        "sqlite_timeout": options.get("timeout") if connection.vendor == "sqlite" else None,
+        "sqlite_wal": "journal_mode=WAL" in options.get("init_command", ""),
+        "transaction_mode": options.get("transaction_mode"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark simultaneous MRIScan inserts from several writer threads: "
+        "throughput, latency and failed writes. Without --config it measures the "
+        "configured database; with --config it runs each named configuration "
+        f"({', '.join(CONFIGS)}) in a subprocess and compares them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers", type=int, action="append", dest="levels",
+            help="Concurrent writers (repeatable). Default: 1, 8, 32.",
+        )
+        parser.add_argument("--inserts", type=int, default=100, help="Scans inserted per writer.")
+        parser.add_argument("--config", choices=sorted(CONFIGS), action="append", dest="configs")
+        parser.add_argument("--migrate", action="store_true", help="Migrate the database first.")
+        parser.add_argument("--emit-json", action="store_true",
+                            help="Print only the results as JSON (used for the --config subprocesses).")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        levels = options["levels"] or [1, 8, 32]
+        if options["configs"]:
+            results = []
+            for name in options["configs"]:
+                results.extend(self.run_config(name, levels, options))
+        else:
+            results = self.run_here(levels, options)
+            if options["emit_json"]:
+                self.stdout.write(json.dumps(results))
+                return
+
+        self.report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def run_here(self, levels, options):
+        if options["migrate"]:
+            call_command("migrate", verbosity=0)
+
+        users = seed_users(4, PREFIX)
+        patient_uids = [p.patient_uid for p in seed_patients(50, PREFIX)]
+        database = describe_database()
+        connection.close()
+
+        results = []
+        try:
+            for writers in levels:
+                latencies, errors, wall = run_writers(writers, options["inserts"], patient_uids, users)
+                results.append({
+                    "database": database,
+                    "writers": writers,
+                    "inserts": writers * options["inserts"],
+                    "ok": len(latencies),
+                    "failed": sum(errors.values()),
+                    "errors": dict(errors),
+                    "throughput_rows_per_s": round(len(latencies) / wall, 1) if wall else 0.0,
+                    "latency": summarize_ms(latencies) if latencies else None,
+                })
+                if not options["emit_json"]:
+                    self.stdout.write(f"  writers={writers}: {len(latencies)} ok in {wall:.2f}s")
+        finally:
+            clear_seeded(PREFIX)
+        return results
+
+    def run_config(self, name, levels, options):
+        env = {**os.environ, **CONFIGS[name]}
+        with tempfile.TemporaryDirectory() as tmp:
+            if env["DB_ENGINE"] == "sqlite":
+                env["DB_NAME"] = os.path.join(tmp, "bench.sqlite3")
+            command = [
+                sys.executable, "manage.py", "benchmark_db_writes", "--migrate", "--emit-json",
+                "--inserts", str(options["inserts"]),
+            ]
+            for writers in levels:
+                command += ["--writers", str(writers)]
+
+            self.stdout.write(f"Running {name}...")
+            process = subprocess.run(
+                command, cwd=str(settings.BASE_DIR), env=env, capture_output=True, text=True,
+            )
+        if process.returncode != 0:
+            raise CommandError(f"{name} failed:\n{process.stderr.strip()[-2000:]}")
+        results = json.loads(process.stdout.strip().splitlines()[-1])
+        for result in results:
+            result["config"] = name
+        return results
+
+    def report(self, results):
+        header = (
+            f"{'config':<16} {'writers':>7} {'ok':>6} {'failed':>6} {'rows/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            latency = r["latency"] or {}
+            self.stdout.write(
+                f"{r.get('config', r['database']['vendor']):<16} {r['writers']:>7} {r['ok']:>6} "
+                f"{r['failed']:>6} {r['throughput_rows_per_s']:>8.1f} "
+                f"{latency.get('p50_ms', float('nan')):>8.1f} {latency.get('p95_ms', float('nan')):>8.1f} "
+                f"{latency.get('p99_ms', float('nan')):>8.1f}"
+            )
+            for message, count in r["errors"].items():
+                self.stdout.write(f"    {count} x {message}")
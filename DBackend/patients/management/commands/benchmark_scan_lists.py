@@ -0,0 +1,132 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from patients import views
+from patients.models import MRIScan
+from patients.pagination import encode_cursor
+from patients.seeding import DEFAULT_PREFIX, clear_seeded, seed_database
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper hook counting statements. Unlike
+    CaptureQueriesContext it does not stop at 9000 queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def legacy_all_scans(user):
+    """The pre-select_related all_scans loop, kept for comparison."""
+    return [{
+        "id": s.id,
+        "patient": {"full_name": s.patient.full_name, "patient_uid": s.patient.patient_uid},
+        "clinical_reasoning": s.clinical_reasoning,
+        "uploaded_by_username": s.uploaded_by.username,
+    } for s in MRIScan.objects.all().order_by("-created_at")]
+
+
+def legacy_my_scans(user):
+    return [{
+        "id": s.id,
+        "patient_uid": s.patient.patient_uid,
+        "patient_name": s.patient.full_name,
+    } for s in MRIScan.objects.filter(uploaded_by=user).order_by("-created_at")]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic patients and scans and time the scan list endpoints "
+        "(all_scans, my_scans): wall time and number of SQL queries per call, "
+        "for the first page and for a page deep in the history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scans", type=int, default=100_000)
+        parser.add_argument("--patients", type=int, default=5_000)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--repeats", type=int, default=3)
+        parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="Tag for seeded rows.")
+        parser.add_argument("--reuse", action="store_true",
+                            help="Use rows seeded by an earlier --keep run instead of seeding again.")
+        parser.add_argument("--keep", action="store_true", help="Leave the seeded rows in place.")
+        parser.add_argument("--legacy", action="store_true",
+                            help="Also time the old per-row lookups (one or two queries per scan; slow).")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if options["reuse"] and MRIScan.objects.filter(patient__patient_uid__startswith=prefix).exists():
+            self.stdout.write("Reusing seeded rows")
+        else:
+            self.stdout.write(
+                f"Seeding {options['scans']} scans, {options['patients']} patients, {options['users']} users..."
+            )
+            started = time.perf_counter()
+            seed_database(options["scans"], options["patients"], options["users"], prefix=prefix)
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        try:
+            self.run(options)
+        finally:
+            if not options["keep"]:
+                clear_seeded(prefix)
+
+    def run(self, options):
+        user = User.objects.filter(username__startswith=options["prefix"].lower()).first()
+        factory = APIRequestFactory()
+
+        def call_view(view, path, **params):
+            def run():
+                request = factory.get(path, params)
+                force_authenticate(request, user=user)
+                response = view(request)
+                response.render()
+                return len(response.data["results"])
+            return run
+
+        # Cursor pointing 90% of the way into the history.
+        total = MRIScan.objects.count()
+        deep = MRIScan.objects.order_by("-created_at", "-id").only("id", "created_at")[int(total * 0.9)]
+        deep_cursor = encode_cursor(deep.created_at, deep.id)
+
+        cases = [
+            ("all_scans", call_view(views.all_scans, "/api/patients/scans/")),
+            ("all_scans deep", call_view(views.all_scans, "/api/patients/scans/", cursor=deep_cursor)),
+            ("all_scans summary", call_view(views.all_scans, "/api/patients/scans/", fields="summary")),
+            ("all_scans filtered", call_view(views.all_scans, "/api/patients/scans/",
+                                             tumor_type="glioma", status="COMPLETED")),
+            ("my_scans", call_view(views.my_scans, "/api/patients/my-scans/")),
+            ("my_scans deep", call_view(views.my_scans, "/api/patients/my-scans/", cursor=deep_cursor)),
+        ]
+        if options["legacy"]:
+            cases += [
+                ("all_scans (legacy)", lambda: len(legacy_all_scans(user))),
+                ("my_scans (legacy)", lambda: len(legacy_my_scans(user))),
+            ]
+
+        header = f"{'endpoint':<22} {'rows':>8} {'queries':>8} {'median ms':>10} {'min ms':>10}"
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, run in cases:
+            timings = []
+            for _ in range(options["repeats"]):
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    rows = run()
+                    timings.append((time.perf_counter() - started) * 1000.0)
+            self.stdout.write(
+                f"{name:<22} {rows:>8} {queries.count:>8} "
+                f"{statistics.median(timings):>10.1f} {min(timings):>10.1f}"
+            )
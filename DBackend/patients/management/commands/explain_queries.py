@@ -0,0 +1,155 @@
+import re
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from patients import views
+from patients.jobs import due_jobs
+from patients.models import MRIScan
+from patients.pagination import encode_cursor
+from patients.seeding import DEFAULT_PREFIX, clear_seeded, seed_database, seed_users
+
+EXPLAIN_PREFIX = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+# Plan lines that mean "read the whole table".
+FULL_SCAN = {
+    "sqlite": re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+# Plan lines that mean "sort rows in memory/temp storage" instead of
+# reading them in index order.
+SORT = {
+    "sqlite": re.compile(r"USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)"),
+    "postgresql": re.compile(r"^\s*(?:->\s*)?Sort\b"),
+}
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(EXPLAIN_PREFIX[connection.vendor] + sql)
+        rows = cursor.fetchall()
+    if connection.vendor == "sqlite":
+        return [row[3] for row in rows]
+    return [row[0] for row in rows]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the SQL issued by the patients list/detail views and the "
+        "scan job queue, and flag full table scans and sorts that an index should "
+        "have avoided."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=0, metavar="SCANS",
+            help="Seed this many synthetic scans first (removed afterwards) and ANALYZE.",
+        )
+        parser.add_argument("--fail-on-full-scan", action="store_true",
+                            help="Exit with an error if any query does a full table scan.")
+        parser.add_argument("--plans", action="store_true", help="Print every query plan.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN_PREFIX:
+            raise CommandError(f"EXPLAIN parsing is not implemented for {connection.vendor}")
+
+        if options["seed"]:
+            self.stdout.write(f"Seeding {options['seed']} scans...")
+            seed_database(options["seed"], max(10, options["seed"] // 20), 5)
+            seed_users(1, prefix=DEFAULT_PREFIX + "doc-", role="DOCTOR")
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        try:
+            full_scans = self.run(options)
+        finally:
+            if options["seed"]:
+                clear_seeded()
+
+        if full_scans and options["fail_on_full_scan"]:
+            raise CommandError(f"{full_scans} query(s) do a full table scan")
+
+    def cases(self):
+        scan = MRIScan.objects.select_related("patient", "uploaded_by").order_by("-created_at", "-id").first()
+        if scan is None:
+            raise CommandError("Needs at least one scan in the database; run with --seed N")
+        user = scan.uploaded_by
+        patient = scan.patient
+        doctor = User.objects.filter(profile__role="DOCTOR").first()
+        cursor = encode_cursor(scan.created_at, scan.id)
+        patient_cursor = encode_cursor(patient.created_at, patient.id)
+        factory = APIRequestFactory()
+
+        def view(fn, path, as_user=user, **params):
+            def run():
+                request = factory.get(path, params.pop("query", {}))
+                force_authenticate(request, user=as_user)
+                fn(request, **params).render()
+            return run
+
+        cases = [
+            ("all_scans", view(views.all_scans, "/")),
+            ("all_scans next page", view(views.all_scans, "/", query={"cursor": cursor})),
+            ("all_scans by type+status", view(views.all_scans, "/", query={"tumor_type": "glioma", "status": "COMPLETED"})),
+            ("all_scans by uploader", view(views.all_scans, "/", query={"uploader": user.id})),
+            ("all_scans summary", view(views.all_scans, "/", query={"fields": "summary"})),
+            ("my_scans", view(views.my_scans, "/")),
+            ("my_scans next page", view(views.my_scans, "/", query={"cursor": cursor})),
+            ("my_patients", view(views.my_patients, "/")),
+            ("my_patients next page", view(views.my_patients, "/", query={"cursor": patient_cursor})),
+            ("patient_detail", view(views.patient_detail, "/", patient_id=patient.id)),
+            ("get_patient_by_uid", view(views.get_patient_by_uid, "/", uid=patient.patient_uid)),
+            ("scan_status", view(views.scan_status, "/", scan_id=scan.id)),
+            ("claim_next_job", lambda: list(due_jobs().values_list("id", flat=True)[:5])),
+        ]
+        if doctor is not None:
+            cases.append(("doctor_registry", view(views.doctor_registry, "/", as_user=doctor)))
+        else:
+            self.stdout.write("No DOCTOR user; skipping doctor_registry")
+        return cases
+
+    def run(self, options):
+        vendor = connection.vendor
+        full_scans = 0
+        for name, run in self.cases():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                run()
+                elapsed = (time.perf_counter() - started) * 1000.0
+
+            findings = []
+            plans = []
+            for query in captured.captured_queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = explain(sql)
+                plans.append((sql, plan))
+                for line in plan:
+                    match = FULL_SCAN[vendor].search(line)
+                    if match:
+                        findings.append(("FULL SCAN", match.group(1)))
+                    elif SORT[vendor].search(line):
+                        findings.append(("SORT", line.strip()))
+
+            scans = sum(1 for kind, _ in findings if kind == "FULL SCAN")
+            full_scans += scans
+            status = self.style.ERROR("FULL SCAN") if scans else (
+                self.style.WARNING("sort") if findings else self.style.SUCCESS("ok")
+            )
+            self.stdout.write(f"{name:<28} {len(plans):>2} queries {elapsed:>8.1f} ms  {status}")
+            for kind, detail in findings:
+                self.stdout.write(f"    {kind}: {detail}")
+            if options["plans"]:
+                for sql, plan in plans:
+                    self.stdout.write(f"    SQL: {sql}")
+                    for line in plan:
+                        self.stdout.write(f"      {line}")
+        return full_scans
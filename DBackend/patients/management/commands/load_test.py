@@ -0,0 +1,301 @@
+import itertools
+import json
+import os
+import random
+import secrets
+import subprocess
+import tempfile
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.fake_cloudinary import FakeCloudinaryServer
+from patients.seeding import clear_seeded, seed_database, seed_users
+from predictor.benchmarking import process_tree_rss_mb, summarize_ms
+from predictor.fake_gemini import FakeGeminiServer
+from predictor.management.commands.compare_wsgi_asgi import (
+    SERVERS, fake_services_env, free_port, sample_images, stop_server, wait_ready,
+)
+
+PREFIX = "LOAD-"
+
+# What one request of each kind looks like; {patient_id} / {patient_uid}
+# are filled from a random seeded patient.
+OPERATIONS = {
+    "upload": ("POST", "/api/patients/upload-scan/"),
+    "my_scans": ("GET", "/api/patients/my-scans/"),
+    "all_scans": ("GET", "/api/patients/scans/"),
+    "my_patients": ("GET", "/api/patients/my-patients/"),
+    "patient_detail": ("GET", "/api/patients/patient/{patient_id}/"),
+    "by_uid": ("GET", "/api/patients/by-uid/{patient_uid}/"),
+    "stats": ("GET", "/api/patients/stats/"),
+}
+
+# A technician's shift: mostly list and detail reads, an upload every
+# few requests.
+DEFAULT_MIX = "upload=2,my_scans=4,all_scans=1,my_patients=2,patient_detail=2,by_uid=1"
+
+
+def parse_mix(text):
+    """"upload=2,my_scans=4" -> {"upload": 2.0, "my_scans": 4.0}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise CommandError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Bad weight in {part!r}") from None
+        if mix[name] < 0:
+            raise CommandError(f"Bad weight in {part!r}")
+    if not any(mix.values()):
+        raise CommandError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+class LoadStats:
+    """Per-endpoint latencies and status counts, shared by the client threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._statuses = {}
+
+    def record(self, endpoint, status, elapsed_ms):
+        with self._lock:
+            statuses = self._statuses.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+            if isinstance(status, int) and 200 <= status < 400:
+                self._latencies.setdefault(endpoint, []).append(elapsed_ms)
+
+    def summary(self, wall):
+        with self._lock:
+            endpoints = {}
+            for endpoint, statuses in sorted(self._statuses.items()):
+                latencies = self._latencies.get(endpoint, [])
+                total = sum(statuses.values())
+                endpoints[endpoint] = {
+                    "requests": total,
+                    "ok": len(latencies),
+                    "error_rate": round((total - len(latencies)) / total, 4),
+                    "statuses": {str(k): v for k, v in statuses.items()},
+                    # Logins happen before the timed phase.
+                    "throughput_rps": round(len(latencies) / wall, 2) if wall and endpoint != "login" else None,
+                    "latency": summarize_ms(latencies) if latencies else None,
+                }
+            return endpoints
+
+
+def login(session, base, username, password, stats, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(
+            base + "/api/auth/login/", json={"username": username, "password": password}, timeout=timeout,
+        )
+        status = response.status_code
+    except requests.RequestException:
+        status = "error"
+    stats.record("login", status, (time.perf_counter() - started) * 1000.0)
+    if status != 200:
+        raise CommandError(f"Login failed for {username}: {status}")
+    session.headers["Authorization"] = f"Bearer {response.json()['access']}"
+
+
+def run_clients(base, users, password, patients, images, mix, clients, total, options):
+    """
+    `clients` threads, each logged in as one of `users`, send `total`
+    requests between them, picking operations by weight from `mix`.
+    Returns (LoadStats, wall seconds of the request phase).
+    """
+    stats = LoadStats()
+    counter = itertools.count()
+    names, weights = zip(*mix.items())
+    sessions = [requests.Session() for _ in range(clients)]
+    for i, session in enumerate(sessions):
+        login(session, base, users[i % len(users)].username, password, stats, options["timeout"])
+
+    def client(index):
+        session = sessions[index]
+        rng = random.Random(index)
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            name = rng.choices(names, weights)[0]
+            method, path = OPERATIONS[name]
+            patient = rng.choice(patients)
+            kwargs = {"timeout": options["timeout"]}
+            if name == "upload":
+                filename, data = images[i % len(images)]
+                kwargs["files"] = {"file": (filename, data, "image/jpeg")}
+                kwargs["data"] = {"patient_id": str(patient.id)}
+
+            started = time.perf_counter()
+            try:
+                status = session.request(
+                    method, base + path.format(patient_id=patient.id, patient_uid=patient.patient_uid), **kwargs,
+                ).status_code
+            except requests.RequestException:
+                status = "error"
+            stats.record(name, status, (time.perf_counter() - started) * 1000.0)
+            if options["think_ms"]:
+                time.sleep(rng.uniform(0, 2 * options["think_ms"]) / 1000.0)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    for session in sessions:
+        session.close()
+    return stats, wall
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end load test of the upload and listing APIs: seeds technicians, "
+        "patients and scans, logs in through the JWT endpoint and replays a weighted "
+        "mix of uploads and list/detail reads at several client counts against a "
+        "local gunicorn (or uvicorn) server whose Gemini and Cloudinary are local "
+        "fakes. Reports throughput, latency percentiles and error rates per endpoint. "
+        f"Seeded rows are tagged {PREFIX!r} and removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients", type=int, action="append", dest="levels",
+            help="Concurrent clients (repeatable). Default: 4, 16, 32.",
+        )
+        parser.add_argument("--requests", type=int, default=300, help="Requests per client count.")
+        parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help=f"Weighted operations, from: {', '.join(OPERATIONS)}. Default: {DEFAULT_MIX}.")
+        parser.add_argument("--think-ms", type=float, default=0.0,
+                            help="Mean pause between a client's requests.")
+        parser.add_argument("--users", type=int, default=8, help="Technician accounts to seed.")
+        parser.add_argument("--patients", type=int, default=200)
+        parser.add_argument("--scans", type=int, default=2000, help="Existing scans to seed.")
+        parser.add_argument("--server", choices=sorted(SERVERS), default="wsgi")
+        parser.add_argument("--wsgi-threads", type=int, default=8, help="gunicorn threads per worker.")
+        parser.add_argument("--storage", choices=("cloudinary", "local"), default="cloudinary",
+                            help="Fake Cloudinary, or local storage in a temporary directory.")
+        parser.add_argument("--gemini-delay", type=float, default=0.5,
+                            help="Seconds the fake Gemini waits before answering.")
+        parser.add_argument("--upload-delay", type=float, default=0.1,
+                            help="Seconds the fake Cloudinary waits before answering.")
+        parser.add_argument("--image-size", type=int, default=256)
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout.")
+        parser.add_argument("--startup-timeout", type=float, default=180.0)
+        parser.add_argument("--migrate", action="store_true", help="Migrate the database first.")
+        parser.add_argument("--keep", action="store_true", help="Leave the seeded rows in the database.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        levels = options["levels"] or [4, 16, 32]
+        mix = parse_mix(options["mix"])
+        images = sample_images(32, options["image_size"])
+        password = secrets.token_urlsafe(16)
+        if options["migrate"]:
+            call_command("migrate", verbosity=0)
+
+        self.stdout.write("Seeding users, patients and scans...")
+        patients, _ = seed_database(options["scans"], options["patients"], options["users"], prefix=PREFIX)
+        users = seed_users(options["users"], PREFIX, password=password, role="TECHNICIAN")
+
+        gemini = FakeGeminiServer().start()
+        gemini.delay = options["gemini_delay"]
+        cloudinary = FakeCloudinaryServer().start()
+        cloudinary.delay = options["upload_delay"]
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                results = self.run_server(users, password, patients, images, mix, levels, {
+                    **options, "gemini": gemini, "cloudinary": cloudinary, "media_root": media_root,
+                })
+        finally:
+            gemini.stop()
+            cloudinary.stop()
+            if not options["keep"]:
+                clear_seeded(PREFIX)
+
+        self.report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def run_server(self, users, password, patients, images, mix, levels, options):
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            **fake_services_env(options["gemini"], options["cloudinary"]),
+            # Every upload must reach the model and the (fake) Gemini.
+            "PREDICTOR_CACHE": "False",
+            "REASONING_CACHE_TTL": "0",
+            "PREDICTOR_WARMUP_ON_STARTUP": "True",
+            "SCAN_STORAGE_BACKEND": "cloudinary",
+        }
+        if options["storage"] == "local":
+            env.update({
+                "SCAN_STORAGE_BACKEND": "local",
+                "SCAN_STORAGE_ROOT": options["media_root"],
+                "SCAN_STORAGE_BASE_URL": f"{base}/api/patients/media/",
+            })
+
+        command, _ = SERVERS[options["server"]]
+        self.stdout.write(f"Starting {options['server']} server on {base}")
+        process = subprocess.Popen(
+            command(port, options), cwd=str(settings.BASE_DIR), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(process, base, options["startup_timeout"])
+            # A short untimed pass so lazy imports and first-call costs are paid.
+            run_clients(base, users, password, patients, images, mix, 1, 5, options)
+
+            results = []
+            for clients in levels:
+                stats, wall = run_clients(
+                    base, users, password, patients, images, mix, clients, options["requests"], options,
+                )
+                endpoints = stats.summary(wall)
+                ok = sum(e["ok"] for name, e in endpoints.items() if name != "login")
+                results.append({
+                    "server": options["server"],
+                    "storage": options["storage"],
+                    "clients": clients,
+                    "requests": options["requests"],
+                    "mix": mix,
+                    "throughput_rps": round(ok / wall, 2) if wall else 0.0,
+                    "endpoints": endpoints,
+                    "server_rss_mb": process_tree_rss_mb(process.pid),
+                })
+                self.stdout.write(f"  clients={clients}: {ok}/{options['requests']} ok in {wall:.1f}s")
+            return results
+        finally:
+            stop_server(process)
+
+    def report(self, results):
+        header = (
+            f"{'clients':>7} {'endpoint':<15} {'reqs':>6} {'err %':>6} {'rps':>8} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            for name, e in r["endpoints"].items():
+                latency = e["latency"] or {}
+                line = (
+                    f"{r['clients']:>7} {name:<15} {e['requests']:>6} {e['error_rate'] * 100:>6.1f} "
+                    f"{e['throughput_rps'] or float('nan'):>8.2f} {latency.get('p50_ms', float('nan')):>9.1f} "
+                    f"{latency.get('p95_ms', float('nan')):>9.1f} {latency.get('p99_ms', float('nan')):>9.1f}"
+                )
+                self.stdout.write(self.style.WARNING(line) if e["error_rate"] else line)
+            self.stdout.write(f"{r['clients']:>7} {'total':<15} {'':>6} {'':>6} {r['throughput_rps']:>8.2f}")
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the materialized scan statistics (Patient.scan_count, "
+        "TumorTypeStats, DailyScanStats) from MRIScan. Run after bulk imports "
+        "or any write that bypassed the model signals."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        patients, tumor_types, days = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {patients} patients, {tumor_types} tumor types and "
+            f"{days} days in {time.perf_counter() - started:.2f}s"
+        ))
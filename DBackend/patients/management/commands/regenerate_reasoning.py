@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.models import MRIScan
+from patients.pipeline import stored_reasoning
+from patients.response_cache import scan_changed
+from predictor.services import generate_clinical_reasoning
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate clinical reasoning for analysed scans that were saved without "
+        "it because Gemini was rate limited, down or too slow at upload time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, help="Process at most this many scans.")
+        parser.add_argument("--delay", type=float, default=0.0,
+                            help="Seconds to wait between scans (quota pacing).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the scans to process.")
+
+    def handle(self, *args, **options):
+        scans = (
+            MRIScan.objects.filter(clinical_reasoning__isnull=True, status__in=("COMPLETED", "VERIFIED"))
+            .exclude(tumor_type="").select_related("patient").order_by("id")
+        )
+        if options["limit"]:
+            scans = scans[:options["limit"]]
+        scans = list(scans)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(scans)} scans need reasoning")
+            return
+
+        done = failed = 0
+        for scan in scans:
+            # Scans sharing (tumor type, age band, gender) are served from the reasoning cache.
+            text = stored_reasoning(generate_clinical_reasoning(
+                scan.tumor_type, scan.confidence, scan.patient.age, scan.patient.gender,
+            ))
+            if text is None:
+                failed += 1
+                self.stderr.write(f"Scan {scan.id}: reasoning still unavailable")
+            else:
+                MRIScan.objects.filter(id=scan.id, clinical_reasoning__isnull=True).update(clinical_reasoning=text)
+                scan_changed(scan.patient_id, scan.uploaded_by_id)
+                done += 1
+            if options["delay"]:
+                time.sleep(options["delay"])
+
+        self.stdout.write(self.style.SUCCESS(f"Regenerated reasoning for {done} scans ({failed} still unavailable)"))
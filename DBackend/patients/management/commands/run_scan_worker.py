@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from patients.jobs import run_pending_jobs, work_forever
+
+
+class Command(BaseCommand):
+    help = "Process queued scan analysis jobs (CNN, Gemini reasoning, Cloudinary upload)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the jobs that are currently due, then exit.")
+        parser.add_argument("--poll-interval", type=float, default=settings.SCAN_JOBS_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)"))
+            return
+
+        self.stdout.write(f"Scan worker polling every {options['poll_interval']}s (Ctrl+C to stop)")
+        try:
+            work_forever(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-16 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_mriscan_clinical_reasoning'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mriscan',
+            name='confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mriscan',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('VERIFIED', 'Verified'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='mriscan',
+            name='tumor_type',
+            field=models.CharField(blank=True, choices=[('glioma', 'Glioma'), ('meningioma', 'Meningioma'), ('pituitary', 'Pituitary'), ('notumor', 'No Tumor')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ScanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.BinaryField(blank=True, null=True)),
+                ('image_name', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('available_at', models.DateTimeField()),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='patients.mriscan')),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-17 00:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_scanjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mriscan',
+            index=models.Index(fields=['-created_at', '-id'], name='scan_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mriscan',
+            index=models.Index(fields=['uploaded_by', '-created_at', '-id'], name='scan_uploader_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mriscan',
+            index=models.Index(fields=['patient', '-scan_date', '-created_at'], name='scan_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mriscan',
+            index=models.Index(fields=['tumor_type', 'status', '-created_at', '-id'], name='scan_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at', '-id'], name='patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanjob',
+            index=models.Index(fields=['status', 'available_at'], name='scanjob_status_available_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+def populate_stats(apps, schema_editor):
+    from patients.stats import rebuild_stats
+    rebuild_stats(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyScanStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('scan_count', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('confidence_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TumorTypeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tumor_type', models.CharField(max_length=20, unique=True)),
+                ('scan_count', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('confidence_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='scan_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
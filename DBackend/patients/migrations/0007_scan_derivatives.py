@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_scan_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mriscan',
+            name='model_input_url',
+            field=models.URLField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='mriscan',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, max_length=500, null=True),
+        ),
+    ]
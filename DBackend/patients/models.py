@@ -11,6 +11,25 @@ class Patient(models.Model):
     address = models.TextField(blank=True, null=True)
     profile_photo_url = models.URLField(max_length=500, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Materialized count of this patient's scans, kept by patients.stats.
+    scan_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of my_patients / doctor_registry.
+            models.Index(fields=["-created_at", "-id"], name="patient_created_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # scan_count is only ever written with F() updates (patients.stats);
+        # saving an instance loaded before a scan was added or removed must
+        # not write its stale copy back.
+        if not self._state.adding and not kwargs.get("force_insert"):
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs["update_fields"] = [name for name in update_fields if name != "scan_count"]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.patient_uid} - {self.full_name}"
@@ -21,6 +40,7 @@ class MRIScan(models.Model):
         ("PENDING", "Pending"),
         ("COMPLETED", "Completed"),
         ("VERIFIED", "Verified"),
+        ("FAILED", "Failed"),
     )
 
     # Note: These choices are for the dropdowns, but the model can store other strings if needed
@@ -35,8 +55,12 @@ class MRIScan(models.Model):
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploaded_scans")
     
     mri_image_url = models.URLField(max_length=500, blank=True, null=True)
-    tumor_type = models.CharField(max_length=20, choices=TUMOR_CHOICES)
-    confidence = models.FloatField()
+    # Derived renditions (patients.derivatives); empty until generated.
+    thumbnail_url = models.URLField(max_length=500, blank=True, null=True)
+    model_input_url = models.URLField(max_length=500, blank=True, null=True)
+    # Empty while the scan is PENDING (queued for background analysis)
+    tumor_type = models.CharField(max_length=20, choices=TUMOR_CHOICES, blank=True)
+    confidence = models.FloatField(blank=True, null=True)
 
     # ✅ NEW FIELD: Stores Gemini's AI Explanation
     # We use TextField because the reasoning can be several paragraphs long
@@ -46,10 +70,86 @@ class MRIScan(models.Model):
     scan_date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One index per query shape in patients.views; check the plans with
+        # `manage.py explain_queries`.
+        indexes = [
+            # all_scans: keyset pages ordered by (created_at, id).
+            models.Index(fields=["-created_at", "-id"], name="scan_created_idx"),
+            # my_scans and all_scans?uploader=: same order within one uploader.
+            models.Index(fields=["uploaded_by", "-created_at", "-id"], name="scan_uploader_created_idx"),
+            # patient_detail: a patient's scans by scan_date, then created_at.
+            models.Index(fields=["patient", "-scan_date", "-created_at"], name="scan_patient_date_idx"),
+            # all_scans?tumor_type=&status= filters.
+            models.Index(fields=["tumor_type", "status", "-created_at", "-id"], name="scan_type_status_idx"),
+        ]
+
     def __str__(self):
         return f"Scan {self.id} - {self.patient.patient_uid} - {self.tumor_type}"
 
 
+class ScanJob(models.Model):
+    """
+    Background analysis job for a PENDING scan: CNN, Gemini reasoning and
+    image upload run in a worker (see patients.jobs) instead of the
+    upload request. The uploaded bytes are held here until the job is done.
+    """
+    STATUS_CHOICES = (
+        ("QUEUED", "Queued"),
+        ("RUNNING", "Running"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    )
+
+    scan = models.OneToOneField(MRIScan, on_delete=models.CASCADE, related_name="job")
+    image = models.BinaryField(blank=True, null=True)
+    image_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="QUEUED")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True, null=True)
+    available_at = models.DateTimeField()
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # claim_next_job: due jobs by status, oldest available_at first.
+            models.Index(fields=["status", "available_at"], name="scanjob_status_available_idx"),
+        ]
+
+    def __str__(self):
+        return f"ScanJob {self.id} - Scan {self.scan_id} - {self.status}"
+
+
+class TumorTypeStats(models.Model):
+    """
+    Running totals per tumor type, kept current by patients.stats. Scans
+    still PENDING are counted under tumor_type "".
+    """
+    tumor_type = models.CharField(max_length=20, unique=True)
+    scan_count = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    confidence_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.tumor_type or 'pending'}: {self.scan_count}"
+
+
+class DailyScanStats(models.Model):
+    """Running totals per scan_date day (UTC), kept current by patients.stats."""
+    day = models.DateField(unique=True)
+    scan_count = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    confidence_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.day}: {self.scan_count}"
+
+
 class DoctorReview(models.Model):
     scan = models.ForeignKey(MRIScan, on_delete=models.CASCADE, related_name="doctor_reviews")
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="doctor_reviews")
@@ -0,0 +1,152 @@
+"""
+Keyset pagination and filters for the list endpoints.
+
+Pages are ordered newest first on (created_at, id) and the cursor is the
+(created_at, id) of the last row served, so fetching page N costs the
+same as page 1 - there is no OFFSET to skip over. `id` breaks ties
+between rows created in the same instant.
+
+Query parameters:
+
+- limit:      rows per page (LIST_PAGE_SIZE by default, LIST_MAX_PAGE_SIZE max)
+- cursor:     `next_cursor` from the previous page
+- fields:     "summary" leaves out clinical_reasoning (scan lists)
+- tumor_type, status:  exact match, comma-separated for several values
+- date_from, date_to:  scan_date range, YYYY-MM-DD or ISO datetime
+                       (a bare date_to includes that whole day)
+- uploader:   user id or username
+- search:     substring of the patient's name or UID (case-insensitive)
+"""
+import base64
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class ListQueryError(ValueError):
+    """Bad query parameter; the view answers 400 with the message."""
+
+
+def page_size(params):
+    raw = params.get("limit")
+    if raw in (None, ""):
+        return settings.LIST_PAGE_SIZE
+    try:
+        size = int(raw)
+    except ValueError:
+        raise ListQueryError("limit must be an integer")
+    if size < 1:
+        raise ListQueryError("limit must be positive")
+    return min(size, settings.LIST_MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise ListQueryError("Invalid cursor")
+
+
+def paginate(queryset, params):
+    """
+    Returns (rows, next_cursor) for the page described by `params`.
+    next_cursor is None on the last page.
+    """
+    size = page_size(params)
+    queryset = queryset.order_by("-created_at", "-id")
+
+    cursor = params.get("cursor")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def page_response(results, next_cursor):
+    return {"results": results, "next_cursor": next_cursor}
+
+
+def wants_summary(params):
+    return params.get("fields", "").lower() == "summary"
+
+
+def _values(params, name):
+    raw = params.get(name, "")
+    return [value.strip() for value in raw.split(",") if value.strip()]
+
+
+def _is_bare_date(value):
+    try:
+        return parse_date(value) is not None
+    except ValueError:
+        return False
+
+
+def _parse_bound(value, name, end_of_day=False):
+    try:
+        if _is_bare_date(value):
+            day = parse_date(value)
+            parsed = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+        else:
+            parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ListQueryError(f"{name} must be YYYY-MM-DD or an ISO datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_scans(queryset, params, allow_uploader=True):
+    tumor_types = _values(params, "tumor_type")
+    if tumor_types:
+        queryset = queryset.filter(tumor_type__in=tumor_types)
+
+    statuses = [status.upper() for status in _values(params, "status")]
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+
+    date_from = params.get("date_from")
+    if date_from:
+        queryset = queryset.filter(scan_date__gte=_parse_bound(date_from, "date_from"))
+
+    date_to = params.get("date_to")
+    if date_to:
+        bound = _parse_bound(date_to, "date_to", end_of_day=True)
+        # A bare date means "up to the end of that day".
+        if _is_bare_date(date_to):
+            queryset = queryset.filter(scan_date__lt=bound)
+        else:
+            queryset = queryset.filter(scan_date__lte=bound)
+
+    uploader = params.get("uploader")
+    if uploader and allow_uploader:
+        if uploader.isdigit():
+            queryset = queryset.filter(uploaded_by_id=int(uploader))
+        else:
+            queryset = queryset.filter(uploaded_by__username=uploader)
+
+    search = params.get("search", "").strip()
+    if search:
+        queryset = queryset.filter(
+            Q(patient__full_name__icontains=search) | Q(patient__patient_uid__icontains=search)
+        )
+
+    return queryset
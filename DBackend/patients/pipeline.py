@@ -0,0 +1,215 @@
+"""
+Post-prediction stages of scan analysis.
+
+Once the CNN label is known, Gemini reasoning and the image upload
+(patients.storage) are independent, so they run concurrently and the
+upload costs max(Gemini, storage) instead of the sum. Each stage has its
+own timeout and both share an overall deadline:
+
+- reasoning that fails or times out falls back to a placeholder text;
+- an upload that fails or times out raises StorageStageError.
+
+Placeholder reasoning is shown to the user but never saved: scans keep
+clinical_reasoning NULL (see stored_reasoning) and
+`manage.py regenerate_reasoning` fills them in once Gemini is back.
+
+A timed-out stage cannot be interrupted; its thread finishes in the
+background and the result is discarded. Gemini calls therefore get their
+own pool (get_reasoning_executor): threads stuck on a slow Gemini must not
+hold the workers that image uploads need to meet the deadline.
+
+arun_post_prediction is the same step for async views: reasoning is
+awaited on the event loop (and really cancelled on timeout), while the
+blocking storage write still runs on the storage thread pool.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+from backend.observability import count_error, count_fallback, log_event, record_span
+
+from .storage import store_image
+from predictor.services import FALLBACK_MESSAGES, agenerate_clinical_reasoning, generate_clinical_reasoning
+
+logger = logging.getLogger(__name__)
+
+REASONING_FALLBACK = "Clinical reasoning unavailable."
+
+_executor = None
+_reasoning_executor = None
+
+
+class StorageStageError(Exception):
+    pass
+
+
+def stored_reasoning(text):
+    """
+    What to save as MRIScan.clinical_reasoning: None for a fallback (or a
+    stream cut short by one), so the scan is picked up for regeneration.
+    """
+    if not text or text == REASONING_FALLBACK or text.endswith(FALLBACK_MESSAGES):
+        return None
+    return text
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SCAN_PIPELINE_WORKERS,
+            thread_name_prefix="scan-stage",
+        )
+    return _executor
+
+
+def get_reasoning_executor():
+    global _reasoning_executor
+    if _reasoning_executor is None:
+        _reasoning_executor = ThreadPoolExecutor(
+            max_workers=settings.SCAN_REASONING_WORKERS,
+            thread_name_prefix="scan-reasoning",
+        )
+    return _reasoning_executor
+
+
+class StageTimer:
+    """
+    Collects per-stage wall-clock durations (ms) for one request. Each
+    stage is also recorded as a span (backend.observability).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, started):
+        elapsed = time.perf_counter() - started
+        self.stages[stage] = round(elapsed * 1000.0, 2)
+        record_span(stage, elapsed)
+
+    def as_dict(self):
+        return {**self.stages, "total": round((time.perf_counter() - self.started) * 1000.0, 2)}
+
+    def server_timing(self):
+        """Value for the Server-Timing response header."""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_dict().items())
+
+    def log(self, event, **fields):
+        log_event(logger, event, **fields, timings_ms=self.as_dict())
+
+
+def _timed(timer, stage, fn, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timer.record(stage, started)
+
+
+def _wait(future, stage_timeout, deadline):
+    remaining = min(stage_timeout, deadline - time.monotonic())
+    return future.result(timeout=max(0.0, remaining))
+
+
+def run_post_prediction(patient, file, tumor_type, confidence, timer=None):
+    """
+    Runs Gemini reasoning and the image upload concurrently.
+    Returns (clinical_reasoning, mri_image_url).
+    """
+    timer = timer or StageTimer()
+    deadline = time.monotonic() + settings.SCAN_POST_PREDICTION_DEADLINE
+
+    file.seek(0)
+    # Each stage runs in a copy of the request's context so its spans and
+    # log lines carry the request ID.
+    reasoning_future = get_reasoning_executor().submit(
+        contextvars.copy_context().run, _timed, timer, "reasoning", generate_clinical_reasoning,
+        tumor_type=tumor_type, confidence=confidence, age=patient.age, gender=patient.gender,
+    )
+    storage_future = get_executor().submit(
+        contextvars.copy_context().run, _timed, timer, "storage", store_image, file, folder="mri_scans",
+    )
+
+    try:
+        clinical_reasoning = _wait(reasoning_future, settings.SCAN_REASONING_TIMEOUT, deadline)
+    except TimeoutError:
+        logger.warning("Gemini reasoning timed out for patient %s", patient.patient_uid)
+        count_fallback("reasoning_timeout")
+        clinical_reasoning = REASONING_FALLBACK
+    except Exception as e:
+        logger.warning("Gemini reasoning failed: %s", e)
+        count_fallback("reasoning_error")
+        clinical_reasoning = REASONING_FALLBACK
+
+    try:
+        mri_url = _wait(storage_future, settings.SCAN_STORAGE_TIMEOUT, deadline)
+    except TimeoutError:
+        count_error("storage")
+        raise StorageStageError("Image upload timed out")
+    except Exception as e:
+        count_error("storage")
+        raise StorageStageError(f"Image upload failed: {e}") from e
+
+    return clinical_reasoning, mri_url
+
+
+async def _atimed(timer, stage, awaitable):
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timer.record(stage, started)
+
+
+def _remaining(stage_timeout, deadline):
+    return max(0.0, min(stage_timeout, deadline - time.monotonic()))
+
+
+async def arun_post_prediction(patient, file, tumor_type, confidence, timer=None):
+    """
+    Async version of run_post_prediction with the same timeouts and
+    fallbacks. Returns (clinical_reasoning, mri_image_url).
+    """
+    timer = timer or StageTimer()
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + settings.SCAN_POST_PREDICTION_DEADLINE
+
+    file.seek(0)
+    reasoning_task = asyncio.ensure_future(_atimed(
+        timer, "reasoning",
+        agenerate_clinical_reasoning(tumor_type, confidence, patient.age, patient.gender),
+    ))
+    storage_task = asyncio.ensure_future(_atimed(
+        timer, "storage",
+        loop.run_in_executor(get_executor(), functools.partial(
+            contextvars.copy_context().run, store_image, file, folder="mri_scans",
+        )),
+    ))
+
+    try:
+        clinical_reasoning = await asyncio.wait_for(reasoning_task, _remaining(settings.SCAN_REASONING_TIMEOUT, deadline))
+    except asyncio.TimeoutError:
+        logger.warning("Gemini reasoning timed out for patient %s", patient.patient_uid)
+        count_fallback("reasoning_timeout")
+        clinical_reasoning = REASONING_FALLBACK
+    except Exception as e:
+        logger.warning("Gemini reasoning failed: %s", e)
+        count_fallback("reasoning_error")
+        clinical_reasoning = REASONING_FALLBACK
+
+    try:
+        mri_url = await asyncio.wait_for(storage_task, _remaining(settings.SCAN_STORAGE_TIMEOUT, deadline))
+    except asyncio.TimeoutError:
+        count_error("storage")
+        raise StorageStageError("Image upload timed out")
+    except Exception as e:
+        count_error("storage")
+        raise StorageStageError(f"Image upload failed: {e}") from e
+
+    return clinical_reasoning, mri_url
@@ -0,0 +1,190 @@
+"""
+Response cache for the patient/scan read endpoints.
+
+Payloads are cached in the "responses" cache under a key made of the
+endpoint, the query string, the user (for per-user payloads) and the
+current version of every scope the payload depends on:
+
+- "patients"             my_patients pages
+- "patient:<id>"         patient_detail (patient fields and its scans)
+- "patient-uid:<uid>"    get_patient_by_uid
+- "user-scans:<user>"    my_scans of one uploader
+- "all"                  everything; bumped after bulk writes
+
+A write bumps the versions it affects (patients.signals), so later
+lookups miss and stale entries simply expire. Writes that bypass model
+signals (queryset.update, bulk_create) must call scan_changed() or
+invalidate_all() themselves.
+
+Every cached response carries an ETag; a matching If-None-Match gets a
+304 without the body. Cache-Control is "private, no-cache", so browsers
+revalidate on every load instead of reusing a possibly stale copy.
+"""
+import functools
+import hashlib
+import json
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.response import Response
+
+from backend.observability import count_cache
+
+
+class ResponseCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._invalidations = 0
+
+    def record(self, endpoint, outcome):
+        count_cache("responses", {"hits": "hit", "misses": "miss"}.get(outcome, outcome))
+        with self._lock:
+            counts = self._endpoints.setdefault(endpoint, {"hits": 0, "misses": 0, "not_modified": 0})
+            counts[outcome] += 1
+
+    def invalidated(self, count):
+        with self._lock:
+            self._invalidations += count
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {}
+            for name, counts in self._endpoints.items():
+                lookups = counts["hits"] + counts["misses"]
+                endpoints[name] = {
+                    **counts,
+                    "hit_rate": round(counts["hits"] / lookups, 4) if lookups else None,
+                }
+            return {
+                "enabled": settings.RESPONSE_CACHE,
+                "endpoints": endpoints,
+                "invalidations": self._invalidations,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._invalidations = 0
+
+
+_stats = ResponseCacheStats()
+
+
+def response_cache_stats():
+    return _stats.snapshot()
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f"resp-version:{scope}"
+
+
+def _versions(scopes):
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            # Never seen (or evicted): start from a fresh value so entries
+            # stored under an older version of this scope can't match.
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        versions.append(str(found[key]))
+    return versions
+
+
+def bump(*scopes):
+    if not scopes:
+        return
+    now = time.time_ns()
+    _cache().set_many({_version_key(scope): now for scope in scopes}, timeout=None)
+    _stats.invalidated(len(scopes))
+
+
+def invalidate_all():
+    bump("all")
+
+
+def patient_changed(patient, created=False):
+    bump("patients")
+    if not created:
+        bump(f"patient:{patient.id}", f"patient-uid:{patient.patient_uid}")
+        # my_scans rows carry the patient's name and UID.
+        uploaders = patient.scans.order_by().values_list("uploaded_by_id", flat=True).distinct()
+        bump(*[f"user-scans:{user_id}" for user_id in uploaders])
+
+
+def scan_changed(patient_id, uploaded_by_id):
+    bump(f"patient:{patient_id}", f"user-scans:{uploaded_by_id}")
+
+
+def make_etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return f'W/"{hashlib.sha1(payload).hexdigest()}"'
+
+
+def _etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH", "")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    bare = etag.removeprefix("W/")
+    return "*" in candidates or any(tag.removeprefix("W/") == bare for tag in candidates)
+
+
+def _entry_key(endpoint, request, versions, per_user):
+    query = urlencode(sorted(
+        (name, value) for name, values in request.query_params.lists() for value in values
+    ))
+    digest = hashlib.md5(f"{request.path}?{query}".encode()).hexdigest()
+    user = request.user.id if per_user else "-"
+    return f"resp:{endpoint}:{user}:{digest}:{'.'.join(versions)}"
+
+
+def _finish(endpoint, request, response, etag):
+    if _etag_matches(request, etag):
+        _stats.record(endpoint, "not_modified")
+        response = Response(status=304)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    response["Vary"] = "Authorization"
+    return response
+
+
+def cached_response(endpoint, scopes, per_user=False):
+    """
+    Caches a DRF view's 200 responses. `scopes(request, **kwargs)` returns
+    the scopes (see module docstring) the payload depends on. Goes under
+    @api_view / @permission_classes so only authorized requests reach it.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.RESPONSE_CACHE:
+                return view(request, *args, **kwargs)
+
+            versions = _versions(["all", *scopes(request, **kwargs)])
+            key = _entry_key(endpoint, request, versions, per_user)
+            entry = _cache().get(key)
+            if entry is not None:
+                _stats.record(endpoint, "hits")
+                return _finish(endpoint, request, Response(entry["data"]), entry["etag"])
+
+            _stats.record(endpoint, "misses")
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            etag = make_etag(response.data)
+            _cache().set(key, {"data": response.data, "etag": etag}, timeout=settings.RESPONSE_CACHE_TTL)
+            return _finish(endpoint, request, response, etag)
+        return wrapper
+    return decorator
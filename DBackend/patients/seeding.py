@@ -0,0 +1,119 @@
+"""
+Synthetic patients, users and scans for benchmarks and load tests.
+
+Everything created here is tagged with `prefix` (patient UIDs and
+usernames start with it), so clear_seeded() removes exactly the seeded
+rows and leaves real data alone.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MRIScan, Patient
+from .response_cache import invalidate_all
+from .stats import paused, rebuild_stats
+
+DEFAULT_PREFIX = "SEED-"
+
+REASONING_SAMPLE = (
+    "* Chemotherapy: Temozolomide - Systemic alkylating agent.\n"
+    "* Steroids: Dexamethasone - Reduces cerebral edema.\n"
+    "* Anticonvulsants: Levetiracetam - Seizure prophylaxis.\n"
+    "* Surgery: Craniotomy - Tumor resection.\n"
+)
+
+
+def seed_users(count, prefix=DEFAULT_PREFIX, password=None, role=None):
+    """
+    Creates (or reuses) `count` users named f"{prefix}user{i}". With
+    `password` the accounts can log in; `role` sets Profile.role.
+    """
+    users = []
+    for i in range(count):
+        user, created = User.objects.get_or_create(username=f"{prefix.lower()}user{i}")
+        if created or password:
+            if password:
+                user.set_password(password)
+            else:
+                user.set_unusable_password()
+            user.save()
+        if role and hasattr(user, "profile") and user.profile.role != role:
+            user.profile.role = role
+            user.profile.save(update_fields=["role"])
+        users.append(user)
+    return users
+
+
+def seed_patients(count, prefix=DEFAULT_PREFIX, batch_size=2000, rng=None):
+    rng = rng or random.Random(0)
+    start = Patient.objects.filter(patient_uid__startswith=prefix).count()
+    patients = [
+        Patient(
+            patient_uid=f"{prefix}{start + i:07d}",
+            full_name=f"Seed Patient {start + i}",
+            age=rng.randint(1, 95),
+            gender=rng.choice(("Male", "Female")),
+        )
+        for i in range(count)
+    ]
+    Patient.objects.bulk_create(patients, batch_size=batch_size)
+    invalidate_all()
+    return list(Patient.objects.filter(patient_uid__startswith=prefix).order_by("id"))
+
+
+def seed_scans(count, patients, users, batch_size=2000, days=365, rng=None):
+    """
+    Bulk-inserts `count` scans spread over the last `days` days across the
+    given patients and uploaders. Returns the number of rows created.
+    """
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    tumor_types = [choice for choice, _ in MRIScan.TUMOR_CHOICES]
+    statuses = ("COMPLETED", "COMPLETED", "COMPLETED", "VERIFIED", "PENDING")
+
+    created = 0
+    while created < count:
+        batch = []
+        for _ in range(min(batch_size, count - created)):
+            scanned = now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+            status = rng.choice(statuses)
+            batch.append(MRIScan(
+                patient=rng.choice(patients),
+                uploaded_by=rng.choice(users),
+                mri_image_url="https://res.cloudinary.com/demo/image/upload/mri_scans/seed.jpg",
+                tumor_type="" if status == "PENDING" else rng.choice(tumor_types),
+                confidence=None if status == "PENDING" else round(rng.uniform(0.5, 1.0), 4),
+                clinical_reasoning=None if status == "PENDING" else REASONING_SAMPLE,
+                status=status,
+                scan_date=scanned,
+            ))
+        with transaction.atomic():
+            rows = MRIScan.objects.bulk_create(batch, batch_size=batch_size)
+            # created_at is auto_now_add; spread it like real uploads instead.
+            MRIScan.objects.filter(id__in=[row.id for row in rows]).update(created_at=F("scan_date"))
+        created += len(batch)
+    invalidate_all()
+    return created
+
+
+def seed_database(scans, patients, users, prefix=DEFAULT_PREFIX, batch_size=2000, seed=0):
+    rng = random.Random(seed)
+    user_objs = seed_users(users, prefix)
+    patient_objs = seed_patients(patients, prefix, batch_size, rng)
+    seed_scans(scans, patient_objs, user_objs, batch_size, rng=rng)
+    # bulk_create skips the signals that keep the statistics current.
+    rebuild_stats()
+    return patient_objs, user_objs
+
+
+def clear_seeded(prefix=DEFAULT_PREFIX):
+    """Deletes seeded rows (scans cascade from patients and users)."""
+    with paused():
+        MRIScan.objects.filter(patient__patient_uid__startswith=prefix).delete()
+        Patient.objects.filter(patient_uid__startswith=prefix).delete()
+        User.objects.filter(username__startswith=prefix.lower()).delete()
+    rebuild_stats()
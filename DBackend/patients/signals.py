@@ -0,0 +1,53 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import DoctorReview, MRIScan, Patient
+from . import response_cache, stats
+
+@receiver(pre_save, sender=MRIScan)
+def remember_scan_totals(sender, instance, raw, **kwargs):
+    # What the stored row contributed, so post_save can apply the difference.
+    if raw or stats.is_paused() or instance._state.adding:
+        return
+    instance._stats_before = stats.load_contributions([instance.pk]).get(instance.pk)
+
+@receiver(post_save, sender=MRIScan)
+def update_scan_totals(sender, instance, created, raw, **kwargs):
+    if raw or stats.is_paused():
+        return
+    after = stats.instance_contribution(instance)
+    if created:
+        stats.apply(after, +1)
+    else:
+        stats.apply_change(getattr(instance, "_stats_before", None), after)
+    instance._stats_before = after
+
+@receiver(post_delete, sender=MRIScan)
+def remove_scan_totals(sender, instance, **kwargs):
+    if stats.is_paused():
+        return
+    stats.apply(stats.instance_contribution(instance), -1)
+
+# =========================================================
+# RESPONSE CACHE INVALIDATION
+# =========================================================
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    response_cache.patient_changed(instance, created)
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    # Its scans were deleted first and invalidated their own scopes.
+    response_cache.bump("patients", f"patient:{instance.id}", f"patient-uid:{instance.patient_uid}")
+
+@receiver(post_save, sender=MRIScan)
+@receiver(post_delete, sender=MRIScan)
+def scan_written(sender, instance, **kwargs):
+    response_cache.scan_changed(instance.patient_id, instance.uploaded_by_id)
+
+@receiver(post_save, sender=DoctorReview)
+@receiver(post_delete, sender=DoctorReview)
+def review_written(sender, instance, **kwargs):
+    scan = MRIScan.objects.filter(id=instance.scan_id).values("patient_id", "uploaded_by_id").first()
+    if scan:
+        response_cache.scan_changed(scan["patient_id"], scan["uploaded_by_id"])
@@ -0,0 +1,30 @@
+"""
+Server-sent events helpers.
+
+Browsers' EventSource cannot POST or send an Authorization header, so the
+streaming upload is read with fetch() and a stream reader; the frames are
+still standard SSE ("event:" / "data:" lines, blank-line terminated).
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF accept `Accept: text/event-stream`. Streaming views return a
+    StreamingHttpResponse directly; this only renders early error
+    Responses, as a single "error" event.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode(self.charset)
@@ -0,0 +1,211 @@
+"""
+Materialized scan statistics.
+
+Patient.scan_count, TumorTypeStats and DailyScanStats hold running totals
+so the dashboards and doctor_registry read a handful of rows instead of
+aggregating every scan on each request. Signal handlers (patients.signals)
+apply a delta for every MRIScan create, update and delete. Writes that
+bypass signals must be wrapped:
+
+- queryset.update() of tumor_type, confidence, scan_date or patient:
+  wrap it in `tracked(scan_id)`.
+- bulk_create / bulk deletes: run them inside `paused()` and call
+  rebuild_stats() afterwards.
+
+`manage.py rebuild_stats` recomputes everything from MRIScan.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailyScanStats, MRIScan, Patient, TumorTypeStats
+
+TRACKED_FIELDS = ("patient_id", "tumor_type", "confidence", "scan_date")
+
+_state = threading.local()
+
+
+def is_paused():
+    return getattr(_state, "paused", 0) > 0
+
+
+@contextmanager
+def paused():
+    """Skips incremental updates in this thread (bulk seeding, bulk deletes)."""
+    _state.paused = getattr(_state, "paused", 0) + 1
+    try:
+        yield
+    finally:
+        _state.paused -= 1
+
+
+def scan_day(scan_date):
+    if timezone.is_naive(scan_date):
+        scan_date = timezone.make_aware(scan_date)
+    return scan_date.astimezone(dt_timezone.utc).date()
+
+
+def contribution(values):
+    """What one scan adds to the totals: (patient_id, tumor_type, day, confidence)."""
+    if values is None:
+        return None
+    return (
+        values["patient_id"],
+        values["tumor_type"] or "",
+        scan_day(values["scan_date"]),
+        values["confidence"],
+    )
+
+
+def instance_contribution(scan):
+    return contribution({field: getattr(scan, field) for field in TRACKED_FIELDS})
+
+
+def load_contributions(scan_ids):
+    rows = MRIScan.objects.filter(id__in=scan_ids).values("id", *TRACKED_FIELDS)
+    return {row["id"]: contribution(row) for row in rows}
+
+
+def _bump(model, key, sign, confidence):
+    changes = {"scan_count": F("scan_count") + sign}
+    if confidence is not None:
+        changes["confidence_sum"] = F("confidence_sum") + sign * confidence
+        changes["confidence_count"] = F("confidence_count") + sign
+    updated = model.objects.filter(**key).update(**changes)
+    if sign < 0:
+        # Drop emptied rows, as a rebuild would.
+        model.objects.filter(**key, scan_count__lte=0).delete()
+        return
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                **key,
+                scan_count=1,
+                confidence_sum=confidence or 0.0,
+                confidence_count=0 if confidence is None else 1,
+            )
+    except IntegrityError:
+        # Another writer created the row first.
+        model.objects.filter(**key).update(**changes)
+
+
+def apply(contrib, sign):
+    patient_id, tumor_type, day, confidence = contrib
+    with transaction.atomic():
+        Patient.objects.filter(id=patient_id).update(scan_count=F("scan_count") + sign)
+        _bump(TumorTypeStats, {"tumor_type": tumor_type}, sign, confidence)
+        _bump(DailyScanStats, {"day": day}, sign, confidence)
+
+
+def apply_change(before, after):
+    if before == after:
+        return
+    if before is not None:
+        apply(before, -1)
+    if after is not None:
+        apply(after, +1)
+
+
+@contextmanager
+def tracked(*scan_ids):
+    """Keeps the totals right across queryset.update() calls on these scans."""
+    before = load_contributions(scan_ids)
+    yield
+    if is_paused():
+        return
+    after = load_contributions(scan_ids)
+    for scan_id in scan_ids:
+        apply_change(before.get(scan_id), after.get(scan_id))
+
+
+def _average(total, count):
+    return round(total / count, 4) if count else None
+
+
+def rebuild_stats(apps=global_apps):
+    """
+    Recomputes every total from MRIScan. `apps` lets migrations pass their
+    historical app registry. Returns (patients, tumor types, days) written.
+    """
+    patient_model = apps.get_model("patients", "Patient")
+    scan_model = apps.get_model("patients", "MRIScan")
+    tumor_model = apps.get_model("patients", "TumorTypeStats")
+    daily_model = apps.get_model("patients", "DailyScanStats")
+
+    with transaction.atomic():
+        counts = (
+            scan_model.objects.filter(patient=OuterRef("pk")).order_by()
+            .values("patient").annotate(n=Count("id")).values("n")
+        )
+        patients = patient_model.objects.update(scan_count=Coalesce(Subquery(counts), Value(0)))
+
+        tumor_model.objects.all().delete()
+        types = (
+            scan_model.objects.order_by().values("tumor_type")
+            .annotate(n=Count("id"), conf_sum=Sum("confidence"), conf_n=Count("confidence"))
+        )
+        tumor_model.objects.bulk_create([
+            tumor_model(
+                tumor_type=row["tumor_type"] or "", scan_count=row["n"],
+                confidence_sum=row["conf_sum"] or 0.0, confidence_count=row["conf_n"],
+            )
+            for row in types
+        ])
+
+        daily_model.objects.all().delete()
+        days = (
+            scan_model.objects.annotate(day=TruncDate("scan_date", tzinfo=dt_timezone.utc))
+            .order_by().values("day")
+            .annotate(n=Count("id"), conf_sum=Sum("confidence"), conf_n=Count("confidence"))
+        )
+        daily_model.objects.bulk_create([
+            daily_model(
+                day=row["day"], scan_count=row["n"],
+                confidence_sum=row["conf_sum"] or 0.0, confidence_count=row["conf_n"],
+            )
+            for row in days
+        ], batch_size=1000)
+
+    return patients, tumor_model.objects.count(), daily_model.objects.count()
+
+
+def stats_summary(days=30):
+    """
+    Dashboard payload: per-tumor-type totals and the last `days` days of
+    volume. Reads at most len(TUMOR_CHOICES) + 1 + `days` rows.
+    """
+    tumor_types = []
+    pending = 0
+    total = 0
+    for row in TumorTypeStats.objects.order_by("tumor_type"):
+        total += row.scan_count
+        if not row.tumor_type:
+            pending = row.scan_count
+            continue
+        tumor_types.append({
+            "tumor_type": row.tumor_type,
+            "count": row.scan_count,
+            "avg_confidence": _average(row.confidence_sum, row.confidence_count),
+        })
+
+    since = timezone.now().astimezone(dt_timezone.utc).date() - timedelta(days=days - 1)
+    daily = [{
+        "day": row.day,
+        "count": row.scan_count,
+        "avg_confidence": _average(row.confidence_sum, row.confidence_count),
+    } for row in DailyScanStats.objects.filter(day__gte=since).order_by("day")]
+
+    return {
+        "total_scans": total,
+        "unclassified_scans": pending,
+        "tumor_types": tumor_types,
+        "daily": daily,
+    }
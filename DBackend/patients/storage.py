@@ -0,0 +1,184 @@
+"""
+Storage for uploaded MRI images.
+
+get_storage() returns the backend named by SCAN_STORAGE_BACKEND; both
+have save(file, folder) -> public URL:
+
+- "cloudinary" uploads through the Cloudinary SDK (the original
+  behaviour; CLOUDINARY_UPLOAD_PREFIX can point it at a local fake).
+- "local" keeps images on disk under SCAN_STORAGE_ROOT, named by the
+  SHA-256 of their bytes. The upload is streamed chunk by chunk into a
+  temporary file while it is hashed, then renamed into place, so the
+  whole image is never held in memory and re-uploading the same bytes
+  stores nothing new. serve_media (patients.views) returns the files
+  with Range support.
+
+Local URLs are unguessable content hashes, like Cloudinary's public
+delivery URLs, and are served without authentication.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+import cloudinary.uploader
+
+CHUNK_SIZE = 64 * 1024
+
+KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+FOLDER_RE = re.compile(r"^[\w-]+$")
+
+
+class StorageError(Exception):
+    pass
+
+
+def _chunks(file):
+    file.seek(0)
+    if hasattr(file, "chunks"):
+        yield from file.chunks(CHUNK_SIZE)
+    else:
+        yield from iter(lambda: file.read(CHUNK_SIZE), b"")
+
+
+def sniff_content_type(head):
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:2] == b"BM":
+        return "image/bmp"
+    return "application/octet-stream"
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def save(self, file, folder="mri_scans"):
+        file.seek(0)
+        result = cloudinary.uploader.upload(file, folder=folder, resource_type="image")
+        return result["secure_url"]
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root, base_url):
+        self.root = Path(root)
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.stored = 0
+        self.deduplicated = 0
+
+    def path(self, folder, key):
+        """Where `key` lives; None for names that are not ours (no path tricks)."""
+        if not FOLDER_RE.match(folder) or not KEY_RE.match(key):
+            return None
+        return self.root / folder / key[:2] / key
+
+    def url(self, folder, key):
+        return f"{self.base_url}{folder}/{key}"
+
+    def save(self, file, folder="mri_scans"):
+        if not FOLDER_RE.match(folder):
+            raise StorageError(f"Invalid folder name: {folder!r}")
+        tmp_dir = self.root / ".tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in _chunks(file):
+                    digest.update(chunk)
+                    out.write(chunk)
+            key = digest.hexdigest()
+            final = self.path(folder, key)
+            if final.exists():
+                self.deduplicated += 1
+            else:
+                final.parent.mkdir(parents=True, exist_ok=True)
+                # Atomic on one filesystem: readers never see half a file,
+                # and two writers of the same bytes produce the same result.
+                os.replace(tmp_path, final)
+                tmp_path = None
+                self.stored += 1
+        except OSError as e:
+            raise StorageError(f"Local storage write failed: {e}") from e
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        file.seek(0)
+        return self.url(folder, key)
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None when there is
+    no usable Range header (serve the whole file), or ValueError when the
+    range cannot be satisfied. Multi-range requests get the whole file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        backend = settings.SCAN_STORAGE_BACKEND
+        if backend == "local":
+            _storage = LocalStorage(settings.SCAN_STORAGE_ROOT, settings.SCAN_STORAGE_BASE_URL)
+        elif backend == "cloudinary":
+            _storage = CloudinaryStorage()
+        else:
+            raise StorageError(f"Unknown SCAN_STORAGE_BACKEND {backend!r}")
+    return _storage
+
+
+def reset_storage():
+    """Forget the configured backend (tests, settings overrides)."""
+    global _storage
+    _storage = None
+
+
+def store_image(file, folder="mri_scans"):
+    return get_storage().save(file, folder=folder)
@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+import predictor.utils
+from backend.observability import (
+    FALLBACKS, RequestTracingMiddleware, SPAN_DURATION, current_request_id, registry, span,
+)
+from predictor.fake_gemini import FakeGeminiServer
+from predictor.gemini import reset_gemini
+from predictor.preprocessing import preprocess_image
+from predictor.services import QUOTA_MESSAGE, UNAVAILABLE_MESSAGE
+
+from .derivatives import generate_derivatives, load_original, schedule_derivatives
+from .jobs import claim_next_job, enqueue_scan, run_job, run_pending_jobs
+from .management.commands.load_test import LoadStats, parse_mix
+from .models import DailyScanStats, DoctorReview, MRIScan, Patient, ScanJob, TumorTypeStats
+from .pipeline import (
+    REASONING_FALLBACK, StageTimer, StorageStageError, arun_post_prediction, run_post_prediction, stored_reasoning,
+)
+from .response_cache import response_cache_stats, _stats as response_stats
+from .seeding import seed_patients, seed_scans, seed_users
+from .stats import rebuild_stats, tracked
+from .storage import StorageError, get_storage, reset_storage, store_image
+
+
+class ScanListQueryCountTests(TestCase):
+    """
+    The scan list endpoints must run a fixed number of queries however
+    many scans there are (no per-row patient/uploader lookups).
+    """
+
+    def setUp(self):
+        self.users = seed_users(3)
+        self.patients = seed_patients(5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def add_scans(self, count):
+        seed_scans(count, self.patients, self.users)
+
+    def assert_constant_queries(self, url, queries, rows=lambda data: data["results"]):
+        self.add_scans(3)
+        with self.assertNumQueries(queries):
+            small = self.client.get(url)
+        self.add_scans(60)
+        with self.assertNumQueries(queries):
+            large = self.client.get(url)
+
+        self.assertEqual(small.status_code, 200)
+        self.assertGreater(len(rows(large.data)), len(rows(small.data)))
+        return large.data
+
+    def test_all_scans(self):
+        data = self.assert_constant_queries("/api/patients/scans/", 1)["results"]
+
+        scan = MRIScan.objects.select_related("patient", "uploaded_by").get(id=data[0]["id"])
+        self.assertEqual(data[0]["patient"]["patient_uid"], scan.patient.patient_uid)
+        self.assertEqual(data[0]["uploaded_by_username"], scan.uploaded_by.username)
+
+    def test_my_scans(self):
+        data = self.assert_constant_queries("/api/patients/my-scans/", 1)["results"]
+
+        self.assertTrue(all(
+            MRIScan.objects.filter(id=row["id"], uploaded_by=self.users[0]).exists() for row in data
+        ))
+
+    def test_patient_detail(self):
+        self.assert_constant_queries(
+            f"/api/patients/patient/{self.patients[0].id}/", 2, rows=lambda data: data["scans"],
+        )
+
+
+class ScanListPaginationTests(TestCase):
+
+    def setUp(self):
+        self.users = seed_users(2)
+        self.patients = seed_patients(4)
+        seed_scans(45, self.patients, self.users)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def walk(self, url, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, "limit": 10}
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row["id"] for row in response.data["results"])
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_cursor_walks_every_row_once_newest_first(self):
+        ids = self.walk("/api/patients/scans/")
+
+        expected = list(MRIScan.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        MRIScan.objects.update(created_at=MRIScan.objects.first().created_at)
+
+        ids = self.walk("/api/patients/scans/")
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 45)
+
+    def test_filters(self):
+        ids = self.walk("/api/patients/scans/", tumor_type="glioma,pituitary", status="completed",
+                        uploader=self.users[1].username)
+
+        expected = MRIScan.objects.filter(
+            tumor_type__in=["glioma", "pituitary"], status="COMPLETED", uploaded_by=self.users[1],
+        )
+        self.assertEqual(sorted(ids), sorted(expected.values_list("id", flat=True)))
+
+    def test_search_by_patient_name_or_uid(self):
+        patient = self.patients[2]
+        expected = sorted(MRIScan.objects.filter(patient=patient).values_list("id", flat=True))
+
+        self.assertEqual(sorted(self.walk("/api/patients/scans/", search=patient.patient_uid.lower())), expected)
+        self.assertEqual(sorted(self.walk("/api/patients/scans/", search=patient.full_name.upper())), expected)
+        self.assertEqual(self.walk("/api/patients/my-scans/", search="no such patient"), [])
+
+    def test_date_range_includes_whole_end_day(self):
+        scan = MRIScan.objects.order_by("scan_date").last()
+        day = scan.scan_date.date().isoformat()
+
+        ids = self.walk("/api/patients/scans/", date_from=day, date_to=day)
+        self.assertIn(scan.id, ids)
+        self.assertTrue(all(
+            s.date().isoformat() == day
+            for s in MRIScan.objects.filter(id__in=ids).values_list("scan_date", flat=True)
+        ))
+
+    def test_summary_projection_omits_reasoning(self):
+        full = self.client.get("/api/patients/my-scans/").data["results"][0]
+        with self.assertNumQueries(1):
+            summary = self.client.get("/api/patients/my-scans/", {"fields": "summary"}).data["results"][0]
+
+        self.assertIn("clinical_reasoning", full)
+        self.assertNotIn("clinical_reasoning", summary)
+
+    def test_patient_list_is_paginated(self):
+        self.assertEqual(self.walk("/api/patients/my-patients/"),
+                         list(Patient.objects.order_by("-created_at", "-id").values_list("id", flat=True)))
+
+    def test_bad_parameters_are_rejected(self):
+        self.assertEqual(self.client.get("/api/patients/scans/", {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/patients/scans/", {"limit": "x"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/patients/scans/", {"date_from": "yesterday"}).status_code, 400)
+
+
+class ExplainQueriesTests(TestCase):
+    def test_list_queries_use_indexes(self):
+        out = StringIO()
+        call_command("explain_queries", "--seed", "2000", "--fail-on-full-scan", stdout=out)
+
+        self.assertIn("all_scans by type+status", out.getvalue())
+        self.assertNotIn("FULL SCAN", out.getvalue())
+        self.assertFalse(MRIScan.objects.exists())
+
+
+class DatabaseWriteBenchmarkTests(SimpleTestCase):
+    def test_wal_config_takes_concurrent_inserts(self):
+        out = StringIO()
+        call_command("benchmark_db_writes", "--config", "sqlite-wal", "--writers", "4",
+                     "--inserts", "10", stdout=out)
+
+        row = next(line for line in out.getvalue().splitlines() if line.startswith("sqlite-wal"))
+        writers, ok, failed = row.split()[1:4]
+        self.assertEqual((writers, ok, failed), ("4", "40", "0"))
+
+
+class ScanStatsTests(TestCase):
+    """The incrementally maintained totals must match a full rebuild."""
+
+    def setUp(self):
+        self.users = seed_users(2)
+        self.patients = seed_patients(3)
+        seed_scans(30, self.patients, self.users)
+        rebuild_stats()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def snapshot(self):
+        return (
+            dict(Patient.objects.values_list("id", "scan_count")),
+            sorted(TumorTypeStats.objects.values_list("tumor_type", "scan_count", "confidence_count")),
+            sorted(DailyScanStats.objects.values_list("day", "scan_count", "confidence_count")),
+            [round(v, 6) for v in TumorTypeStats.objects.order_by("tumor_type").values_list("confidence_sum", flat=True)],
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rebuild_stats()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_signals_keep_totals_current(self):
+        scan = MRIScan.objects.create(
+            patient=self.patients[0], uploaded_by=self.users[0], tumor_type="",
+            status="PENDING", scan_date=timezone.now(),
+        )
+        self.assert_matches_rebuild()
+
+        scan.tumor_type, scan.confidence, scan.status = "glioma", 0.9, "COMPLETED"
+        scan.patient = self.patients[1]
+        scan.save()
+        self.assert_matches_rebuild()
+
+        MRIScan.objects.exclude(id=scan.id).first().delete()
+        self.patients[2].delete()
+        self.assert_matches_rebuild()
+
+    def test_saving_stale_patient_keeps_scan_count(self):
+        patient = Patient.objects.get(id=self.patients[0].id)
+        MRIScan.objects.create(
+            patient=patient, uploaded_by=self.users[0], tumor_type="glioma",
+            confidence=0.7, status="COMPLETED", scan_date=timezone.now(),
+        )
+        patient.full_name = "Renamed Patient"
+        patient.save()
+        self.assert_matches_rebuild()
+        self.assertEqual(Patient.objects.get(id=patient.id).full_name, "Renamed Patient")
+
+        stale = Patient.objects.get(id=self.patients[1].id)
+        MRIScan.objects.filter(patient=stale).first().delete()
+        stale.save(update_fields=["full_name", "scan_count"])
+        self.assert_matches_rebuild()
+
+    def test_tracked_queryset_update(self):
+        scan = MRIScan.objects.filter(status="PENDING").first()
+        with tracked(scan.id):
+            MRIScan.objects.filter(id=scan.id).update(tumor_type="pituitary", confidence=0.8, status="COMPLETED")
+        self.assert_matches_rebuild()
+
+    def test_stats_endpoint_reads_materialized_rows(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/patients/stats/", {"days": 365})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_scans"], 30)
+        glioma = next(row for row in response.data["tumor_types"] if row["tumor_type"] == "glioma")
+        self.assertEqual(glioma["count"], MRIScan.objects.filter(tumor_type="glioma").count())
+        self.assertEqual(sum(row["count"] for row in response.data["daily"]), 30)
+        self.assertEqual(self.client.get("/api/patients/stats/", {"days": "0"}).status_code, 400)
+
+    def test_doctor_registry_uses_scan_count(self):
+        doctor = self.users[1]
+        doctor.profile.role = "DOCTOR"
+        doctor.profile.save()
+        self.client.force_authenticate(doctor)
+
+        with self.assertNumQueries(1):
+            rows = self.client.get("/api/patients/doctor-registry/").data["results"]
+        for row in rows:
+            self.assertEqual(row["activity"], MRIScan.objects.filter(patient_id=row["id"]).count())
+
+
+@override_settings(RESPONSE_CACHE=True)
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        caches["responses"].clear()
+        response_stats.reset()
+        self.users = seed_users(2)
+        self.patients = seed_patients(2)
+        seed_scans(10, self.patients, self.users)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def add_scan(self, patient, user):
+        return MRIScan.objects.create(
+            patient=patient, uploaded_by=user, tumor_type="glioma", confidence=0.9,
+            status="COMPLETED", scan_date=timezone.now(),
+        )
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get("/api/patients/my-scans/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/patients/my-scans/")
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first["ETag"], second["ETag"])
+        stats = response_cache_stats()["endpoints"]["my_scans"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(f"/api/patients/patient/{self.patients[0].id}/")["ETag"]
+
+        response = self.client.get(f"/api/patients/patient/{self.patients[0].id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        self.add_scan(self.patients[0], self.users[0])
+        response = self.client.get(f"/api/patients/patient/{self.patients[0].id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_scan_write_invalidates_only_affected_entries(self):
+        other = APIClient()
+        other.force_authenticate(self.users[1])
+        self.client.get("/api/patients/my-scans/")
+        other.get("/api/patients/my-scans/")
+        self.client.get(f"/api/patients/patient/{self.patients[1].id}/")
+
+        scan = self.add_scan(self.patients[0], self.users[0])
+
+        self.assertEqual(self.client.get("/api/patients/my-scans/").data["results"][0]["id"], scan.id)
+        with self.assertNumQueries(0):
+            other.get("/api/patients/my-scans/")
+            self.client.get(f"/api/patients/patient/{self.patients[1].id}/")
+        detail = self.client.get(f"/api/patients/patient/{self.patients[0].id}/")
+        self.assertIn(scan.id, [row["id"] for row in detail.data["scans"]])
+
+    def test_patient_and_review_writes_invalidate(self):
+        patient = self.patients[0]
+        self.client.get(f"/api/patients/by-uid/{patient.patient_uid}/")
+        patient.full_name = "Renamed Patient"
+        patient.save()
+        response = self.client.get(f"/api/patients/by-uid/{patient.patient_uid}/")
+        self.assertEqual(response.data["full_name"], "Renamed Patient")
+        names = {row["patient_name"] for row in self.client.get("/api/patients/my-scans/").data["results"]
+                 if row["patient_uid"] == patient.patient_uid}
+        self.assertLessEqual(names, {"Renamed Patient"})
+
+        scan = patient.scans.first()
+        etag = self.client.get(f"/api/patients/patient/{patient.id}/")["ETag"]
+        # The status update bypasses signals; saving the review invalidates.
+        MRIScan.objects.filter(id=scan.id).update(status="VERIFIED")
+        DoctorReview.objects.create(scan=scan, doctor=self.users[1], verified=True)
+        response = self.client.get(f"/api/patients/patient/{patient.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(next(row for row in response.data["scans"] if row["id"] == scan.id)["status"], "VERIFIED")
+
+
+class LocalStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(
+            SCAN_STORAGE_BACKEND="local", SCAN_STORAGE_ROOT=self.root,
+            SCAN_STORAGE_BASE_URL="http://testserver/api/patients/media/",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_storage()
+        self.addCleanup(reset_storage)
+        # A JPEG header followed by enough bytes to take several chunks.
+        self.image = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 1000
+
+    def test_identical_uploads_are_stored_once(self):
+        first = store_image(SimpleUploadedFile("a.jpg", self.image))
+        second = store_image(BytesIO(self.image))
+
+        self.assertEqual(first, second)
+        self.assertEqual((get_storage().stored, get_storage().deduplicated), (1, 1))
+        stored = [p for p in get_storage().root.rglob("*") if p.is_file()]
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored[0].read_bytes(), self.image)
+
+    def test_serves_whole_file_and_ranges(self):
+        url = store_image(BytesIO(self.image)).removeprefix("http://testserver")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(b"".join(response.streaming_content), self.image)
+
+        response = self.client.get(url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.image)}")
+        self.assertEqual(b"".join(response.streaming_content), self.image[100:200])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.image[-10:])
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f"bytes={len(self.image)}-").status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_unknown_or_malformed_names_are_404(self):
+        self.assertEqual(self.client.get("/api/patients/media/mri_scans/" + "0" * 64).status_code, 404)
+        self.assertEqual(self.client.get("/api/patients/media/mri_scans/..%2F..%2Fsettings.py").status_code, 404)
+
+
+class DerivativeTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(
+            SCAN_STORAGE_BACKEND="local", SCAN_STORAGE_ROOT=self.root,
+            SCAN_STORAGE_BASE_URL="http://testserver/api/patients/media/",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_storage()
+        self.addCleanup(reset_storage)
+
+        out = BytesIO()
+        Image.radial_gradient("L").resize((1024, 768)).convert("RGB").save(out, "JPEG", quality=95)
+        self.image = out.getvalue()
+        self.user = seed_users(1)[0]
+        self.patient = seed_patients(1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_scan(self):
+        return MRIScan.objects.create(
+            patient=self.patient, uploaded_by=self.user, tumor_type="glioma", confidence=0.9,
+            status="COMPLETED", scan_date=timezone.now(),
+            mri_image_url=store_image(BytesIO(self.image)),
+        )
+
+    def test_renditions(self):
+        scan = self.add_scan()
+        thumbnail_url, model_input_url = generate_derivatives(scan.id, self.image)
+
+        thumbnail = Image.open(BytesIO(load_original(thumbnail_url)))
+        self.assertEqual((thumbnail.format, thumbnail.size), ("JPEG", (256, 192)))
+        model_input = load_original(model_input_url)
+        self.assertEqual(Image.open(BytesIO(model_input)).size, (128, 128))
+        # The stored model input is exactly what the CNN gets from the original.
+        self.assertTrue((preprocess_image(BytesIO(model_input)) == preprocess_image(BytesIO(self.image))).all())
+
+        row = self.client.get("/api/patients/my-scans/").data["results"][0]
+        self.assertEqual(row["thumbnail_url"], thumbnail_url)
+
+    def test_backfill_command(self):
+        scans = [self.add_scan() for _ in range(3)]
+        generate_derivatives(scans[0].id)
+
+        out = StringIO()
+        call_command("backfill_derivatives", "--dry-run", stdout=out)
+        self.assertIn("2 scans need derivatives", out.getvalue())
+        call_command("backfill_derivatives", "--workers", "1", stdout=StringIO())
+        self.assertFalse(MRIScan.objects.filter(thumbnail_url__isnull=True).exists())
+
+    @override_settings(SCAN_DERIVATIVES=False)
+    def test_scheduling_can_be_disabled(self):
+        self.assertIsNone(schedule_derivatives(self.add_scan().id, BytesIO(self.image)))
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("upload=2, my_scans=4,by_uid"), {"upload": 2.0, "my_scans": 4.0, "by_uid": 1.0})
+        with self.assertRaises(CommandError):
+            parse_mix("upload=2,delete_everything=1")
+        with self.assertRaises(CommandError):
+            parse_mix("upload=0")
+
+    def test_stats_per_endpoint(self):
+        stats = LoadStats()
+        for ms in (10.0, 20.0, 30.0):
+            stats.record("my_scans", 200, ms)
+        stats.record("my_scans", 503, 5.0)
+        stats.record("upload", "error", 120.0)
+        stats.record("login", 200, 300.0)
+
+        summary = stats.summary(wall=2.0)
+
+        self.assertEqual(summary["my_scans"]["ok"], 3)
+        self.assertEqual(summary["my_scans"]["error_rate"], 0.25)
+        self.assertEqual(summary["my_scans"]["statuses"], {"200": 3, "503": 1})
+        self.assertEqual(summary["my_scans"]["throughput_rps"], 1.5)
+        self.assertEqual(summary["my_scans"]["latency"]["p50_ms"], 20.0)
+        self.assertEqual((summary["upload"]["error_rate"], summary["upload"]["latency"]), (1.0, None))
+        self.assertIsNone(summary["login"]["throughput_rps"])
+
+
+class ObservabilityTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(seed_users(1)[0])
+
+    def test_request_id_is_echoed_or_generated(self):
+        response = self.client.get("/api/patients/stats/", HTTP_X_REQUEST_ID="scan-upload.42")
+        self.assertEqual(response["X-Request-ID"], "scan-upload.42")
+
+        response = self.client.get("/api/patients/stats/", HTTP_X_REQUEST_ID="not a valid id\n")
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    def test_spans_are_logged_per_request(self):
+        def view(request):
+            with span("decode"):
+                pass
+            with span("decode"):
+                pass
+            self.assertEqual(current_request_id(), "req-1")
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/api/patients/upload-scan/", HTTP_X_REQUEST_ID="req-1")
+        with self.assertLogs("backend.observability", "INFO") as logs:
+            RequestTracingMiddleware(view)(request)
+
+        self.assertIsNone(current_request_id())
+        self.assertEqual(SPAN_DURATION.count(span="decode"), 2)
+        self.assertIn('"request_id": "req-1"', logs.output[0])
+        self.assertIn('"spans_ms": {"decode":', logs.output[0])
+
+    def test_streaming_spans_are_logged_when_the_response_closes(self):
+        seen = []
+
+        def view(request):
+            def chunks():
+                seen.append(current_request_id())
+                with span("reasoning"):
+                    yield b"a"
+                yield b"b"
+            return StreamingHttpResponse(chunks())
+
+        request = RequestFactory().get("/api/patients/upload-scan/stream/", HTTP_X_REQUEST_ID="req-2")
+        with self.assertLogs("backend.observability", "INFO") as logs:
+            response = RequestTracingMiddleware(view)(request)
+            self.assertEqual(response["X-Request-ID"], "req-2")
+            self.assertEqual(b"".join(response.streaming_content), b"ab")
+            self.assertEqual(registry.render().count("http_requests_total{"), 0)
+            response.close()
+            response.close()
+
+        self.assertEqual(seen, ["req-2"])
+        self.assertIsNone(current_request_id())
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('"request_id": "req-2"', logs.output[0])
+        self.assertIn('"spans_ms": {"reasoning":', logs.output[0])
+
+    def test_stream_closed_early_is_still_recorded(self):
+        def view(request):
+            def chunks():
+                try:
+                    yield b"a"
+                    yield b"b"
+                finally:
+                    with span("db"):
+                        pass
+            return StreamingHttpResponse(chunks())
+
+        request = RequestFactory().get("/api/patients/upload-scan/stream/", HTTP_X_REQUEST_ID="req-3")
+        with self.assertLogs("backend.observability", "INFO") as logs:
+            response = RequestTracingMiddleware(view)(request)
+            next(iter(response.streaming_content))
+            response.close()
+
+        self.assertIn('"request_id": "req-3"', logs.output[0])
+        self.assertIn('"spans_ms": {"db":', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/patients/stats/")
+        with span("gemini"):
+            pass
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",route="api/patients/stats/",status="200"} 1', body)
+        self.assertIn('app_span_duration_seconds_bucket{span="gemini",le="+Inf"} 1', body)
+        self.assertIn('app_span_duration_seconds_count{span="gemini"} 1', body)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.override = override_settings(
+            PROFILING=True, PROFILING_TOKEN="prof-token", PROFILING_SAMPLE_RATE=0.0, PROFILING_DIR=self.root,
+        )
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        caches["responses"].clear()
+        self.user = seed_users(1)[0]
+        self.admin = User.objects.create_user("profiling-admin", password="x", is_staff=True)
+        # A new client builds its middleware chain under the overridden settings.
+        self.client = APIClient()
+
+    def profile(self, **headers):
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/patients/my-scans/", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get("X-Profile-Id")
+
+    def test_header_profiles_request_for_admin_download(self):
+        profile_id = self.profile(HTTP_X_PROFILE="prof-token")
+        self.assertIsNotNone(profile_id)
+
+        self.client.force_authenticate(self.admin)
+        listing = self.client.get("/api/profiles/").json()["profiles"]
+        self.assertEqual([p["id"] for p in listing], [profile_id])
+        self.assertEqual(listing[0]["trigger"], "header")
+        self.assertEqual(listing[0]["route"], "api/patients/my-scans/")
+        self.assertGreater(listing[0]["sql_queries"], 0)
+
+        summary = self.client.get(f"/api/profiles/{profile_id}/", {"format": "json"}).json()
+        self.assertTrue(summary["top_functions"])
+
+        response = self.client.get(f"/api/profiles/{profile_id}/")
+        self.assertEqual(response.status_code, 200)
+        path = f"{self.root}/download.prof"
+        with open(path, "wb") as f:
+            f.write(b"".join(response.streaming_content))
+        self.assertTrue(pstats.Stats(path).total_calls)
+
+    def test_profiles_are_admin_only(self):
+        profile_id = self.profile(HTTP_X_PROFILE="prof-token")
+        self.assertEqual(self.client.get("/api/profiles/").status_code, 403)
+        self.assertEqual(self.client.get(f"/api/profiles/{profile_id}/").status_code, 403)
+
+    def test_unsampled_requests_are_not_profiled(self):
+        self.assertIsNone(self.profile())
+        self.assertIsNone(self.profile(HTTP_X_PROFILE="wrong"))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_sample_rate_and_retention(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PROFILES=2):
+            ids = [self.profile() for _ in range(3)]
+        self.assertTrue(all(ids))
+        self.assertEqual(len(os.listdir(self.root)), 4)
+
+    @override_settings(PROFILING=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        self.assertIsNone(self.profile(HTTP_X_PROFILE="prof-token"))
+
+
+class FixedBackend:
+    """Stands in for the CNN: every image is `label` with `confidence`."""
+
+    def __init__(self, label="glioma", confidence=0.9):
+        row = np.full(4, (1.0 - confidence) / 3, dtype=np.float32)
+        row[predictor.utils.CLASS_LABELS.index(label)] = confidence
+        self.row = row
+        self.calls = []
+
+    def infer(self, batch):
+        self.calls.append(len(batch))
+        return np.tile(self.row, (len(batch), 1))
+
+
+def jpeg_bytes(seed=0, size=(64, 48)):
+    out = BytesIO()
+    Image.effect_noise(size, 40 + seed).convert("RGB").save(out, "JPEG")
+    return out.getvalue()
+
+
+class ScanPipelineTestCase(TestCase):
+    """
+    Runs the upload views end to end with a stand-in model, a local fake
+    Gemini and local storage in a temporary directory.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gemini = FakeGeminiServer(text="* Surgery: Craniotomy - Tumor resection.").start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gemini.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.gemini.reset()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        overrides = override_settings(
+            SCAN_STORAGE_BACKEND="local", SCAN_STORAGE_ROOT=self.root,
+            SCAN_STORAGE_BASE_URL="http://testserver/api/patients/media/",
+            SCAN_DERIVATIVES=False, SCAN_UPLOAD_ASYNC=False, SCAN_JOBS_IN_PROCESS_WORKER=False,
+            PREDICTOR_CACHE=False, PREDICTOR_BATCHING=False, PREDICTOR_POOL_ADDRESS="",
+            GEMINI_API_KEY="test-key", GEMINI_BASE_URL=self.gemini.url,
+            GEMINI_RATE_PER_MINUTE=6000, GEMINI_BURST=100, GEMINI_BACKOFF_BASE=0.001,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for reset in (reset_storage, reset_gemini):
+            reset()
+            self.addCleanup(reset)
+        caches["reasoning"].clear()
+
+        self.backend = FixedBackend()
+        self.addCleanup(setattr, predictor.utils, "_backend", predictor.utils._backend)
+        predictor.utils._backend = self.backend
+
+        self.user = seed_users(1)[0]
+        self.patient = seed_patients(1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class BulkUploadTests(ScanPipelineTestCase):
+
+    def post(self, **data):
+        response = self.client.post("/api/patients/bulk-upload/", data, format="multipart")
+        if response.status_code != 200:
+            return response.status_code, response.json()
+        return 200, [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def archive(self, members):
+        out = BytesIO()
+        with zipfile.ZipFile(out, "w") as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        return SimpleUploadedFile("scans.zip", out.getvalue(), content_type="application/zip")
+
+    def test_archive_with_manifest(self):
+        manifest = json.dumps([
+            {"file": "a.jpg", "patient_id": self.patient.id},
+            {"file": "b.jpg", "patient_id": 999999},
+        ])
+        status, lines = self.post(archive=self.archive({
+            "scans/a.jpg": jpeg_bytes(1), "scans/b.jpg": jpeg_bytes(2), "manifest.json": manifest,
+        }))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(lines[0], {"event": "started", "total": 2})
+        self.assertEqual((lines[1]["file"], lines[1]["status"], lines[1]["tumor_type"]), ("a.jpg", "ok", "glioma"))
+        self.assertEqual((lines[2]["file"], lines[2]["error"]), ("b.jpg", "Patient not found"))
+        self.assertEqual(lines[-1]["event"], "finished")
+        self.assertEqual(self.backend.calls, [2])
+        scan = MRIScan.objects.get(id=lines[1]["scan_id"])
+        self.assertEqual(scan.clinical_reasoning, "* Surgery: Craniotomy - Tumor resection.")
+
+    def test_rejects_missing_patient_and_duplicate_names(self):
+        status, body = self.post(files=[SimpleUploadedFile("a.jpg", jpeg_bytes())])
+        self.assertEqual(status, 400)
+        self.assertIn("a.jpg", body["error"])
+
+        status, body = self.post(archive=self.archive({"x/scan.jpg": jpeg_bytes(1), "y/scan.jpg": jpeg_bytes(2)}),
+                                 patient_id=self.patient.id)
+        self.assertEqual(status, 400)
+        self.assertIn("more than one image named scan.jpg", body["error"])
+
+        manifest = json.dumps([
+            {"file": "x/scan.jpg", "patient_id": self.patient.id},
+            {"file": "y/scan.jpg", "patient_id": self.patient.id},
+        ])
+        status, _ = self.post(files=[SimpleUploadedFile("scan.jpg", jpeg_bytes())], manifest=manifest)
+        self.assertEqual(status, 400)
+        self.assertFalse(MRIScan.objects.exists())
+
+    def test_archive_size_limits(self):
+        # Highly compressible members: the decompressed size is what counts.
+        members = {f"{i}.jpg": b"\xff\xd8" + bytes(4000) for i in range(3)}
+
+        with override_settings(BULK_UPLOAD_MAX_ITEM_BYTES=3000):
+            status, body = self.post(archive=self.archive(members), patient_id=self.patient.id)
+        self.assertEqual((status, body["error"]), (400, "0.jpg exceeds 3000 bytes"))
+
+        with override_settings(BULK_UPLOAD_MAX_TOTAL_BYTES=10000):
+            status, body = self.post(archive=self.archive(members), patient_id=self.patient.id)
+        self.assertEqual((status, body["error"]), (400, "Archive exceeds 10000 bytes in total"))
+
+
+class FailingBackend:
+    def infer(self, batch):
+        raise RuntimeError("model crashed")
+
+
+@override_settings(SCAN_JOBS_MAX_ATTEMPTS=2, SCAN_JOBS_RETRY_BACKOFF=5, SCAN_JOBS_LOCK_TIMEOUT=60)
+class ScanJobTests(ScanPipelineTestCase):
+
+    def enqueue(self):
+        scan = MRIScan.objects.create(
+            patient=self.patient, uploaded_by=self.user, status="PENDING", scan_date=timezone.now(),
+        )
+        return enqueue_scan(scan, SimpleUploadedFile("scan.jpg", jpeg_bytes()))
+
+    def go_stale(self, job):
+        ScanJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(seconds=120))
+
+    def test_job_completes_scan(self):
+        job = self.enqueue()
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.image), ("DONE", 1, None))
+        scan = MRIScan.objects.get(id=job.scan_id)
+        self.assertEqual((scan.status, scan.tumor_type), ("COMPLETED", "glioma"))
+        self.assertTrue(scan.mri_image_url)
+
+    def test_claim_is_exclusive_and_counts_an_attempt(self):
+        job = self.enqueue()
+
+        claimed = claim_next_job()
+
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, "RUNNING", 1))
+        self.assertIsNone(claim_next_job())
+
+    def test_failures_back_off_then_fail(self):
+        predictor.utils._backend = FailingBackend()
+        job = self.enqueue()
+
+        with self.assertLogs("patients.jobs", "WARNING"):
+            self.assertFalse(run_job(claim_next_job()))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("QUEUED", 1))
+        self.assertAlmostEqual((job.available_at - timezone.now()).total_seconds(), 5, delta=2)
+        self.assertIsNone(claim_next_job())
+
+        ScanJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        with self.assertLogs("patients.jobs", "WARNING"):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ("FAILED", 2, "model crashed"))
+        self.assertEqual(MRIScan.objects.get(id=job.scan_id).status, "FAILED")
+
+    def test_stale_worker_cannot_overwrite_reclaimed_job(self):
+        job = self.enqueue()
+        first = claim_next_job()
+        self.go_stale(first)
+        first.refresh_from_db()
+        second = claim_next_job()
+        self.assertEqual((second.id, second.attempts), (job.id, 2))
+
+        # The first worker comes back after the job was taken over.
+        with self.assertLogs("patients.jobs", "WARNING"):
+            self.assertFalse(run_job(first))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_at), ("RUNNING", second.locked_at))
+        self.assertEqual(MRIScan.objects.get(id=job.scan_id).status, "PENDING")
+
+        predictor.utils._backend = FailingBackend()
+        with self.assertLogs("patients.jobs", "WARNING") as logs:
+            self.assertFalse(run_job(first))
+        self.assertIn("taken over", logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ("RUNNING", None))
+
+        predictor.utils._backend = self.backend
+        self.assertTrue(run_job(second))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "DONE")
+        self.assertEqual(MRIScan.objects.get(id=job.scan_id).status, "COMPLETED")
+
+    def test_job_that_kills_its_worker_runs_out_of_attempts(self):
+        job = self.enqueue()
+        claim_next_job()
+        self.go_stale(job)
+
+        self.assertEqual(claim_next_job().attempts, 2)
+        self.go_stale(job)
+        with self.assertLogs("patients.jobs", "WARNING"):
+            self.assertIsNone(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("FAILED", 2))
+        self.assertEqual(MRIScan.objects.get(id=job.scan_id).status, "FAILED")
+
+
+class UploadStreamTests(ScanPipelineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.gemini.text = "* Surgery: Craniotomy.\n* Radiotherapy: Adjuvant."
+
+    def post(self):
+        return self.client.post("/api/patients/upload-scan/stream/", {
+            "patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes()),
+        }, format="multipart", HTTP_ACCEPT="text/event-stream")
+
+    def parse(self, frames):
+        events = []
+        for frame in b"".join(frames).decode().split("\n\n"):
+            if frame:
+                event, data = frame.split("\n", 1)
+                events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    def test_event_sequence(self):
+        response = self.post()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        events = self.parse(response.streaming_content)
+
+        names = [name for name, _ in events]
+        self.assertEqual((names[0], names[-1]), ("prediction", "complete"))
+        self.assertTrue(set(names[1:-1]) == {"reasoning"} and len(names) > 2)
+        text = "".join(data["text"] for name, data in events if name == "reasoning")
+        self.assertEqual(events[0][1]["status"], "PENDING")
+        scan = MRIScan.objects.get(id=events[0][1]["scan_id"])
+        self.assertEqual((scan.status, scan.clinical_reasoning), ("COMPLETED", text.strip()))
+        self.assertEqual(events[-1][1]["mri_image_url"], scan.mri_image_url)
+
+    def test_request_log_includes_stream_stages(self):
+        with self.assertLogs("backend.observability", "INFO") as logs:
+            response = self.post()
+            b"".join(response.streaming_content)
+
+        event = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((event["event"], event["request_id"]), ("request", response["X-Request-ID"]))
+        self.assertTrue({"cnn", "reasoning", "storage"} <= set(event["spans_ms"]))
+
+    def test_disconnect_before_first_event_leaves_no_scan(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.assertFalse(MRIScan.objects.exists())
+
+    def test_disconnect_mid_stream_still_saves_scan(self):
+        response = self.post()
+        stream = iter(response.streaming_content)
+        scan_id = self.parse([next(stream)])[0][1]["scan_id"]
+        response.close()
+
+        scan = MRIScan.objects.get(id=scan_id)
+        self.assertEqual(scan.status, "COMPLETED")
+        self.assertIn("Radiotherapy", scan.clinical_reasoning)
+        self.assertTrue(scan.mri_image_url)
+
+
+class PostPredictionTests(ScanPipelineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.gemini.delay = 0
+        self.file = SimpleUploadedFile("scan.jpg", jpeg_bytes())
+
+    def run_stages(self):
+        timer = StageTimer()
+        started = time.perf_counter()
+        result = run_post_prediction(self.patient, self.file, "glioma", 0.9, timer)
+        return result, timer, time.perf_counter() - started
+
+    def slow_storage(self, delay):
+        def store(file, folder):
+            time.sleep(delay)
+            return store_image(file, folder=folder)
+        return mock.patch("patients.pipeline.store_image", side_effect=store)
+
+    def test_stages_run_concurrently(self):
+        self.gemini.delay = 0.3
+        with self.slow_storage(0.3):
+            (reasoning, url), timer, elapsed = self.run_stages()
+
+        self.assertEqual(reasoning, self.gemini.text)
+        self.assertTrue(url.startswith("http://testserver/api/patients/media/mri_scans/"))
+        self.assertGreaterEqual(min(timer.stages["reasoning"], timer.stages["storage"]), 300)
+        self.assertLess(elapsed, 0.55)
+
+    @override_settings(SCAN_REASONING_TIMEOUT=0.2)
+    def test_slow_reasoning_falls_back(self):
+        self.gemini.delay = 1.0
+        (reasoning, url), _, elapsed = self.run_stages()
+
+        self.assertEqual(reasoning, REASONING_FALLBACK)
+        self.assertTrue(url)
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(FALLBACKS.value(kind="reasoning_timeout"), 1)
+
+    def test_reasoning_error_falls_back(self):
+        with mock.patch("patients.pipeline.generate_clinical_reasoning", side_effect=RuntimeError("boom")):
+            (reasoning, url), _, _ = self.run_stages()
+
+        self.assertEqual(reasoning, REASONING_FALLBACK)
+        self.assertTrue(url)
+        self.assertEqual(FALLBACKS.value(kind="reasoning_error"), 1)
+
+    def test_storage_failure_fails_upload(self):
+        with mock.patch("patients.pipeline.store_image", side_effect=StorageError("disk full")):
+            with self.assertRaisesMessage(StorageStageError, "Image upload failed: disk full"):
+                self.run_stages()
+
+            response = self.client.post("/api/patients/upload-scan/", {
+                "patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes()),
+            }, format="multipart")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(MRIScan.objects.exists())
+
+    @override_settings(SCAN_STORAGE_TIMEOUT=10, SCAN_POST_PREDICTION_DEADLINE=0.3)
+    def test_overall_deadline_bounds_storage(self):
+        with self.slow_storage(1.0):
+            started = time.perf_counter()
+            with self.assertRaisesMessage(StorageStageError, "Image upload timed out"):
+                self.run_stages()
+
+        self.assertLess(time.perf_counter() - started, 0.8)
+
+    @override_settings(SCAN_REASONING_TIMEOUT=0.1)
+    def test_abandoned_reasoning_does_not_starve_storage(self):
+        self.gemini.delay = 1.0
+        storage, reasoning = ThreadPoolExecutor(max_workers=1), ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(storage.shutdown, wait=False)
+        self.addCleanup(reasoning.shutdown, wait=False)
+
+        with mock.patch("patients.pipeline._executor", storage), \
+                mock.patch("patients.pipeline._reasoning_executor", reasoning):
+            # The first Gemini call still holds the only reasoning worker
+            # when the second upload arrives; its storage stage is unaffected.
+            for _ in range(2):
+                self.file.seek(0)
+                (text, url), _, elapsed = self.run_stages()
+                self.assertEqual(text, REASONING_FALLBACK)
+                self.assertTrue(url)
+                self.assertLess(elapsed, 0.5)
+
+        self.assertEqual(FALLBACKS.value(kind="reasoning_timeout"), 2)
+
+    @override_settings(SCAN_REASONING_TIMEOUT=0.2)
+    def test_async_slow_reasoning_falls_back(self):
+        self.gemini.delay = 1.0
+        started = time.perf_counter()
+        reasoning, url = asyncio.run(arun_post_prediction(self.patient, self.file, "glioma", 0.9))
+
+        self.assertEqual(reasoning, REASONING_FALLBACK)
+        self.assertTrue(url)
+        self.assertLess(time.perf_counter() - started, 0.8)
+
+
+class AsyncUploadTests(ScanPipelineTestCase):
+    """upload_scan_async through Django's async request path."""
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+
+    def upload(self, **headers):
+        data = {"patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes())}
+        return async_to_sync(self.async_client.post)("/api/patients/upload-scan/async/", data, headers=headers)
+
+    def bearer(self):
+        return {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_rejects_missing_and_bad_tokens(self):
+        self.assertEqual(self.upload().status_code, 401)
+        self.assertEqual(self.upload(Authorization="Bearer not-a-jwt").status_code, 401)
+        self.assertEqual(self.upload(Authorization="Bearer").status_code, 401)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.upload(**self.bearer()).status_code, 401)
+        self.assertFalse(MRIScan.objects.exists())
+
+    def test_happy_path_matches_sync_view(self):
+        response = self.upload(**self.bearer())
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        scan = MRIScan.objects.get(id=data["scan_id"])
+        self.assertEqual((scan.status, scan.uploaded_by), ("COMPLETED", self.user))
+        self.assertEqual((scan.tumor_type, data["tumor_type"]), ("glioma", "glioma"))
+        self.assertEqual(scan.clinical_reasoning, self.gemini.text)
+        self.assertEqual(data["mri_image_url"], scan.mri_image_url)
+        self.assertTrue(scan.mri_image_url.startswith("http://testserver/api/patients/media/mri_scans/"))
+
+        sync = self.client.post("/api/patients/upload-scan/", {
+            "patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes()),
+        }, format="multipart").json()
+        for field in ("tumor_type", "confidence", "clinical_reasoning", "status"):
+            self.assertEqual(sync[field], data[field], field)
+
+    def test_storage_failure(self):
+        with mock.patch("patients.pipeline.store_image", side_effect=StorageError("disk full")):
+            response = self.upload(**self.bearer())
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(MRIScan.objects.exists())
+
+
+class ReasoningFallbackTests(ScanPipelineTestCase):
+    """Fallback reasoning is returned to the client but never saved."""
+
+    def upload(self):
+        return self.client.post("/api/patients/upload-scan/", {
+            "patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes()),
+        }, format="multipart")
+
+    def test_stored_reasoning(self):
+        self.assertEqual(stored_reasoning("* Surgery: Craniotomy."), "* Surgery: Craniotomy.")
+        for text in (REASONING_FALLBACK, QUOTA_MESSAGE, UNAVAILABLE_MESSAGE,
+                     "* Surgery: Craniotomy.\n\n" + UNAVAILABLE_MESSAGE, "", None):
+            self.assertIsNone(stored_reasoning(text))
+
+    def test_quota_fallback_is_regenerated_later(self):
+        self.gemini.reset("quota")
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["clinical_reasoning"], QUOTA_MESSAGE)
+        scan = MRIScan.objects.get(id=response.json()["scan_id"])
+        self.assertEqual(scan.status, "COMPLETED")
+        self.assertIsNone(scan.clinical_reasoning)
+
+        out = StringIO()
+        call_command("regenerate_reasoning", "--dry-run", stdout=out)
+        self.assertIn("1 scans need reasoning", out.getvalue())
+
+        # Still limited: nothing is written.
+        call_command("regenerate_reasoning", stdout=StringIO(), stderr=StringIO())
+        scan.refresh_from_db()
+        self.assertIsNone(scan.clinical_reasoning)
+
+        self.gemini.reset("ok")
+        reset_gemini()
+        out = StringIO()
+        call_command("regenerate_reasoning", stdout=out)
+        self.assertIn("Regenerated reasoning for 1 scans (0 still unavailable)", out.getvalue())
+        scan.refresh_from_db()
+        self.assertEqual(scan.clinical_reasoning, self.gemini.text)
+
+    def test_job_and_stream_do_not_save_fallbacks(self):
+        self.gemini.reset("error")
+        scan = MRIScan.objects.create(patient=self.patient, uploaded_by=self.user, status="PENDING",
+                                      scan_date=timezone.now())
+        enqueue_scan(scan, SimpleUploadedFile("scan.jpg", jpeg_bytes()))
+        run_job(claim_next_job())
+        scan.refresh_from_db()
+        self.assertEqual((scan.status, scan.clinical_reasoning), ("COMPLETED", None))
+
+        response = self.client.post("/api/patients/upload-scan/stream/", {
+            "patient_id": self.patient.id, "file": SimpleUploadedFile("scan.jpg", jpeg_bytes()),
+        }, format="multipart", HTTP_ACCEPT="text/event-stream")
+        b"".join(response.streaming_content)
+        streamed = MRIScan.objects.exclude(id=scan.id).get()
+        self.assertEqual((streamed.status, streamed.clinical_reasoning), ("COMPLETED", None))
@@ -3,6 +3,10 @@ from . import views
 
 urlpatterns = [
     path("upload-scan/", views.upload_scan),
+    path("upload-scan/async/", views.upload_scan_async),
+    path("upload-scan/stream/", views.upload_scan_stream),
+    path("bulk-upload/", views.bulk_upload_scans),
+    path("scan/<int:scan_id>/status/", views.scan_status),
     path("my-patients/", views.my_patients),
     path("patient/<int:patient_id>/", views.patient_detail),
     path("my-scans/", views.my_scans), # For Technicians (their own scans)
@@ -10,4 +14,7 @@ urlpatterns = [
     path("by-uid/<str:uid>/", views.get_patient_by_uid),
     path("create/", views.create_patient),
     path("doctor-registry/", views.doctor_registry, name="doctor_registry"),
+    path("stats/", views.scan_stats),
+    path("cache-stats/", views.cache_stats),
+    path("media/<str:folder>/<str:key>", views.serve_media),
 ]
\ No newline at end of file
@@ -1,16 +1,77 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.utils import timezone
-from django.db.models import Count
+import contextvars
+import json
+import logging
+import time
 
-from cloudinary.uploader import upload as cloudinary_upload
-
-from .models import Patient, MRIScan
-from predictor.utils import predict_image
+from .models import Patient, MRIScan, ScanJob
+from .jobs import enqueue_scan
+from .pipeline import (
+    REASONING_FALLBACK,
+    StageTimer,
+    StorageStageError,
+    arun_post_prediction,
+    get_executor,
+    run_post_prediction,
+    stored_reasoning,
+)
+from .sse import EventStreamRenderer, sse_event
+from accounts.async_auth import aauthenticate_jwt
+from backend.observability import count_error, count_fallback
+from .bulk import BulkUploadError, parse_bulk_request
+from .pagination import ListQueryError, filter_scans, page_response, paginate, wants_summary
+from .stats import stats_summary
+from .response_cache import cached_response, response_cache_stats, scan_changed
+from .derivatives import schedule_derivatives
+from .storage import LocalStorage, get_storage, parse_range, read_range, sniff_content_type, store_image
+from predictor.cache import hash_file
+from predictor.utils import predict_image, predict_images
+from predictor.worker_pool import InferencePoolBusy, InferencePoolUnavailable
 
 # ✅ CRITICAL IMPORT: This connects your View to the Gemini Service
-from predictor.services import generate_clinical_reasoning 
+from predictor.services import generate_clinical_reasoning, stream_clinical_reasoning
+
+logger = logging.getLogger(__name__)
+
+# Scan columns the list endpoints serialise (plus the joined patient/user
+# fields each view adds).
+SCAN_LIST_FIELDS = (
+    "id", "tumor_type", "confidence", "clinical_reasoning", "status",
+    "mri_image_url", "thumbnail_url",
+    "scan_date", "created_at", "patient", "uploaded_by",
+)
+
+
+def scan_list_fields(summary=False):
+    """SCAN_LIST_FIELDS, without clinical_reasoning for ?fields=summary."""
+    if summary:
+        return tuple(f for f in SCAN_LIST_FIELDS if f != "clinical_reasoning")
+    return SCAN_LIST_FIELDS
+
+
+def parse_scan_date(scan_date_str):
+    if scan_date_str:
+        try:
+            formatted_date = scan_date_str.replace("T", " ")
+            if len(formatted_date) == 16: formatted_date += ":00"
+            return timezone.datetime.fromisoformat(formatted_date)
+        except:
+            pass
+    return timezone.now()
+
+
+def _wants_async_job(value):
+    value = str(value).lower()
+    return value in ("1", "true", "yes") or (settings.SCAN_UPLOAD_ASYNC and value not in ("0", "false", "no"))
 
 
 # =========================================================
@@ -20,8 +81,6 @@ from predictor.services import generate_clinical_reasoning
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def upload_scan(request):
-    print("--- DEBUG: Starting Upload Process ---") # Debug Log 1
-
     patient_id = request.data.get("patient_id")
     scan_date_str = request.data.get("scan_date")
 
@@ -38,65 +97,74 @@ def upload_scan(request):
         return Response({"error": "MRI file missing"}, status=400)
 
     # Date Handling
-    if scan_date_str:
-        try:
-            formatted_date = scan_date_str.replace("T", " ")
-            if len(formatted_date) == 16: formatted_date += ":00"
-            scan_date = timezone.datetime.fromisoformat(formatted_date)
-        except:
-            scan_date = timezone.now()
-    else:
-        scan_date = timezone.now()
+    scan_date = parse_scan_date(scan_date_str)
+
+    # 0. ASYNC MODE: persist as PENDING, analyse in the background worker
+    if _wants_async_job(request.data.get("async", request.query_params.get("async", ""))):
+        scan = MRIScan.objects.create(
+            patient=patient,
+            uploaded_by=request.user,
+            status="PENDING",
+            scan_date=scan_date,
+        )
+        job = enqueue_scan(scan, file)
+        return Response({
+            "message": "Scan queued for analysis",
+            "scan_id": scan.id,
+            "job_id": job.id,
+            "patient_uid": patient.patient_uid,
+            "status": scan.status,
+            "status_url": f"/api/patients/scan/{scan.id}/status/",
+        }, status=202)
+
+    timer = StageTimer()
 
     # 1. CNN PREDICTION
     try:
-        print("--- DEBUG: Calling CNN Model... ---")
+        started = time.perf_counter()
         tumor_type, confidence = predict_image(file)
-        print(f"--- DEBUG: CNN Result: {tumor_type} ({confidence}) ---")
-    except Exception as e:
-        print("Prediction error:", e)
-        return Response({"error": "CNN Prediction failed"}, status=500)
-
-    # 2. GEMINI CLINICAL REASONING
-    print("--- DEBUG: Calling Gemini AI Service... ---") # Debug Log 2
-    try:
-        clinical_reasoning = generate_clinical_reasoning(
-            tumor_type=tumor_type,
-            confidence=confidence,
-            age=patient.age,
-            gender=patient.gender
+        timer.record("cnn", started)
+    except (InferencePoolBusy, InferencePoolUnavailable) as e:
+        logger.warning("Inference pool rejected request: %s", e)
+        count_error("inference_pool")
+        return Response(
+            {"error": "Inference capacity exhausted, retry later"},
+            status=503,
+            headers={"Retry-After": str(e.retry_after)},
         )
-        print("--- DEBUG: Gemini Response Received! ---")
-        print(f"--- DEBUG: Length of reasoning: {len(clinical_reasoning)} chars ---")
-    except Exception as e:
-        print(f"--- DEBUG: Gemini Failed: {e} ---")
-        clinical_reasoning = "Clinical reasoning unavailable."
-
-    # Reset file pointer for Cloudinary
-    file.seek(0)
+    except Exception:
+        logger.exception("Prediction failed")
+        count_error("cnn")
+        return Response({"error": "CNN Prediction failed"}, status=500)
 
-    # 3. CLOUDINARY UPLOAD
+    # 2 + 3. GEMINI CLINICAL REASONING and IMAGE UPLOAD (concurrently)
     try:
-        print("--- DEBUG: Uploading to Cloudinary... ---")
-        upload_result = cloudinary_upload(file, folder="mri_scans")
-        mri_url = upload_result.get("secure_url")
-    except Exception as e:
-        print("Cloudinary error:", e)
-        return Response({"error": "Cloudinary upload failed"}, status=500)
+        clinical_reasoning, mri_url = run_post_prediction(patient, file, tumor_type, confidence, timer)
+    except StorageStageError as e:
+        logger.warning("Storage stage failed: %s", e)
+        timer.log("upload_scan", patient_uid=patient.patient_uid, outcome="storage_failed")
+        return Response({"error": "Image upload failed"}, status=500)
 
     # 4. SAVE TO DATABASE
-    print("--- DEBUG: Saving to Database... ---")
+    started = time.perf_counter()
     scan = MRIScan.objects.create(
         patient=patient,
         uploaded_by=request.user,
         mri_image_url=mri_url,
         tumor_type=tumor_type,
         confidence=confidence,
-        clinical_reasoning=clinical_reasoning, # ✅ Saving reasoning
+        clinical_reasoning=stored_reasoning(clinical_reasoning), # ✅ Saving reasoning
         status="COMPLETED",
         scan_date=scan_date,
     )
+    timer.record("db", started)
+    timer.log(
+        "upload_scan", patient_uid=patient.patient_uid, scan_id=scan.id, outcome="completed",
+        tumor_type=tumor_type, confidence=confidence, reasoning_chars=len(clinical_reasoning),
+    )
+    schedule_derivatives(scan.id, file)
 
+    headers = {"Server-Timing": timer.server_timing()} if settings.SCAN_TIMING_HEADER else None
     return Response({
         "message": "Analysis Complete",
         "scan_id": scan.id,
@@ -108,7 +176,394 @@ def upload_scan(request):
         "clinical_reasoning": clinical_reasoning, # ✅ Sending to Frontend
         "status": scan.status,
         "scan_date": scan.scan_date,
+    }, status=201, headers=headers)
+
+
+@csrf_exempt
+@require_POST
+async def upload_scan_async(request):
+    """
+    upload_scan for ASGI deployments. Plain Django async view (DRF views
+    are sync-only), so JWT auth is checked by hand. CNN inference runs on
+    a worker thread, Gemini is awaited, and the ORM calls use the async
+    query API.
+    """
+    user = await aauthenticate_jwt(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    patient_id = request.POST.get("patient_id")
+    if not patient_id:
+        return JsonResponse({"error": "patient_id required"}, status=400)
+
+    try:
+        patient = await Patient.objects.aget(id=patient_id)
+    except (Patient.DoesNotExist, ValueError):
+        return JsonResponse({"error": "Patient not found"}, status=404)
+
+    file = request.FILES.get("file")
+    if not file:
+        return JsonResponse({"error": "MRI file missing"}, status=400)
+
+    scan_date = parse_scan_date(request.POST.get("scan_date"))
+
+    # 0. ASYNC MODE: persist as PENDING, analyse in the background worker
+    if _wants_async_job(request.POST.get("async", request.GET.get("async", ""))):
+        scan = await MRIScan.objects.acreate(
+            patient=patient,
+            uploaded_by=user,
+            status="PENDING",
+            scan_date=scan_date,
+        )
+        job = await sync_to_async(enqueue_scan)(scan, file)
+        return JsonResponse({
+            "message": "Scan queued for analysis",
+            "scan_id": scan.id,
+            "job_id": job.id,
+            "patient_uid": patient.patient_uid,
+            "status": scan.status,
+            "status_url": f"/api/patients/scan/{scan.id}/status/",
+        }, status=202)
+
+    timer = StageTimer()
+
+    # 1. CNN PREDICTION (blocking; off the event loop)
+    try:
+        started = time.perf_counter()
+        tumor_type, confidence = await sync_to_async(predict_image, thread_sensitive=False)(file)
+        timer.record("cnn", started)
+    except (InferencePoolBusy, InferencePoolUnavailable) as e:
+        logger.warning("Inference pool rejected request: %s", e)
+        count_error("inference_pool")
+        response = JsonResponse({"error": "Inference capacity exhausted, retry later"}, status=503)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    except Exception:
+        logger.exception("Prediction failed")
+        count_error("cnn")
+        return JsonResponse({"error": "CNN Prediction failed"}, status=500)
+
+    # 2 + 3. GEMINI CLINICAL REASONING and IMAGE UPLOAD (concurrently)
+    try:
+        clinical_reasoning, mri_url = await arun_post_prediction(patient, file, tumor_type, confidence, timer)
+    except StorageStageError as e:
+        logger.warning("Storage stage failed: %s", e)
+        timer.log("upload_scan_async", patient_uid=patient.patient_uid, outcome="storage_failed")
+        return JsonResponse({"error": "Image upload failed"}, status=500)
+
+    # 4. SAVE TO DATABASE
+    started = time.perf_counter()
+    scan = await MRIScan.objects.acreate(
+        patient=patient,
+        uploaded_by=user,
+        mri_image_url=mri_url,
+        tumor_type=tumor_type,
+        confidence=confidence,
+        clinical_reasoning=stored_reasoning(clinical_reasoning),
+        status="COMPLETED",
+        scan_date=scan_date,
+    )
+    timer.record("db", started)
+    timer.log("upload_scan_async", patient_uid=patient.patient_uid, scan_id=scan.id, outcome="completed")
+    schedule_derivatives(scan.id, file)
+
+    response = JsonResponse({
+        "message": "Analysis Complete",
+        "scan_id": scan.id,
+        "patient_uid": patient.patient_uid,
+        "patient_name": patient.full_name,
+        "mri_image_url": mri_url,
+        "tumor_type": tumor_type,
+        "confidence": confidence,
+        "clinical_reasoning": clinical_reasoning,
+        "status": scan.status,
+        "scan_date": scan.scan_date,
     }, status=201)
+    if settings.SCAN_TIMING_HEADER:
+        response["Server-Timing"] = timer.server_timing()
+    return response
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def upload_scan_stream(request):
+    """
+    upload_scan as server-sent events. The CNN result is sent as soon as
+    it is known ("prediction"), Gemini's answer follows chunk by chunk
+    ("reasoning"), and "complete" carries the saved scan once the
+    reasoning is persisted and the image upload (started right after
+    the CNN) has finished. A failed upload ends with "error" and the scan
+    marked FAILED.
+
+    The scan is created when the stream is first read. If the client
+    disconnects mid-stream the rest of the answer is still read and saved,
+    so the scan never stays half-written; a client gone before the first
+    event leaves no scan at all.
+    """
+    patient_id = request.data.get("patient_id")
+    if not patient_id:
+        return Response({"error": "patient_id required"}, status=400)
+
+    try:
+        patient = Patient.objects.get(id=patient_id)
+    except Patient.DoesNotExist:
+        return Response({"error": "Patient not found"}, status=404)
+
+    file = request.FILES.get("file")
+    if not file:
+        return Response({"error": "MRI file missing"}, status=400)
+
+    scan_date = parse_scan_date(request.data.get("scan_date"))
+    timer = StageTimer()
+
+    # 1. CNN PREDICTION
+    try:
+        started = time.perf_counter()
+        tumor_type, confidence = predict_image(file)
+        timer.record("cnn", started)
+    except (InferencePoolBusy, InferencePoolUnavailable) as e:
+        logger.warning("Inference pool rejected request: %s", e)
+        count_error("inference_pool")
+        return Response(
+            {"error": "Inference capacity exhausted, retry later"},
+            status=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except Exception:
+        logger.exception("Prediction failed")
+        count_error("cnn")
+        return Response({"error": "CNN Prediction failed"}, status=500)
+
+    def finish(scan, storage_future, storage_started, parts):
+        clinical_reasoning = "".join(parts).strip() or REASONING_FALLBACK
+        try:
+            remaining = settings.SCAN_STORAGE_TIMEOUT - (time.perf_counter() - storage_started)
+            mri_url = storage_future.result(timeout=max(0.0, remaining))
+        except Exception as e:
+            logger.warning("Image upload failed: %s", e)
+            count_error("storage")
+            MRIScan.objects.filter(id=scan.id).update(clinical_reasoning=stored_reasoning(clinical_reasoning), status="FAILED")
+            scan_changed(patient.id, scan.uploaded_by_id)
+            timer.log("upload_scan_stream", patient_uid=patient.patient_uid, scan_id=scan.id, outcome="storage_failed")
+            return None
+        timer.record("storage", storage_started)
+
+        MRIScan.objects.filter(id=scan.id).update(
+            mri_image_url=mri_url,
+            clinical_reasoning=stored_reasoning(clinical_reasoning),
+            status="COMPLETED",
+        )
+        scan_changed(patient.id, scan.uploaded_by_id)
+        schedule_derivatives(scan.id, file)
+        timer.log("upload_scan_stream", patient_uid=patient.patient_uid, scan_id=scan.id, outcome="completed")
+        return {
+            "message": "Analysis Complete",
+            "scan_id": scan.id,
+            "patient_uid": patient.patient_uid,
+            "patient_name": patient.full_name,
+            "mri_image_url": mri_url,
+            "tumor_type": tumor_type,
+            "confidence": confidence,
+            "clinical_reasoning": clinical_reasoning,
+            "status": "COMPLETED",
+            "scan_date": scan.scan_date,
+        }
+
+    def events():
+        # The scan row and the upload start with the first read of the
+        # stream: a client gone before that leaves no PENDING scan behind.
+        scan = MRIScan.objects.create(
+            patient=patient,
+            uploaded_by=request.user,
+            tumor_type=tumor_type,
+            confidence=confidence,
+            status="PENDING",
+            scan_date=scan_date,
+        )
+
+        # 2. IMAGE UPLOAD in the background while reasoning streams
+        file.seek(0)
+        storage_started = time.perf_counter()
+        storage_future = get_executor().submit(contextvars.copy_context().run, store_image, file, folder="mri_scans")
+
+        parts = []
+        reasoning = stream_clinical_reasoning(tumor_type, confidence, patient.age, patient.gender)
+        try:
+            yield sse_event("prediction", {
+                "scan_id": scan.id,
+                "patient_uid": patient.patient_uid,
+                "tumor_type": tumor_type,
+                "confidence": confidence,
+                "status": scan.status,
+            })
+            started = time.perf_counter()
+            for chunk in reasoning:
+                if not parts:
+                    timer.record("reasoning_first_chunk", started)
+                parts.append(chunk)
+                yield sse_event("reasoning", {"text": chunk})
+            timer.record("reasoning", started)
+        except GeneratorExit:
+            parts.extend(reasoning)
+            finish(scan, storage_future, storage_started, parts)
+            raise
+
+        result = finish(scan, storage_future, storage_started, parts)
+        if result is None:
+            yield sse_event("error", {"scan_id": scan.id, "error": "Image upload failed", "status": "FAILED"})
+        else:
+            yield sse_event("complete", result)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def scan_status(request, scan_id):
+    try:
+        scan = MRIScan.objects.select_related("patient").get(id=scan_id)
+    except MRIScan.DoesNotExist:
+        return Response({"error": "Scan not found"}, status=404)
+
+    data = {
+        "scan_id": scan.id,
+        "patient_uid": scan.patient.patient_uid,
+        "status": scan.status,
+        "job": None,
+    }
+    job = ScanJob.objects.filter(scan=scan).defer("image").first()
+    if job is not None:
+        data["job"] = {
+            "id": job.id,
+            "status": job.status,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "last_error": job.last_error,
+            "next_attempt_at": job.available_at if job.status == "QUEUED" else None,
+        }
+    if scan.status != "PENDING":
+        data.update({
+            "tumor_type": scan.tumor_type,
+            "confidence": scan.confidence,
+            "clinical_reasoning": scan.clinical_reasoning,
+            "mri_image_url": scan.mri_image_url,
+            "scan_date": scan.scan_date,
+        })
+    return Response(data)
+
+
+# =========================================================
+# BULK UPLOAD (archive backfills)
+# =========================================================
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_upload_scans(request):
+    """
+    Accepts many MRIs at once (see patients.bulk for the request format)
+    and streams one JSON line per image as it finishes.
+
+    CNN inference runs in batches, identical images are inferred and
+    uploaded once, and Gemini is asked once per (tumor type, age, gender).
+    """
+    try:
+        items = parse_bulk_request(request)
+    except BulkUploadError as e:
+        return Response({"error": str(e)}, status=400)
+
+    patient_ids = {int(i.patient_id) for i in items if i.patient_id.isdigit()}
+    patients = Patient.objects.in_bulk(patient_ids)
+    user = request.user
+
+    def results():
+        try:
+            yield from process()
+        finally:
+            # Archive members are spooled to temporary files.
+            for item in items:
+                item.file.close()
+
+    def process():
+        uploads = {}     # content hash -> image URL
+        reasoning = {}   # (tumor_type, age, gender) -> text
+        step = max(1, settings.PREDICTOR_MAX_BATCH_SIZE)
+        yield json.dumps({"event": "started", "total": len(items)}) + "\n"
+
+        for start in range(0, len(items), step):
+            chunk = items[start:start + step]
+            try:
+                predictions = predict_images([i.file for i in chunk])
+            except Exception:
+                logger.exception("Bulk prediction failed")
+                count_error("cnn")
+                for item in chunk:
+                    yield json.dumps({"index": item.index, "file": item.name, "status": "error",
+                                      "error": "CNN Prediction failed"}) + "\n"
+                continue
+
+            for item, (tumor_type, confidence) in zip(chunk, predictions):
+                patient = patients.get(int(item.patient_id)) if item.patient_id.isdigit() else None
+                if patient is None:
+                    yield json.dumps({"index": item.index, "file": item.name, "status": "error",
+                                      "error": "Patient not found"}) + "\n"
+                    continue
+
+                key = (tumor_type, patient.age, patient.gender)
+                if key not in reasoning:
+                    try:
+                        reasoning[key] = generate_clinical_reasoning(
+                            tumor_type=tumor_type,
+                            confidence=confidence,
+                            age=patient.age,
+                            gender=patient.gender,
+                        )
+                    except Exception as e:
+                        logger.warning("Gemini reasoning failed: %s", e)
+                        count_fallback("reasoning_error")
+                        reasoning[key] = REASONING_FALLBACK
+
+                content_hash = hash_file(item.file)
+                if content_hash not in uploads:
+                    try:
+                        uploads[content_hash] = store_image(item.file, folder="mri_scans")
+                    except Exception as e:
+                        logger.warning("Image upload failed: %s", e)
+                        count_error("storage")
+                        yield json.dumps({"index": item.index, "file": item.name, "status": "error",
+                                          "error": "Image upload failed"}) + "\n"
+                        continue
+
+                scan = MRIScan.objects.create(
+                    patient=patient,
+                    uploaded_by=user,
+                    mri_image_url=uploads[content_hash],
+                    tumor_type=tumor_type,
+                    confidence=confidence,
+                    clinical_reasoning=stored_reasoning(reasoning[key]),
+                    status="COMPLETED",
+                    scan_date=parse_scan_date(item.scan_date),
+                )
+                schedule_derivatives(scan.id, item.file)
+                yield json.dumps({
+                    "index": item.index,
+                    "file": item.name,
+                    "status": "ok",
+                    "scan_id": scan.id,
+                    "patient_uid": patient.patient_uid,
+                    "tumor_type": tumor_type,
+                    "confidence": confidence,
+                    "mri_image_url": scan.mri_image_url,
+                }) + "\n"
+
+        yield json.dumps({"event": "finished", "total": len(items)}) + "\n"
+
+    response = StreamingHttpResponse(results(), content_type="application/x-ndjson")
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 # =========================================================
@@ -117,6 +572,7 @@ def upload_scan(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("get_patient_by_uid", lambda request, uid: [f"patient-uid:{uid}"])
 def get_patient_by_uid(request, uid):
     try:
         patient = Patient.objects.get(patient_uid=uid)
@@ -134,6 +590,7 @@ def get_patient_by_uid(request, uid):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("patient_detail", lambda request, patient_id: [f"patient:{patient_id}"])
 def patient_detail(request, patient_id):
     try:
         patient = Patient.objects.get(id=patient_id)
@@ -150,6 +607,7 @@ def patient_detail(request, patient_id):
         "status": s.status,
         "scan_date": s.scan_date,
         "mri_image_url": s.mri_image_url,
+        "thumbnail_url": s.thumbnail_url,
         "created_at": s.created_at,
     } for s in scans]
 
@@ -169,27 +627,47 @@ def patient_detail(request, patient_id):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def all_scans(request):
-    scans = MRIScan.objects.all().order_by("-created_at")
+    params = request.query_params
+    summary = wants_summary(params)
+    # One JOINed query per page: no per-row patient/user lookups.
+    scans = (
+        MRIScan.objects
+        .select_related("patient", "uploaded_by")
+        .only(*scan_list_fields(summary), "patient__full_name", "patient__patient_uid", "uploaded_by__username")
+    )
+    try:
+        scans, next_cursor = paginate(filter_scans(scans, params), params)
+    except ListQueryError as e:
+        return Response({"error": str(e)}, status=400)
+
     data = []
     for s in scans:
-        data.append({
+        row = {
             "id": s.id,
             "patient": {"full_name": s.patient.full_name, "patient_uid": s.patient.patient_uid},
             "tumor_type": s.tumor_type,
             "confidence": s.confidence,
-            "clinical_reasoning": s.clinical_reasoning, # ✅ Make sure this is here
             "status": s.status,
             "mri_image_url": s.mri_image_url,
+            "thumbnail_url": s.thumbnail_url,
             "scan_date": s.scan_date,
             "created_at": s.created_at,
             "uploaded_by_username": s.uploaded_by.username
-        })
-    return Response(data)
+        }
+        # Only read when selected: a deferred field costs a query per row.
+        if not summary:
+            row["clinical_reasoning"] = s.clinical_reasoning # ✅ Make sure this is here
+        data.append(row)
+    return Response(page_response(data, next_cursor))
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("my_patients", lambda request: ["patients"])
 def my_patients(request):
-    patients = Patient.objects.all().order_by('-created_at')
+    try:
+        patients, next_cursor = paginate(Patient.objects.all(), request.query_params)
+    except ListQueryError as e:
+        return Response({"error": str(e)}, status=400)
     data = [{
         "id": p.id,
         "patient_uid": p.patient_uid,
@@ -200,24 +678,42 @@ def my_patients(request):
         "address": p.address,
         "created_at": p.created_at,
     } for p in patients]
-    return Response(data)
+    return Response(page_response(data, next_cursor))
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("my_scans", lambda request: [f"user-scans:{request.user.id}"], per_user=True)
 def my_scans(request):
-    scans = MRIScan.objects.filter(uploaded_by=request.user).order_by("-created_at")
-    data = [{
-        "id": s.id,
-        "patient_uid": s.patient.patient_uid,
-        "patient_name": s.patient.full_name,
-        "tumor_type": s.tumor_type,
-        "confidence": s.confidence,
-        "clinical_reasoning": s.clinical_reasoning,
-        "status": s.status,
-        "scan_date": s.scan_date,
-        "mri_image_url": s.mri_image_url,
-    } for s in scans]
-    return Response(data)
+    params = request.query_params
+    summary = wants_summary(params)
+    scans = (
+        MRIScan.objects
+        .filter(uploaded_by=request.user)
+        .select_related("patient")
+        .only(*scan_list_fields(summary), "patient__full_name", "patient__patient_uid")
+    )
+    try:
+        scans, next_cursor = paginate(filter_scans(scans, params, allow_uploader=False), params)
+    except ListQueryError as e:
+        return Response({"error": str(e)}, status=400)
+
+    data = []
+    for s in scans:
+        row = {
+            "id": s.id,
+            "patient_uid": s.patient.patient_uid,
+            "patient_name": s.patient.full_name,
+            "tumor_type": s.tumor_type,
+            "confidence": s.confidence,
+            "status": s.status,
+            "scan_date": s.scan_date,
+            "mri_image_url": s.mri_image_url,
+            "thumbnail_url": s.thumbnail_url,
+        }
+        if not summary:
+            row["clinical_reasoning"] = s.clinical_reasoning
+        data.append(row)
+    return Response(page_response(data, next_cursor))
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -243,11 +739,85 @@ def doctor_registry(request):
         profile = getattr(request.user, 'profile', None)
         if not profile or profile.role.upper() != 'DOCTOR':
             return Response({"error": "Physician access required"}, status=403)
-        patients = Patient.objects.annotate(activity_count=Count('scans')).order_by('-created_at')
+        try:
+            # scan_count is materialized (patients.stats); no COUNT over scans.
+            patients, next_cursor = paginate(Patient.objects.all(), request.query_params)
+        except ListQueryError as e:
+            return Response({"error": str(e)}, status=400)
         data = [{
             "id": p.id, "uid": p.patient_uid, "name": p.full_name, "age": p.age, "sex": p.gender,
-            "activity": p.activity_count, "joined": p.created_at.strftime("%Y.%m.%d") if p.created_at else "N/A",
+            "activity": p.scan_count, "joined": p.created_at.strftime("%Y.%m.%d") if p.created_at else "N/A",
         } for p in patients]
-        return Response(data, status=200)
+        return Response(page_response(data, next_cursor), status=200)
     except Exception as e:
-        return Response({"error": "Internal Server Error", "details": str(e)}, status=500)
\ No newline at end of file
+        return Response({"error": "Internal Server Error", "details": str(e)}, status=500)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def scan_stats(request):
+    """
+    Tumor-type distribution and daily scan volume with average confidence,
+    read from the materialized totals (patients.stats). ?days= (1-365,
+    default 30) sets how many days of volume are returned.
+    """
+    try:
+        days = int(request.query_params.get("days", 30))
+    except ValueError:
+        return Response({"error": "days must be an integer"}, status=400)
+    if not 1 <= days <= 365:
+        return Response({"error": "days must be between 1 and 365"}, status=400)
+    return Response(stats_summary(days))
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def cache_stats(request):
+    """Hit / miss / 304 counts of the response cache in this process."""
+    return Response(response_cache_stats())
+
+
+# =========================================================
+# LOCAL IMAGE STORAGE
+# =========================================================
+
+@require_GET
+def serve_media(request, folder, key):
+    """
+    Serves an image stored by the local backend (patients.storage). The
+    name is the content hash, so the response never changes: it is
+    cacheable forever and If-None-Match always matches. Supports a single
+    Range ("bytes=start-end") for partial downloads.
+    """
+    storage = get_storage()
+    path = storage.path(folder, key) if isinstance(storage, LocalStorage) else None
+    if path is None or not path.is_file():
+        raise Http404("Image not found")
+
+    etag = f'"{key}"'
+    if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        content_type = sniff_content_type(f.read(16))
+
+    try:
+        byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(path, start, end), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
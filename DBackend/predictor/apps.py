@@ -1,5 +1,20 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class PredictorConfig(AppConfig):
     name = 'predictor'
+
+    def ready(self):
+        # Off by default: ready() also runs for migrate, shell, etc.
+        # Enable on web workers so the first upload is not the one that
+        # pays for loading and tracing the CNN.
+        if settings.PREDICTOR_WARMUP_ON_STARTUP:
+            from .utils import warm_up_model
+
+            timings = warm_up_model()
+            logger.info("Predictor warm-up complete: %s", timings)
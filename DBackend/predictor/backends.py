@@ -0,0 +1,162 @@
+"""
+Inference backends for the tumour classifier.
+
+Each backend owns one loaded model and exposes `infer(batch)`, taking an
+(N, 128, 128, 3) float32 array in [0, 1] and returning the (N, 4) softmax
+matrix. TensorFlow is only imported by the backend that needs it, so a
+worker running the TFLite backend never pays for the full TF runtime.
+"""
+import threading
+
+import numpy as np
+
+from .preprocessing import IMAGE_SIZE
+
+INPUT_SHAPE = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+
+KERAS_MODES = ("predict", "direct", "compiled")
+
+
+class KerasBackend:
+    """
+    Runs the original .h5 model with TensorFlow/Keras.
+
+    mode:
+    - "predict":  model.predict(), the generic Keras loop.
+    - "direct":   model(x, training=False), skipping predict()'s per-call
+                  setup; fastest for single images in eager mode.
+    - "compiled": a tf.function traced once over a fixed
+                  (None, 128, 128, 3) float32 signature.
+    """
+    name = "keras"
+
+    def __init__(self, model_path, mode="compiled"):
+        if mode not in KERAS_MODES:
+            raise ValueError(f"Unknown Keras inference mode: {mode!r}")
+        self.model_path = model_path
+        self.mode = mode
+        self.model = None
+        self._infer = None
+
+    def load(self):
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+
+        model = load_model(self.model_path, compile=False)
+
+        if self.mode == "compiled":
+            @tf.function(
+                input_signature=[tf.TensorSpec([None, *INPUT_SHAPE], tf.float32)],
+                reduce_retracing=True,
+            )
+            def forward(batch):
+                return model(batch, training=False)
+
+            def infer(batch):
+                return forward(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+        elif self.mode == "direct":
+            def infer(batch):
+                return np.asarray(model(batch, training=False))
+        else:
+            def infer(batch):
+                return model.predict(batch, batch_size=len(batch), verbose=0)
+
+        self.model = model
+        self._infer = infer
+        return self
+
+    def infer(self, batch):
+        return self._infer(batch)
+
+
+def _load_tflite_interpreter(model_path, num_threads):
+    """
+    Prefers the standalone LiteRT / tflite-runtime interpreters, which do
+    not pull in TensorFlow, and falls back to tf.lite when neither is
+    installed.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class TFLiteBackend:
+    """
+    Runs a converted .tflite model (float32, float16 or int8 quantised).
+
+    The interpreter is not thread-safe, so calls are serialised; batching
+    upstream (MicroBatcher) keeps that from becoming a bottleneck. Quantised
+    input/output tensors are (de)quantised with their own scale and
+    zero point.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.interpreter = None
+        self._lock = threading.Lock()
+        self._batch_size = None
+
+    def load(self):
+        self.interpreter = _load_tflite_interpreter(self.model_path, self.num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        return self
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input["index"], [batch_size, *INPUT_SHAPE])
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def infer(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+
+        with self._lock:
+            self._resize(len(batch))
+
+            dtype = self._input["dtype"]
+            if dtype != np.float32:
+                scale, zero_point = self._input["quantization"]
+                batch = np.clip(np.round(batch / scale + zero_point), *_int_range(dtype)).astype(dtype)
+
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            preds = self.interpreter.get_tensor(self._output["index"])
+
+            if self._output["dtype"] != np.float32:
+                scale, zero_point = self._output["quantization"]
+                preds = (preds.astype(np.float32) - zero_point) * scale
+            return np.array(preds, dtype=np.float32)
+
+
+def _int_range(dtype):
+    info = np.iinfo(dtype)
+    return info.min, info.max
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+
+def create_backend(name, model_path, **options):
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown predictor backend: {name!r}") from None
+    return backend_class(model_path, **options)
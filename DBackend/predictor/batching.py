@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("array", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, array):
+        self.array = array
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collects single-image requests from concurrent callers and runs them
+    through the model as one batch.
+
+    A batch is flushed when it reaches `max_batch_size` images or when the
+    oldest request has waited `max_wait_ms`, whichever comes first.
+    `infer_fn` receives an (N, H, W, C) array and must return N rows.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=16, max_wait_ms=10):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reset_stats()
+
+    # ---------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------
+
+    def submit(self, array, timeout=None):
+        """
+        Queues one preprocessed image (H, W, C) and blocks until its
+        prediction row is available.
+        """
+        self._ensure_started()
+        request = _Request(array)
+        self._queue.put(request)
+
+        if not request.done.wait(timeout):
+            raise TimeoutError("Inference batch did not complete in time")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self):
+        with self._lock:
+            batches = self._batches
+            images = self._images
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": batches,
+                "images": images,
+                "avg_batch_size": round(images / batches, 2) if batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "batch_size_histogram": dict(self._batch_size_histogram),
+                "avg_queue_wait_ms": round(self._queue_wait_total / images * 1000.0, 3) if images else 0.0,
+                "max_queue_wait_ms": round(self._queue_wait_max * 1000.0, 3),
+                "avg_inference_ms": round(self._inference_total / batches * 1000.0, 3) if batches else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    # ---------------------------------------------------------
+    # Worker
+    # ---------------------------------------------------------
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._images = 0
+        self._largest_batch = 0
+        self._batch_size_histogram = {}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._inference_total = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="predictor-microbatcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Still drain whatever is already waiting, without blocking.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            try:
+                preds = self.infer_fn(np.stack([r.array for r in batch]))
+                if len(preds) != len(batch):
+                    # zip() would leave the unmatched callers waiting forever.
+                    raise ValueError(f"Model returned {len(preds)} rows for a batch of {len(batch)}")
+                for request, row in zip(batch, preds):
+                    request.result = row
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finished = time.perf_counter()
+
+            self._record(batch, started, finished)
+            for request in batch:
+                request.done.set()
+
+    def _record(self, batch, started, finished):
+        size = len(batch)
+        with self._lock:
+            self._batches += 1
+            self._images += size
+            self._largest_batch = max(self._largest_batch, size)
+            self._batch_size_histogram[size] = self._batch_size_histogram.get(size, 0) + 1
+            self._inference_total += finished - started
+            for request in batch:
+                wait = started - request.enqueued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
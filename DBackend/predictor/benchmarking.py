@@ -0,0 +1,71 @@
+"""
+Helpers shared by the predictor benchmark commands.
+"""
+import os
+import resource
+
+import numpy as np
+
+
+def _proc_status_mb(field, pid="self"):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """Current resident set size of this process, in MB."""
+    current = _proc_status_mb("VmRSS")
+    return current if current is not None else peak_rss_mb()
+
+
+def peak_rss_mb():
+    """High-water mark of this process's RSS, in MB."""
+    # VmHWM is reset by exec(); ru_maxrss can carry over the parent's peak
+    # into spawned children, so it is only the fallback.
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is KB on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if peak > 10 ** 9 else peak / 1024.0
+
+
+def _child_pids(pid):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def process_tree_rss_mb(pid):
+    """
+    Summed RSS of `pid` and all its descendants (e.g. a gunicorn master and
+    its workers), in MB. None where /proc is not available.
+    """
+    total = _proc_status_mb("VmRSS", pid)
+    if total is None:
+        return None
+    for child in _child_pids(pid):
+        total += process_tree_rss_mb(child) or 0.0
+    return total
+
+
+def summarize_ms(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        "count": int(samples.size),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+    }
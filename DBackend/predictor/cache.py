@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.db import IntegrityError
+
+
+def hash_file(file):
+    """
+    SHA-256 of an uploaded file's bytes. The file pointer is rewound so the
+    caller can still decode / upload it afterwards.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    if hasattr(file, "chunks"):
+        for chunk in file.chunks():
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Content-addressed CNN result cache.
+
+    Entries are keyed by (content hash, model version) and hold
+    (label, confidence, probabilities). The in-memory tier is an LRU of
+    `max_entries`; when `persistent` is set, misses fall through to the
+    PredictionRecord table and new results are written there too, so they
+    survive worker restarts and are shared between processes.
+    """
+
+    def __init__(self, max_entries=1024, persistent=False):
+        self.max_entries = max(0, int(max_entries))
+        self.persistent = persistent
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, content_hash, model_version):
+        key = (content_hash, model_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+
+        if self.persistent:
+            entry = self._load(content_hash, model_version)
+            if entry is not None:
+                with self._lock:
+                    self._persistent_hits += 1
+                self._remember(key, entry)
+                return entry
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, content_hash, model_version, label, confidence, probabilities):
+        entry = (label, confidence, [float(p) for p in probabilities])
+        self._remember((content_hash, model_version), entry)
+        if self.persistent:
+            self._store(content_hash, model_version, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._persistent_hits + self._misses
+            hits = self._hits + self._persistent_hits
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self.persistent,
+                "hits": self._hits,
+                "persistent_hits": self._persistent_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # ---------------------------------------------------------
+    # Tiers
+    # ---------------------------------------------------------
+
+    def _remember(self, key, entry):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _load(self, content_hash, model_version):
+        from .models import PredictionRecord
+
+        record = (
+            PredictionRecord.objects
+            .filter(content_hash=content_hash, model_version=model_version)
+            .only("tumor_type", "confidence", "probabilities")
+            .first()
+        )
+        if record is None:
+            return None
+        return record.tumor_type, record.confidence, record.probabilities
+
+    def _store(self, content_hash, model_version, entry):
+        from .models import PredictionRecord
+
+        label, confidence, probabilities = entry
+        try:
+            PredictionRecord.objects.get_or_create(
+                content_hash=content_hash,
+                model_version=model_version,
+                defaults={
+                    "tumor_type": label,
+                    "confidence": confidence,
+                    "probabilities": probabilities,
+                },
+            )
+        except IntegrityError:
+            # Another worker stored the same image first.
+            pass
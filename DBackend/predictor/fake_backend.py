@@ -0,0 +1,32 @@
+"""
+Stand-in inference backend for the worker pool tests.
+
+Runs in the spawned worker processes, so it only depends on numpy. Every
+image gets the same softmax row; an image whose first pixel is
+CRASH_PIXEL makes the worker process exit on the spot, the way a
+segfault or an OOM kill would.
+"""
+import os
+import time
+
+import numpy as np
+
+CRASH_PIXEL = -1.0
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def load(self):
+        return self
+
+    def infer(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        if (batch[:, 0, 0, 0] == CRASH_PIXEL).any():
+            os._exit(1)
+        if self.delay:
+            time.sleep(self.delay)
+        return np.tile(np.array([0.7, 0.1, 0.1, 0.1], dtype=np.float32), (len(batch), 1))
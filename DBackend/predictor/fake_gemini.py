@@ -0,0 +1,138 @@
+"""
+Minimal local stand-in for the Gemini generateContent REST API.
+
+Used by the tests and load tests: point GEMINI_BASE_URL at
+`FakeGeminiServer().url` and the real google-genai client talks to it.
+The server's `mode` controls the next responses:
+
+- "ok":    200 with `text` as the model output
+- "quota": 429 RESOURCE_EXHAUSTED
+- "error": 500 INTERNAL
+Requests are counted per model in `calls`, and `delay` (seconds) is
+applied before every response.
+
+streamGenerateContent is answered as server-sent events, one chunk per
+line of `text` with `chunk_delay` seconds between chunks. In "midstream"
+mode the stream breaks off after the first chunk.
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_MODEL_PATH = re.compile(r"/models/([^/:]+):(generateContent|streamGenerateContent)")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeGemini/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+
+        match = _MODEL_PATH.search(self.path)
+        model = match.group(1) if match else "unknown"
+        streaming = bool(match) and match.group(2) == "streamGenerateContent"
+        with fake.lock:
+            fake.calls[model] += 1
+            mode, text, delay, chunk_delay = fake.mode, fake.text, fake.delay, fake.chunk_delay
+
+        if delay:
+            time.sleep(delay)
+
+        if mode == "quota":
+            return self._send_json(429, {"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED",
+            }})
+        if mode == "error":
+            return self._send_json(500, {"error": {
+                "code": 500, "message": "Internal error", "status": "INTERNAL",
+            }})
+
+        if streaming:
+            return self._send_stream(text, chunk_delay, midstream_error=(mode == "midstream"))
+        self._send_json(200, _response(text))
+
+    def _send_stream(self, text, chunk_delay, midstream_error=False):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = text.splitlines(keepends=True) or [text]
+        for i, chunk in enumerate(chunks):
+            if i and chunk_delay:
+                time.sleep(chunk_delay)
+            if i and midstream_error:
+                # Drop the connection without finishing the stream.
+                return
+            last = i == len(chunks) - 1
+            self.wfile.write(b"data: " + json.dumps(_response(chunk, finished=last)).encode() + b"\r\n\r\n")
+            self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _response(text, finished=True):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+class FakeGeminiServer:
+
+    def __init__(self, host="127.0.0.1", port=0, text="* Surgery: Craniotomy - Tumor resection."):
+        self.mode = "ok"
+        self.text = text
+        self.delay = 0.0
+        self.chunk_delay = 0.0
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset(self, mode="ok"):
+        with self.lock:
+            self.mode = mode
+            self.calls.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,440 @@
+"""
+Long-lived Gemini client with client-side flow control.
+
+One GeminiClientManager per process holds a single genai.Client (so the
+underlying HTTP connection pool is reused) and guards every call with:
+
+- a token bucket sized to our quota (GEMINI_RATE_PER_MINUTE / GEMINI_BURST),
+  so we stop sending before Google starts answering 429;
+- a circuit breaker that opens on a 429 (for at least the server's
+  retryDelay) or after GEMINI_BREAKER_THRESHOLD consecutive failures, and
+  short-circuits callers to the fallback text while open;
+- retries of transient errors (5xx, timeouts) with jittered exponential
+  backoff. Quota errors are never retried and never sent to the fallback
+  model.
+
+`generate` is the blocking entry point; `agenerate` is the same call for
+async views, going through the client's `aio` interface and sharing the
+same bucket, breaker and counters. `generate_stream` yields the answer
+chunk by chunk for server-sent events.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from google import genai
+from google.genai import errors, types
+
+
+class GeminiError(Exception):
+    """Base class for Gemini failures that callers turn into fallback text."""
+
+
+class GeminiQuotaExceeded(GeminiError):
+    pass
+
+
+class GeminiCircuitOpen(GeminiError):
+    def __init__(self, retry_after, quota=False):
+        super().__init__(f"Gemini circuit open for another {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.quota = quota
+
+
+class GeminiUnavailable(GeminiError):
+    pass
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most
+    `capacity`.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Takes a token if one is available; otherwise returns the wait in seconds."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate if self.rate else float("inf")
+
+    def acquire(self, timeout=0.0):
+        deadline = self.clock() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if self.clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout=0.0):
+        deadline = self.clock() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if self.clock() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_until = 0.0
+        self._quota = False
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self.clock() >= self._opened_until:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raises GeminiCircuitOpen unless a call may go out now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            now = self.clock()
+            if self._state == self.OPEN and now < self._opened_until:
+                raise GeminiCircuitOpen(self._opened_until - now, self._quota)
+            # Half-open: let exactly one probe through.
+            if self._probe_in_flight:
+                raise GeminiCircuitOpen(0.0, self._quota)
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        """Gives back a half-open probe slot that was not used."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._quota = False
+            self._probe_in_flight = False
+
+    def record_failure(self, open_for=None, quota=False):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if quota or open_for is not None or self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._quota = quota
+                self._opened_until = self.clock() + max(self.reset_timeout, open_for or 0.0)
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self._failures}
+
+
+_RETRY_DELAY = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+def _error_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    message = str(error)
+    if "RESOURCE_EXHAUSTED" in message or "429" in message:
+        return 429
+    return None
+
+
+def _retry_delay(error):
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def _is_transient(error):
+    code = _error_code(error)
+    if code is not None:
+        return code >= 500 or code in (408,)
+    # Network-level failures (connection reset, read timeout) carry no code.
+    return not isinstance(error, errors.APIError)
+
+
+class GeminiClientManager:
+
+    def __init__(self, api_key, base_url="", timeout=30.0, rate_per_minute=60, burst=10,
+                 rate_limit_wait=0.0, breaker_threshold=5, breaker_reset=30.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0):
+        http_options = {"timeout": int(timeout * 1000)}
+        if base_url:
+            http_options["base_url"] = base_url
+        self.client = genai.Client(api_key=api_key, http_options=types.HttpOptions(**http_options))
+
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.rate_limit_wait = rate_limit_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0,
+                       "rate_limited": 0, "short_circuited": 0, "quota_errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "breaker": self.breaker.stats()}
+
+    def _backoff(self, attempt):
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)].
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_breaker(self):
+        try:
+            self.breaker.before_call()
+        except GeminiCircuitOpen:
+            self._count("short_circuited")
+            raise
+
+    def _rate_limited(self):
+        self._count("rate_limited")
+        self.breaker.release_probe()
+        return GeminiQuotaExceeded("Local Gemini rate limit reached")
+
+    def _admit(self):
+        self._check_breaker()
+        if not self.bucket.acquire(self.rate_limit_wait):
+            raise self._rate_limited()
+
+    async def _aadmit(self):
+        self._check_breaker()
+        if not await self.bucket.aacquire(self.rate_limit_wait):
+            raise self._rate_limited()
+
+    def _take_token(self):
+        # Retries and the fallback call are outbound requests too; they go
+        # out only if the bucket has a token right now, without waiting.
+        if self.bucket.try_acquire() == 0.0:
+            return True
+        self._count("rate_limited")
+        return False
+
+    def _succeeded(self, response):
+        self.breaker.record_success()
+        self._count("successes")
+        return response.text.strip()
+
+    def _raise_if_quota(self, error, count_failure=True):
+        if _error_code(error) == 429:
+            self._count("quota_errors")
+            if count_failure:
+                self._count("failures")
+            self.breaker.record_failure(open_for=_retry_delay(error), quota=True)
+            raise GeminiQuotaExceeded(str(error)) from error
+
+    def _unavailable(self, error):
+        self.breaker.record_failure()
+        return GeminiUnavailable(str(error))
+
+    def generate(self, prompt, model, config=None, fallback_model=None):
+        """
+        Returns the response text. Raises GeminiQuotaExceeded,
+        GeminiCircuitOpen or GeminiUnavailable.
+        """
+        self._admit()
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+                if not self._take_token():
+                    break
+                self._count("retries")
+            self._count("calls")
+            try:
+                response = self.client.models.generate_content(model=model, contents=prompt, config=config)
+                return self._succeeded(response)
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e)
+                if not _is_transient(e):
+                    break
+
+        self._count("failures")
+        if fallback_model and self._take_token():
+            self._count("calls")
+            try:
+                response = self.client.models.generate_content(model=fallback_model, contents=prompt)
+                return self._succeeded(response)
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e, count_failure=False)
+
+        raise self._unavailable(last_error) from last_error
+
+    def generate_stream(self, prompt, model, config=None, fallback_model=None):
+        """
+        Yields text chunks as Gemini produces them, under the same flow
+        control as generate(). Failures before the first chunk are retried
+        and sent to the fallback model; once text has been yielded a
+        failure raises GeminiUnavailable, as a retry would repeat output
+        the caller already has.
+        """
+        self._admit()
+        try:
+            yield from self._generate_stream(prompt, model, config, fallback_model)
+        except GeneratorExit:
+            # Consumer went away (client disconnected); free a half-open probe.
+            self.breaker.release_probe()
+            raise
+
+    def _stream_chunks(self, model, prompt, config, progress):
+        finished = False
+        for chunk in self.client.models.generate_content_stream(model=model, contents=prompt, config=config):
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finished = True
+            text = chunk.text
+            if text:
+                progress["emitted"] = True
+                yield text
+        # A dropped connection ends the iterator quietly; only the final
+        # chunk carries a finish reason.
+        if not finished:
+            raise GeminiUnavailable("Gemini stream ended without a finish reason")
+
+    def _generate_stream(self, prompt, model, config, fallback_model):
+        progress = {"emitted": False}
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+                if not self._take_token():
+                    break
+                self._count("retries")
+            self._count("calls")
+            try:
+                yield from self._stream_chunks(model, prompt, config, progress)
+                self.breaker.record_success()
+                self._count("successes")
+                return
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e)
+                if progress["emitted"] or not _is_transient(e):
+                    break
+
+        self._count("failures")
+        if fallback_model and not progress["emitted"] and self._take_token():
+            self._count("calls")
+            try:
+                yield from self._stream_chunks(fallback_model, prompt, None, progress)
+                self.breaker.record_success()
+                self._count("successes")
+                return
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e, count_failure=False)
+
+        raise self._unavailable(last_error) from last_error
+
+    async def agenerate(self, prompt, model, config=None, fallback_model=None):
+        """
+        Async twin of generate(): waits on the event loop instead of a
+        thread, so a slow Gemini response holds no worker while pending.
+        Cancelling the awaiting task aborts the HTTP request.
+        """
+        await self._aadmit()
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1))
+                if not self._take_token():
+                    break
+                self._count("retries")
+            self._count("calls")
+            try:
+                response = await self.client.aio.models.generate_content(model=model, contents=prompt, config=config)
+                return self._succeeded(response)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e)
+                if not _is_transient(e):
+                    break
+
+        self._count("failures")
+        if fallback_model and self._take_token():
+            self._count("calls")
+            try:
+                response = await self.client.aio.models.generate_content(model=fallback_model, contents=prompt)
+                return self._succeeded(response)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                last_error = e
+                self._raise_if_quota(e, count_failure=False)
+
+        raise self._unavailable(last_error) from last_error
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_gemini():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = GeminiClientManager(
+                    api_key=settings.GEMINI_API_KEY,
+                    base_url=settings.GEMINI_BASE_URL,
+                    timeout=settings.GEMINI_TIMEOUT,
+                    rate_per_minute=settings.GEMINI_RATE_PER_MINUTE,
+                    burst=settings.GEMINI_BURST,
+                    rate_limit_wait=settings.GEMINI_RATE_LIMIT_WAIT,
+                    breaker_threshold=settings.GEMINI_BREAKER_THRESHOLD,
+                    breaker_reset=settings.GEMINI_BREAKER_RESET,
+                    max_retries=settings.GEMINI_MAX_RETRIES,
+                    backoff_base=settings.GEMINI_BACKOFF_BASE,
+                    backoff_max=settings.GEMINI_BACKOFF_MAX,
+                )
+    return _manager
+
+
+def reset_gemini():
+    """Drops the process-wide manager (settings changed, tests)."""
+    global _manager
+    with _manager_lock:
+        _manager = None
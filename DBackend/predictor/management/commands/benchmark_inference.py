@@ -0,0 +1,312 @@
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor.backends import INPUT_SHAPE, KERAS_MODES, create_backend
+from predictor.benchmarking import peak_rss_mb, rss_mb, summarize_ms
+from predictor.preprocessing import new_batch, preprocess_batch, preprocess_image
+from predictor.utils import CLASS_LABELS, MODEL_PATH, decode_prediction
+from .benchmark_preprocessing import make_images
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+# Compared by --compare: (section, metric, True if higher is better).
+COMPARED = [
+    ("load", "load_ms", False),
+    ("single_image", "p50_ms", False),
+    ("single_image", "p95_ms", False),
+    ("single_image", "p99_ms", False),
+    ("end_to_end", "p50_ms", False),
+    ("preprocessing", "p50_ms", False),
+    ("memory", "peak_rss_mb", False),
+]
+
+
+def build_standin_model(path, seed=0):
+    """
+    Saves a small randomly initialised CNN with the real model's input and
+    output shapes to `path` (.h5), so the suite runs without the trained
+    weights. Same seed, same weights.
+    """
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=INPUT_SHAPE),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Conv2D(32, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Conv2D(64, 3, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(64, activation="relu"),
+        tf.keras.layers.Dense(len(CLASS_LABELS), activation="softmax"),
+    ])
+    model.save(path)
+    return model.count_params()
+
+
+def time_single(backend, images, iterations):
+    """Latency of one-image infer() calls, cycling through `images`."""
+    latencies = []
+    for i in range(iterations):
+        row = images[i % len(images)][np.newaxis, ...]
+        started = time.perf_counter()
+        backend.infer(row)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return summarize_ms(latencies)
+
+
+def time_batches(backend, images, batch_sizes, min_images):
+    """
+    Throughput per batch size. Each size runs one untimed warm-up batch
+    (new shapes retrace/reallocate), then at least `min_images` images.
+    """
+    results = []
+    for size in batch_sizes:
+        batch = np.resize(images, (size, *images.shape[1:]))
+        backend.infer(batch)
+
+        rounds = max(1, -(-min_images // size))
+        latencies = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            backend.infer(batch)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+        results.append({
+            "batch_size": size,
+            "images_per_s": round(size * rounds * 1000.0 / sum(latencies), 1),
+            **summarize_ms(latencies),
+        })
+    return results
+
+
+def time_preprocessing(blobs, iterations):
+    single = []
+    for i in range(iterations):
+        file = BytesIO(blobs[i % len(blobs)])
+        started = time.perf_counter()
+        preprocess_image(file)
+        single.append((time.perf_counter() - started) * 1000.0)
+
+    buffer = new_batch(len(blobs))
+    started = time.perf_counter()
+    preprocess_batch([BytesIO(blob) for blob in blobs], out=buffer)
+    batched = (time.perf_counter() - started) * 1000.0
+    return {**summarize_ms(single), "batched_per_image_ms": round(batched / len(blobs), 3)}
+
+
+def time_end_to_end(backend, blobs, iterations):
+    """Decode + preprocess + infer + label, i.e. predict_image() on a cache miss."""
+    latencies = []
+    for i in range(iterations):
+        file = BytesIO(blobs[i % len(blobs)])
+        started = time.perf_counter()
+        probs = backend.infer(preprocess_image(file)[np.newaxis, ...])[0]
+        decode_prediction(probs)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return summarize_ms(latencies)
+
+
+def run_suite(backend_name, model_path, backend_options, blobs, config):
+    """
+    Runs in a fresh process so import and load cost and the RSS
+    high-water mark belong to this backend alone.
+    """
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    backend = create_backend(backend_name, model_path, **backend_options).load()
+    load_ms = (time.perf_counter() - started) * 1000.0
+    rss_loaded = rss_mb()
+
+    images = preprocess_batch([BytesIO(blob) for blob in blobs])
+    started = time.perf_counter()
+    backend.infer(images[:1])
+    first_ms = (time.perf_counter() - started) * 1000.0
+    for _ in range(config["warmup"]):
+        backend.infer(images[:1])
+
+    return {
+        "load": {
+            "load_ms": round(load_ms, 2),
+            "first_inference_ms": round(first_ms, 2),
+        },
+        "single_image": time_single(backend, images, config["iterations"]),
+        "batches": time_batches(backend, images, config["batch_sizes"], config["batch_images"]),
+        "preprocessing": time_preprocessing(blobs, config["iterations"]),
+        "end_to_end": time_end_to_end(backend, blobs, config["iterations"]),
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_loaded_mb": round(rss_loaded, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        },
+    }
+
+
+def compare_results(baseline, current):
+    """[(metric, baseline, current, % change, regressed)] for COMPARED metrics and throughput."""
+    rows = []
+
+    def add(name, before, after, higher_is_better):
+        if before is None or after is None or not before:
+            return
+        change = (after - before) * 100.0 / before
+        rows.append((name, before, after, round(change, 1), change < 0 if higher_is_better else change > 0))
+
+    for section, metric, higher_is_better in COMPARED:
+        add(f"{section}.{metric}", baseline.get(section, {}).get(metric),
+            current.get(section, {}).get(metric), higher_is_better)
+
+    before = {b["batch_size"]: b["images_per_s"] for b in baseline.get("batches", [])}
+    for batch in current.get("batches", []):
+        add(f"batch_{batch['batch_size']}.images_per_s", before.get(batch["batch_size"]),
+            batch["images_per_s"], True)
+    return rows
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(settings.BASE_DIR),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    versions = {"python": platform.python_version(), "numpy": np.__version__}
+    try:
+        from importlib.metadata import version
+
+        versions["tensorflow"] = version("tensorflow")
+    except Exception:
+        versions["tensorflow"] = None
+    return {
+        "commit": git_commit(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the predictor: model load time, single-image latency (p50/p95/p99), "
+        "batched throughput, preprocessing cost, end-to-end latency and peak RSS, on "
+        "synthetic images. Uses a small generated stand-in model unless --model or "
+        "--real-model is given, so it runs on any CPU box. Write --json and pass it to "
+        "--compare on a later run to diff commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", default="keras", choices=("keras", "tflite"))
+        parser.add_argument("--mode", default=settings.PREDICTOR_INFERENCE_MODE, choices=KERAS_MODES,
+                            help="Keras inference mode.")
+        parser.add_argument("--model", help="Model file to benchmark instead of the stand-in.")
+        parser.add_argument("--real-model", action="store_true", help=f"Benchmark {os.path.basename(MODEL_PATH)}.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the stand-in model and images.")
+        parser.add_argument("--iterations", type=int, default=200, help="Timed single-image runs.")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed single-image runs first.")
+        parser.add_argument("--batch-size", type=int, action="append", dest="batch_sizes",
+                            help=f"Batch size (repeatable). Default: {', '.join(map(str, BATCH_SIZES))}.")
+        parser.add_argument("--batch-images", type=int, default=256,
+                            help="Images timed per batch size.")
+        parser.add_argument("--image-size", type=int, default=512, help="Edge of the synthetic source images.")
+        parser.add_argument("--images", type=int, default=16, help="Distinct synthetic images.")
+        parser.add_argument("--json", dest="json_path", help="Write the results to this file.")
+        parser.add_argument("--compare", help="Earlier --json output to diff against.")
+
+    def handle(self, *args, **options):
+        if options["backend"] == "tflite" and not options["model"]:
+            raise CommandError("--backend tflite needs --model pointing at a .tflite file")
+        config = {
+            "backend": options["backend"],
+            "mode": options["mode"] if options["backend"] == "keras" else None,
+            "iterations": options["iterations"],
+            "warmup": options["warmup"],
+            "batch_sizes": options["batch_sizes"] or BATCH_SIZES,
+            "batch_images": options["batch_images"],
+            "image_size": options["image_size"],
+            "images": options["images"],
+            "seed": options["seed"],
+        }
+        backend_options = {"mode": options["mode"]} if options["backend"] == "keras" else {
+            "num_threads": settings.PREDICTOR_TFLITE_THREADS,
+        }
+        ctx = multiprocessing.get_context("spawn")
+
+        with tempfile.TemporaryDirectory() as folder:
+            model = {"path": options["model"], "standin": False, "parameters": None}
+            if options["real_model"]:
+                model["path"] = MODEL_PATH
+            elif not options["model"]:
+                model = {"path": os.path.join(folder, "standin.h5"), "standin": True}
+                self.stdout.write("Building stand-in model...")
+                with ctx.Pool(1) as pool:
+                    model["parameters"] = pool.apply(build_standin_model, (model["path"], options["seed"]))
+            model["size_bytes"] = os.path.getsize(model["path"])
+
+            blobs = []
+            for path in make_images(folder, [options["image_size"]], options["images"])[f"JPEG {options['image_size']}px"]:
+                with open(path, "rb") as f:
+                    blobs.append(f.read())
+
+            self.stdout.write(f"Benchmarking {options['backend']} on {os.path.basename(model['path'])}...")
+            with ctx.Pool(1, maxtasksperchild=1) as pool:
+                results = pool.apply(run_suite, (options["backend"], model["path"], backend_options, blobs, config))
+
+        model["path"] = None if model["standin"] else model["path"]
+        report = {"environment": environment(), "config": config, "model": model, **results}
+        self.report(report)
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.report_comparison(json.load(f), report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def report(self, r):
+        single, e2e, pre = r["single_image"], r["end_to_end"], r["preprocessing"]
+        self.stdout.write("")
+        self.stdout.write(f"Model load:      {r['load']['load_ms']:.1f} ms "
+                          f"(first inference {r['load']['first_inference_ms']:.1f} ms)")
+        for label, s in (("Single image:", single), ("End to end:", e2e), ("Preprocessing:", pre)):
+            self.stdout.write(
+                f"{label:<16} p50 {s['p50_ms']:.2f} ms  p95 {s['p95_ms']:.2f} ms  p99 {s['p99_ms']:.2f} ms"
+            )
+        self.stdout.write(f"Batched preprocessing: {pre['batched_per_image_ms']:.2f} ms/image")
+        self.stdout.write(
+            f"Memory:          {r['memory']['rss_loaded_mb']:.1f} MB after load, "
+            f"{r['memory']['peak_rss_mb']:.1f} MB peak"
+        )
+
+        header = f"{'batch':>6} {'images/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for b in r["batches"]:
+            self.stdout.write(
+                f"{b['batch_size']:>6} {b['images_per_s']:>10.1f} {b['p50_ms']:>9.2f} "
+                f"{b['p95_ms']:>9.2f} {b['p99_ms']:>9.2f}"
+            )
+
+    def report_comparison(self, baseline, current):
+        commit = baseline.get("environment", {}).get("commit") or "baseline"
+        self.stdout.write("")
+        self.stdout.write(f"Compared with {commit}:")
+        for name, before, after, change, regressed in compare_results(baseline, current):
+            line = f"  {name:<32} {before:>10.2f} -> {after:>10.2f}  {change:+.1f}%"
+            self.stdout.write(self.style.WARNING(line) if regressed else line)
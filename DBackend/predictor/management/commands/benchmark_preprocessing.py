@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from predictor.benchmarking import peak_rss_mb, rss_mb, summarize_ms
+from predictor.preprocessing import IMAGE_SIZE, new_batch, preprocess_batch
+
+
+def legacy_preprocess(file):
+    """The original predict_image() preprocessing, kept as the baseline."""
+    img = Image.open(file).convert("RGB")
+    img = img.resize(IMAGE_SIZE)
+    img_array = np.array(img).astype("float32") / 255.0
+    return img_array.reshape(1, 128, 128, 3)
+
+
+def run_method(method, paths, repeats):
+    """
+    Runs in a fresh process so the RSS high-water mark belongs to a single
+    method.
+    """
+    baseline = rss_mb()
+    latencies = []
+
+    if method == "legacy":
+        for _ in range(repeats):
+            for path in paths:
+                t0 = time.perf_counter()
+                legacy_preprocess(path)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+    elif method == "pipeline":
+        buffer = new_batch(1)
+        for _ in range(repeats):
+            for path in paths:
+                t0 = time.perf_counter()
+                preprocess_batch([path], out=buffer)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+    else:  # pipeline-batch: all files into one preallocated array
+        buffer = new_batch(len(paths))
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            preprocess_batch(paths, out=buffer)
+            per_image = (time.perf_counter() - t0) * 1000.0 / len(paths)
+            latencies.extend([per_image] * len(paths))
+
+    return {**summarize_ms(latencies), "peak_rss_delta_mb": round(peak_rss_mb() - baseline, 1)}
+
+
+def make_images(folder, sizes, count):
+    rng = np.random.default_rng(0)
+    paths = {}
+    for size in sizes:
+        for fmt, ext in (("JPEG", "jpg"), ("PNG", "png")):
+            group = []
+            for i in range(count):
+                # Smooth gradient plus noise: compresses like a real scan
+                # rather than like pure noise.
+                y, x = np.mgrid[0:size, 0:size]
+                base = ((x + y) * 255 // (2 * size)).astype(np.uint8)
+                noise = rng.integers(0, 32, (size, size), dtype=np.uint8)
+                pixels = np.stack([base + noise] * 3, axis=-1)
+                path = os.path.join(folder, f"mri_{size}_{i}.{ext}")
+                Image.fromarray(pixels).save(path, fmt, quality=90)
+                group.append(path)
+            paths[f"{fmt} {size}px"] = group
+    return paths
+
+
+class Command(BaseCommand):
+    help = "Compare the legacy and vectorised preprocessing paths on large JPEG/PNG inputs (latency and peak memory)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, action="append", dest="sizes",
+                            help="Source image edge in pixels (repeatable). Default: 1024 and 4096.")
+        parser.add_argument("--count", type=int, default=8, help="Images per size/format.")
+        parser.add_argument("--repeats", type=int, default=3)
+
+    def handle(self, *args, **options):
+        sizes = options["sizes"] or [1024, 4096]
+        ctx = multiprocessing.get_context("spawn")
+
+        with tempfile.TemporaryDirectory() as folder:
+            self.stdout.write("Generating synthetic MRI images...")
+            groups = make_images(folder, sizes, options["count"])
+
+            header = f"{'input':<14} {'method':<16} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS +MB':>13}"
+            self.stdout.write(header)
+            self.stdout.write("-" * len(header))
+            for name, paths in groups.items():
+                for method in ("legacy", "pipeline", "pipeline-batch"):
+                    with ctx.Pool(1) as pool:
+                        result = pool.apply(run_method, (method, paths, options["repeats"]))
+                    self.stdout.write(
+                        f"{name:<14} {method:<16} {result['mean_ms']:>9.2f} {result['p50_ms']:>8.2f} "
+                        f"{result['p95_ms']:>8.2f} {result['peak_rss_delta_mb']:>13.1f}"
+                    )
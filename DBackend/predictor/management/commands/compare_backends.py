@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor.backends import create_backend
+from predictor.benchmarking import peak_rss_mb, rss_mb
+from predictor.utils import CLASS_LABELS, MODEL_PATH, preprocess_batch
+from .export_tflite import list_images
+
+
+def measure_backend(name, model_path, options, images):
+    """
+    Runs in a fresh process so import cost and RSS are attributable to a
+    single backend.
+    """
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    backend = create_backend(name, model_path, **options).load()
+    load_ms = (time.perf_counter() - started) * 1000.0
+    rss_loaded = rss_mb()
+
+    backend.infer(images[:1])  # warm-up, not timed
+
+    latencies = []
+    preds = []
+    for i in range(len(images)):
+        t0 = time.perf_counter()
+        preds.append(backend.infer(images[i:i + 1])[0])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    return {
+        "load_ms": load_ms,
+        "rss_start_mb": rss_start,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": peak_rss_mb(),
+        "latencies_ms": latencies,
+        "preds": np.asarray(preds),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Check accuracy parity of TFLite models against the Keras model over a folder "
+        "of sample images, and report latency and memory per backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", help="Folder of sample MRI images.")
+        parser.add_argument("--keras-model", default=MODEL_PATH)
+        parser.add_argument(
+            "--keras-mode", default=settings.PREDICTOR_INFERENCE_MODE,
+            choices=("predict", "direct", "compiled"),
+        )
+        parser.add_argument(
+            "--tflite", action="append", default=[], dest="tflite_models",
+            help="TFLite model to compare (repeatable).",
+        )
+        parser.add_argument("--limit", type=int, default=None, help="Use at most this many images.")
+        parser.add_argument(
+            "--min-agreement", type=float, default=0.99,
+            help="Fail if a backend's top-1 agreement with Keras drops below this.",
+        )
+
+    def handle(self, *args, **options):
+        paths = list_images(options["images"], options["limit"])
+        if not paths:
+            raise CommandError(f"No images found in {options['images']}")
+        images = preprocess_batch(paths)
+        self.stdout.write(f"Comparing backends over {len(paths)} images")
+
+        runs = [("keras", options["keras_model"], {"mode": options["keras_mode"]})]
+        for path in options["tflite_models"]:
+            runs.append(("tflite", path, {"num_threads": settings.PREDICTOR_TFLITE_THREADS}))
+
+        ctx = multiprocessing.get_context("spawn")
+        results = []
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            for name, model_path, backend_options in runs:
+                result = pool.apply(measure_backend, (name, model_path, backend_options, images))
+                results.append((name, model_path, result))
+
+        reference = results[0][2]["preds"]
+        reference_labels = reference.argmax(axis=1)
+        failed = False
+
+        header = f"{'backend':<36} {'agree':>7} {'max|dp|':>8} {'load ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'peak MB':>8}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, model_path, result in results:
+            preds = result["preds"]
+            agreement = float((preds.argmax(axis=1) == reference_labels).mean())
+            max_diff = float(np.abs(preds - reference).max())
+            latencies = np.asarray(result["latencies_ms"])
+            label = f"{name}:{os.path.basename(model_path)}"
+
+            self.stdout.write(
+                f"{label:<36} {agreement:>7.2%} {max_diff:>8.4f} {result['load_ms']:>9.1f} "
+                f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f} "
+                f"{result['rss_loaded_mb'] - result['rss_start_mb']:>8.1f} {result['rss_peak_mb']:>8.1f}"
+            )
+            if agreement < options["min_agreement"]:
+                failed = True
+                mismatches = np.flatnonzero(preds.argmax(axis=1) != reference_labels)
+                for i in mismatches[:10]:
+                    self.stdout.write(
+                        f"    {os.path.basename(paths[i])}: keras={CLASS_LABELS[reference_labels[i]]} "
+                        f"{name}={CLASS_LABELS[int(preds[i].argmax())]}"
+                    )
+
+        if failed:
+            raise CommandError(f"Top-1 agreement below {options['min_agreement']:.2%}")
+        self.stdout.write(self.style.SUCCESS("All backends within parity threshold"))
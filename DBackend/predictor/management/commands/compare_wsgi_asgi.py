@@ -0,0 +1,245 @@
+import io
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from patients.fake_cloudinary import FakeCloudinaryServer
+from predictor.benchmarking import process_tree_rss_mb, summarize_ms
+from predictor.fake_gemini import FakeGeminiServer
+
+SERVERS = {
+    # name: (command line, endpoint exercised)
+    "wsgi": (
+        lambda port, opts: [
+            sys.executable, "-m", "gunicorn", "backend.wsgi:application",
+            "--bind", f"127.0.0.1:{port}", "--workers", "1",
+            "--threads", str(opts["wsgi_threads"]), "--timeout", "120",
+        ],
+        "/api/predict/",
+    ),
+    "asgi": (
+        lambda port, opts: [
+            sys.executable, "-m", "uvicorn", "backend.asgi:application",
+            "--host", "127.0.0.1", "--port", str(port), "--workers", "1",
+            "--log-level", "warning",
+        ],
+        "/api/predict/async/",
+    ),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fake_services_env(gemini, storage):
+    """Environment pointing a server at the local Gemini and Cloudinary fakes."""
+    return {
+        "GEMINI_API_KEY": "load-test",
+        "GEMINI_BASE_URL": gemini.url,
+        "GEMINI_RATE_PER_MINUTE": "1000000",
+        "GEMINI_BURST": "100000",
+        "CLOUDINARY_UPLOAD_PREFIX": storage.url,
+        "CLOUD_NAME": "load-test",
+        "API_KEY": "load-test",
+        "API_SECRET": "load-test",
+    }
+
+
+def wait_ready(process, base, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with code {process.returncode} during startup")
+        try:
+            # Staff-only, so an anonymous 401 already means Django is serving.
+            if requests.get(base + "/api/predict/stats/", timeout=2).status_code == 401:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise CommandError(f"Server at {base} not ready after {timeout:.0f}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def sample_images(count, size):
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(count):
+        buf = io.BytesIO()
+        pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(buf, "JPEG", quality=90)
+        images.append((f"load_{i}.jpg", buf.getvalue()))
+    return images
+
+
+def run_load(url, images, concurrency, total, timeout):
+    """
+    `concurrency` client threads send `total` POSTs between them.
+    Returns (latencies_ms of 2xx responses, status counts, wall seconds).
+    """
+    counter = itertools.count()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            name, data = images[i % len(images)]
+            started = time.perf_counter()
+            try:
+                response = session.post(
+                    url, files={"file": (name, data, "image/jpeg")},
+                    data={"age": str(20 + i % 60), "gender": "M" if i % 2 else "F"},
+                    timeout=timeout,
+                )
+                status = response.status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status in (200, 201):
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the predict endpoint served by gunicorn (WSGI, sync view) and "
+        "uvicorn (ASGI, async view) with one process each, against local fakes of "
+        "Gemini and Cloudinary, and report throughput, latency and server RSS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, action="append", dest="levels",
+            help="Concurrent clients (repeatable). Default: 8, 32, 64.",
+        )
+        parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+        parser.add_argument("--server", choices=sorted(SERVERS), action="append", dest="servers")
+        parser.add_argument("--wsgi-threads", type=int, default=8, help="gunicorn threads per worker.")
+        parser.add_argument(
+            "--gemini-delay", type=float, default=0.5,
+            help="Seconds the fake Gemini waits before answering.",
+        )
+        parser.add_argument("--image-size", type=int, default=256)
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout.")
+        parser.add_argument("--startup-timeout", type=float, default=180.0)
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        levels = options["levels"] or [8, 32, 64]
+        servers = options["servers"] or ["wsgi", "asgi"]
+        images = sample_images(16, options["image_size"])
+
+        gemini = FakeGeminiServer().start()
+        gemini.delay = options["gemini_delay"]
+        storage = FakeCloudinaryServer().start()
+        env = {
+            **os.environ,
+            **fake_services_env(gemini, storage),
+            # Every request must reach the model and the (fake) Gemini.
+            "PREDICTOR_CACHE": "False",
+            "REASONING_CACHE_TTL": "0",
+            "PREDICTOR_WARMUP_ON_STARTUP": "True",
+        }
+
+        results = []
+        try:
+            for name in servers:
+                results.extend(self.run_server(name, env, images, levels, options))
+        finally:
+            gemini.stop()
+            storage.stop()
+
+        self.report(results)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['json_path']}")
+
+    def run_server(self, name, env, images, levels, options):
+        command, endpoint = SERVERS[name]
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        self.stdout.write(f"Starting {name} server on {base}")
+        process = subprocess.Popen(
+            command(port, options), cwd=str(settings.BASE_DIR), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(process, base, options["startup_timeout"])
+            # One untimed request so lazy imports and first-call costs are paid.
+            run_load(base + endpoint, images, 1, 1, options["timeout"])
+            idle_rss = process_tree_rss_mb(process.pid)
+
+            results = []
+            for concurrency in levels:
+                latencies, statuses, wall = run_load(
+                    base + endpoint, images, concurrency, options["requests"], options["timeout"],
+                )
+                ok = len(latencies)
+                results.append({
+                    "server": name,
+                    "endpoint": endpoint,
+                    "concurrency": concurrency,
+                    "requests": options["requests"],
+                    "ok": ok,
+                    "statuses": {str(k): v for k, v in statuses.items()},
+                    "throughput_rps": round(ok / wall, 2) if wall else 0.0,
+                    "latency": summarize_ms(latencies) if latencies else None,
+                    "rss_idle_mb": idle_rss,
+                    "rss_after_mb": process_tree_rss_mb(process.pid),
+                })
+                self.stdout.write(f"  {name} c={concurrency}: {ok}/{options['requests']} ok in {wall:.1f}s")
+            return results
+        finally:
+            stop_server(process)
+
+    def report(self, results):
+        header = (
+            f"{'server':<6} {'conc':>5} {'ok':>5} {'rps':>8} {'p50 ms':>9} "
+            f"{'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}"
+        )
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            latency = r["latency"] or {}
+            rss = r["rss_after_mb"]
+            self.stdout.write(
+                f"{r['server']:<6} {r['concurrency']:>5} {r['ok']:>5} {r['throughput_rps']:>8.2f} "
+                f"{latency.get('p50_ms', float('nan')):>9.1f} {latency.get('p95_ms', float('nan')):>9.1f} "
+                f"{latency.get('p99_ms', float('nan')):>9.1f} {rss if rss is not None else float('nan'):>8.1f}"
+            )
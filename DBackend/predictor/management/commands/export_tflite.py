@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor.utils import MODEL_PATH, preprocess_batch
+
+VARIANTS = ("float32", "float16", "int8")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def list_images(folder, limit=None):
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+class Command(BaseCommand):
+    help = "Convert predictor/model_fixed.h5 to TFLite (float32, float16 and/or int8 post-training quantised)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default=MODEL_PATH, help="Source Keras .h5 model.")
+        parser.add_argument(
+            "--output-dir", default=os.path.dirname(MODEL_PATH),
+            help="Where to write model_fixed_<variant>.tflite.",
+        )
+        parser.add_argument(
+            "--variant", action="append", choices=VARIANTS, dest="variants",
+            help="Variant to export (repeatable). Defaults to float16 and int8.",
+        )
+        parser.add_argument(
+            "--calibration-dir",
+            help="Folder of representative MRI images used to calibrate int8 activation ranges.",
+        )
+        parser.add_argument("--calibration-samples", type=int, default=200)
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+
+        variants = options["variants"] or ["float16", "int8"]
+
+        calibration = None
+        if "int8" in variants:
+            if not options["calibration_dir"]:
+                raise CommandError("--calibration-dir is required for the int8 variant")
+            paths = list_images(options["calibration_dir"], options["calibration_samples"])
+            if not paths:
+                raise CommandError(f"No images found in {options['calibration_dir']}")
+            calibration = preprocess_batch(paths)
+            self.stdout.write(f"Calibrating int8 with {len(calibration)} images")
+
+        model = load_model(options["model"], compile=False)
+        base_name = os.path.splitext(os.path.basename(options["model"]))[0]
+        os.makedirs(options["output_dir"], exist_ok=True)
+
+        for variant in variants:
+            converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+            if variant == "float16":
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.target_spec.supported_types = [tf.float16]
+            elif variant == "int8":
+                def representative_dataset():
+                    for array in calibration:
+                        yield [array[np.newaxis, ...]]
+
+                # Weights and activations are int8; the input/output
+                # interface stays float32 so callers need no changes.
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.representative_dataset = representative_dataset
+
+            tflite_model = converter.convert()
+            output_path = os.path.join(options["output_dir"], f"{base_name}_{variant}.tflite")
+            with open(output_path, "wb") as f:
+                f.write(tflite_model)
+
+            size_kb = len(tflite_model) / 1024.0
+            self.stdout.write(self.style.SUCCESS(f"{variant}: {output_path} ({size_kb:.1f} KB)"))
@@ -0,0 +1,51 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor.utils import get_backend_options, get_model_path
+from predictor.worker_pool import InferencePoolServer
+
+
+class Command(BaseCommand):
+    help = "Run the shared CNN inference pool that Django workers submit images to."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--address", default=settings.PREDICTOR_POOL_ADDRESS,
+                            help="Unix socket path to listen on.")
+        parser.add_argument("--workers", type=int, default=settings.PREDICTOR_POOL_WORKERS,
+                            help="Number of model processes (= model copies in memory).")
+        parser.add_argument("--max-pending", type=int, default=settings.PREDICTOR_POOL_MAX_PENDING,
+                            help="Queued images beyond which requests are rejected as busy.")
+        parser.add_argument("--max-batch-size", type=int, default=settings.PREDICTOR_MAX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        address = options["address"]
+        if not address:
+            raise CommandError("Set PREDICTOR_POOL_ADDRESS or pass --address")
+        if os.path.exists(address):
+            os.unlink(address)
+
+        server = InferencePoolServer(
+            address,
+            settings.PREDICTOR_POOL_AUTHKEY,
+            settings.PREDICTOR_BACKEND,
+            get_model_path(),
+            backend_options=get_backend_options(),
+            workers=options["workers"],
+            max_pending=options["max_pending"],
+            max_batch_size=options["max_batch_size"],
+            retry_after=settings.PREDICTOR_POOL_RETRY_AFTER,
+        )
+        self.stdout.write(f"Starting {options['workers']} inference workers ({settings.PREDICTOR_BACKEND})...")
+        server.start()
+        self.stdout.write(self.style.SUCCESS(f"Inference pool listening on {address}"))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            if os.path.exists(address):
+                os.unlink(address)
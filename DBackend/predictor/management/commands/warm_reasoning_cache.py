@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor.services import (
+    FALLBACK_MESSAGES,
+    generate_reasoning_for_key,
+    reasoning_combinations,
+)
+
+
+class Command(BaseCommand):
+    help = "Pre-compute Gemini clinical reasoning for every tumor type x age band x gender."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--refresh", action="store_true",
+                            help="Regenerate entries that are already cached.")
+        parser.add_argument("--delay", type=float, default=0.0,
+                            help="Seconds to wait between Gemini calls (quota pacing).")
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES[settings.REASONING_CACHE_ALIAS]["BACKEND"]
+        if backend.endswith("LocMemCache"):
+            # Entries would only land in this command's own memory and
+            # vanish when it exits, after spending the Gemini quota.
+            raise CommandError(
+                "The reasoning cache is process-local; set REASONING_CACHE_BACKEND=file "
+                "so web workers can see the warmed entries."
+            )
+
+        combinations = list(reasoning_combinations())
+        failed = 0
+
+        for i, (tumor_type, band, gender) in enumerate(combinations, 1):
+            text = generate_reasoning_for_key(tumor_type, band, gender, refresh=options["refresh"])
+            ok = text not in FALLBACK_MESSAGES
+            failed += not ok
+            status = "ok" if ok else "FAILED"
+            self.stdout.write(f"[{i}/{len(combinations)}] {tumor_type} {band} {gender}: {status}")
+            if options["delay"]:
+                time.sleep(options["delay"])
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} combination(s) could not be generated"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Cached {len(combinations)} combinations"))
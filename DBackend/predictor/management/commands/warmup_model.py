@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from predictor.utils import warm_up_model
+
+
+class Command(BaseCommand):
+    help = "Load the CNN, build the inference function and run warm-up batches, reporting timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, action="append", dest="batch_sizes",
+            help="Warm-up batch size (repeatable). Defaults to 1 plus the micro-batch size.",
+        )
+
+    def handle(self, *args, **options):
+        timings = warm_up_model(options["batch_sizes"])
+        self.stdout.write(f"Inference mode: {timings['mode']}")
+        self.stdout.write(f"Model load:     {timings.get('load_ms', 0.0)} ms")
+        self.stdout.write(
+            f"Warm-up:        {timings['warmup_ms']} ms "
+            f"(batch sizes {timings['warmup_batch_sizes']})"
+        )
+        self.stdout.write(self.style.SUCCESS("Model ready"))
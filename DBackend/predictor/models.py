@@ -1,3 +1,25 @@
 from django.db import models
 
-# Create your models here.
+
+class PredictionRecord(models.Model):
+    """
+    Persistent tier of the prediction cache: one CNN result per
+    (image content hash, model version).
+    """
+    content_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    tumor_type = models.CharField(max_length=20)
+    confidence = models.FloatField()
+    probabilities = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "model_version"],
+                name="unique_prediction_per_model",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.model_version}) - {self.tumor_type}"
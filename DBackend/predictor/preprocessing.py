@@ -0,0 +1,107 @@
+"""
+Image preprocessing for the CNN.
+
+Turns uploaded MRI files into float32 arrays in [0, 1] at the model's
+input size, doing as little full-resolution work as possible:
+
+- JPEGs are decoded at reduced scale via Image.draft(), so a 4000px scan
+  is never materialised at full size.
+- Other formats are shrunk with an integer Image.reduce() pass before the
+  final resample (Image.resize's `reducing_gap`).
+- Greyscale images are resized in "L" mode and only expanded to RGB at the
+  128x128 output size.
+- Pixels are scaled straight into a caller-provided float32 buffer, so a
+  batch of N files costs one (N, 128, 128, 3) allocation.
+"""
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (128, 128)
+LAYOUTS = ("NHWC", "NCHW")
+
+# Passed to Image.resize(): reduce by an integer factor first whenever the
+# source is at least this many times larger than the target.
+REDUCING_GAP = 3.0
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def _decode(file, size):
+    img = Image.open(file)
+    if img.format == "JPEG":
+        # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale (never below `size`).
+        img.draft(img.mode if img.mode in ("L", "RGB") else "RGB", size)
+
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+
+    img = img.resize(size, reducing_gap=REDUCING_GAP)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def model_input_image(file, size=IMAGE_SIZE):
+    """
+    The RGB image at the model's input size, before scaling to floats.
+    Saved losslessly, it preprocesses back to the same array.
+    """
+    return _decode(file, size)
+
+
+def _write(img, out, layout):
+    pixels = np.asarray(img, dtype=np.uint8)
+    if layout == "NCHW":
+        pixels = pixels.transpose(2, 0, 1)
+    np.multiply(pixels, _SCALE, out=out, casting="unsafe")
+
+
+def new_batch(count, size=IMAGE_SIZE, layout="NHWC"):
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout!r}")
+    width, height = size
+    shape = (count, height, width, 3) if layout == "NHWC" else (count, 3, height, width)
+    return np.empty(shape, dtype=np.float32)
+
+
+def preprocess_into(file, out, size=IMAGE_SIZE, layout="NHWC"):
+    """
+    Decodes `file` (path or file object) into `out`, a (H, W, 3) or
+    (3, H, W) float32 view such as one row of new_batch().
+    """
+    _write(_decode(file, size), out, layout)
+    return out
+
+
+def image_to_array(img, layout="NHWC"):
+    """
+    preprocess_image() for an image already decoded by model_input_image(),
+    for callers that time decoding and scaling separately.
+    """
+    out = new_batch(1, img.size, layout)[0]
+    _write(img, out, layout)
+    return out
+
+
+def preprocess_image(file, size=IMAGE_SIZE, layout="NHWC"):
+    """
+    Returns a single (H, W, 3) (or (3, H, W)) float32 array in [0, 1].
+    """
+    return preprocess_into(file, new_batch(1, size, layout)[0], size, layout)
+
+
+def preprocess_batch(files, size=IMAGE_SIZE, layout="NHWC", out=None):
+    """
+    Preprocesses a list of files into one (N, H, W, 3) / (N, 3, H, W)
+    float32 array in a single pass. `out` may be a preallocated buffer of
+    at least len(files) rows, reused across calls.
+    """
+    files = list(files)
+    if out is None:
+        out = new_batch(len(files), size, layout)
+    elif len(out) < len(files):
+        raise ValueError(f"Output buffer holds {len(out)} images, got {len(files)}")
+
+    for i, file in enumerate(files):
+        preprocess_into(file, out[i], size, layout)
+    return out[:len(files)]
@@ -1,12 +1,16 @@
-from google import genai
+import hashlib
+import logging
+
 from google.genai import types
 from django.conf import settings
+from django.core.cache import caches
 
+from backend.observability import count_cache, count_fallback, span
 
-def generate_clinical_reasoning(tumor_type, confidence, age, gender):
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
+from .gemini import GeminiCircuitOpen, GeminiError, GeminiQuotaExceeded, get_gemini
+from .utils import CLASS_LABELS
 
-    prompt = f"""
+PROMPT_TEMPLATE = """
 ROLE: Medical Treatment Database.
     TASK: List only the standard pharmaceutical and physical treatments for {tumor_type}.
 
@@ -26,33 +30,229 @@ ROLE: Medical Treatment Database.
     * Surgery: Craniotomy - Tumor resection.
 """
 
+# Changes whenever the template text changes, so edited prompts never
+# serve answers cached for the old wording.
+PROMPT_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode()).hexdigest()[:12]
+
+GENDERS = ("male", "female", "unknown")
+
+QUOTA_MESSAGE = (
+    "**System Note:** AI reasoning temporarily unavailable due to "
+    "usage limits. Please retry after a short interval."
+)
+UNAVAILABLE_MESSAGE = "**System Note:** AI reasoning currently unavailable."
+FALLBACK_MESSAGES = (QUOTA_MESSAGE, UNAVAILABLE_MESSAGE)
+
+logger = logging.getLogger(__name__)
+
+
+class ReasoningUnavailable(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+# =========================================================
+# Key normalisation
+# =========================================================
+
+def age_band(age):
+    """
+    Buckets an age into REASONING_AGE_BAND_YEARS-wide bands ("40-49"),
+    with everything from REASONING_AGE_BAND_MAX upwards in one band ("80+").
+    """
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.3,
-                max_output_tokens=5000
-            )
-        )
-        return response.text.strip()
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    if age < 0:
+        return "unknown"
+
+    width = settings.REASONING_AGE_BAND_YEARS
+    top = settings.REASONING_AGE_BAND_MAX
+    if age >= top:
+        return f"{top}+"
+    low = (age // width) * width
+    return f"{low}-{low + width - 1}"
+
+
+def all_age_bands():
+    width = settings.REASONING_AGE_BAND_YEARS
+    top = settings.REASONING_AGE_BAND_MAX
+    return [age_band(age) for age in range(0, top, width)] + [f"{top}+", "unknown"]
+
+
+def normalize_gender(gender):
+    value = str(gender or "").strip().lower()
+    if value in ("m", "male", "man"):
+        return "male"
+    if value in ("f", "female", "woman"):
+        return "female"
+    return "unknown"
 
-    except Exception as e:
-        error_msg = str(e)
 
-        # ⏳ Handle quota exhaustion gracefully
-        if "RESOURCE_EXHAUSTED" in error_msg or "429" in error_msg:
-            return (
-                "**System Note:** AI reasoning temporarily unavailable due to "
-                "usage limits. Please retry after a short interval."
-            )
+def reasoning_cache_key(tumor_type, band, gender):
+    return f"reasoning:{settings.REASONING_PROMPT_VERSION or PROMPT_VERSION}:{tumor_type}:{band}:{gender}"
 
+
+def build_prompt(tumor_type, band, gender):
+    age = "unknown-age" if band == "unknown" else band
+    sex = "patient" if gender == "unknown" else gender
+    return PROMPT_TEMPLATE.format(tumor_type=tumor_type, age=age, gender=sex)
+
+
+# =========================================================
+# Gemini
+# =========================================================
+
+def _gemini_or_unavailable():
+    try:
+        return get_gemini()
+    except ValueError as e:  # e.g. GEMINI_API_KEY not configured
+        logger.warning("Gemini client unavailable: %s", e)
+        count_fallback("reasoning_unavailable")
+        raise ReasoningUnavailable(UNAVAILABLE_MESSAGE)
+
+
+def _request_options():
+    return {
+        "model": "gemini-2.5-flash",
+        "config": types.GenerateContentConfig(
+            temperature=0.3,
+            max_output_tokens=5000
+        ),
         # 🔁 Optional fallback model
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt
-            )
-            return response.text.strip()
-        except:
-            return "**System Note:** AI reasoning currently unavailable."
\ No newline at end of file
+        "fallback_model": "gemini-2.0-flash",
+    }
+
+
+def _fallback_message(error):
+    # ⏳ Handle quota exhaustion gracefully
+    if isinstance(error, GeminiQuotaExceeded):
+        return QUOTA_MESSAGE
+    if isinstance(error, GeminiCircuitOpen):
+        return QUOTA_MESSAGE if error.quota else UNAVAILABLE_MESSAGE
+    return UNAVAILABLE_MESSAGE
+
+
+def _unavailable(error):
+    message = _fallback_message(error)
+    count_fallback("reasoning_quota" if message == QUOTA_MESSAGE else "reasoning_unavailable")
+    return ReasoningUnavailable(message)
+
+
+def _call_gemini(prompt):
+    """
+    Returns the model's text or raises ReasoningUnavailable carrying the
+    user-facing fallback message. Flow control (rate limit, circuit
+    breaker, retries, fallback model) lives in predictor.gemini.
+    """
+    gemini = _gemini_or_unavailable()
+    try:
+        with span("gemini"):
+            return gemini.generate(prompt, **_request_options())
+    except GeminiError as e:
+        raise _unavailable(e)
+
+
+async def _acall_gemini(prompt):
+    gemini = _gemini_or_unavailable()
+    try:
+        with span("gemini"):
+            return await gemini.agenerate(prompt, **_request_options())
+    except GeminiError as e:
+        raise _unavailable(e)
+
+
+def generate_reasoning_for_key(tumor_type, band, gender, refresh=False):
+    """
+    Cached reasoning for an already-normalised (tumor_type, age band,
+    gender). Fallback messages are returned but never cached.
+    """
+    cache = caches[settings.REASONING_CACHE_ALIAS]
+    key = reasoning_cache_key(tumor_type, band, gender)
+
+    if not refresh:
+        cached = cache.get(key)
+        count_cache("reasoning", "miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    try:
+        text = _call_gemini(build_prompt(tumor_type, band, gender))
+    except ReasoningUnavailable as e:
+        return e.message
+
+    cache.set(key, text, timeout=settings.REASONING_CACHE_TTL)
+    return text
+
+
+async def agenerate_reasoning_for_key(tumor_type, band, gender, refresh=False):
+    cache = caches[settings.REASONING_CACHE_ALIAS]
+    key = reasoning_cache_key(tumor_type, band, gender)
+
+    if not refresh:
+        cached = await cache.aget(key)
+        count_cache("reasoning", "miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    try:
+        text = await _acall_gemini(build_prompt(tumor_type, band, gender))
+    except ReasoningUnavailable as e:
+        return e.message
+
+    await cache.aset(key, text, timeout=settings.REASONING_CACHE_TTL)
+    return text
+
+
+def stream_clinical_reasoning(tumor_type, confidence, age, gender):
+    """
+    Yields the reasoning text in chunks as Gemini produces them. A cache
+    hit or a fallback message arrives as a single chunk; the joined text
+    is cached only when the stream completed.
+    """
+    band, gender = age_band(age), normalize_gender(gender)
+    cache = caches[settings.REASONING_CACHE_ALIAS]
+    key = reasoning_cache_key(tumor_type, band, gender)
+
+    cached = cache.get(key)
+    count_cache("reasoning", "miss" if cached is None else "hit")
+    if cached is not None:
+        yield cached
+        return
+
+    try:
+        gemini = _gemini_or_unavailable()
+    except ReasoningUnavailable as e:
+        yield e.message
+        return
+
+    parts = []
+    try:
+        for chunk in gemini.generate_stream(build_prompt(tumor_type, band, gender), **_request_options()):
+            parts.append(chunk)
+            yield chunk
+    except GeminiError as e:
+        # Keep whatever already reached the client; flag the rest as missing.
+        yield ("\n\n" if parts else "") + _unavailable(e).message
+        return
+
+    text = "".join(parts).strip()
+    if text:
+        cache.set(key, text, timeout=settings.REASONING_CACHE_TTL)
+
+
+def generate_clinical_reasoning(tumor_type, confidence, age, gender):
+    return generate_reasoning_for_key(tumor_type, age_band(age), normalize_gender(gender))
+
+
+async def agenerate_clinical_reasoning(tumor_type, confidence, age, gender):
+    return await agenerate_reasoning_for_key(tumor_type, age_band(age), normalize_gender(gender))
+
+
+def reasoning_combinations():
+    for tumor_type in CLASS_LABELS:
+        for band in all_age_bands():
+            for gender in GENDERS:
+                yield tumor_type, band, gender
@@ -1,3 +1,777 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import services, utils
+from .backends import KERAS_MODES, create_backend
+from .batching import MicroBatcher
+from .cache import PredictionCache, hash_file
+from .fake_backend import CRASH_PIXEL, FakeBackend
+from .fake_gemini import FakeGeminiServer
+from .gemini import (
+    CircuitBreaker,
+    GeminiCircuitOpen,
+    GeminiClientManager,
+    GeminiQuotaExceeded,
+    GeminiUnavailable,
+    TokenBucket,
+    reset_gemini,
+)
+from .management.commands.benchmark_inference import build_standin_model, compare_results, time_batches
+from .management.commands.benchmark_preprocessing import legacy_preprocess
+from .preprocessing import new_batch, preprocess_batch, preprocess_image
+from .worker_pool import InferencePoolServer, InferencePoolUnavailable, _Pending
+
+
+class FakeGeminiTestCase(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeGeminiServer(text="* Surgery: Craniotomy - Tumor resection.").start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fake.reset()
+
+    def make_manager(self, **options):
+        defaults = {
+            "api_key": "test-key",
+            "base_url": self.fake.url,
+            "timeout": 5.0,
+            "rate_per_minute": 6000,
+            "burst": 100,
+            "breaker_threshold": 3,
+            "breaker_reset": 60.0,
+            "max_retries": 2,
+            "backoff_base": 0.001,
+            "backoff_max": 0.01,
+        }
+        defaults.update(options)
+        return GeminiClientManager(**defaults)
+
+
+class GeminiClientManagerTests(FakeGeminiTestCase):
+
+    def test_success_reuses_one_client(self):
+        gemini = self.make_manager()
+        client = gemini.client
+
+        self.assertEqual(gemini.generate("prompt", model="gemini-2.5-flash"), "* Surgery: Craniotomy - Tumor resection.")
+        self.assertEqual(gemini.generate("prompt", model="gemini-2.5-flash"), "* Surgery: Craniotomy - Tumor resection.")
+
+        self.assertIs(gemini.client, client)
+        self.assertEqual(self.fake.calls["gemini-2.5-flash"], 2)
+
+    def test_quota_error_opens_breaker_without_fallback_call(self):
+        gemini = self.make_manager()
+        self.fake.reset("quota")
+
+        with self.assertRaises(GeminiQuotaExceeded):
+            gemini.generate("prompt", model="gemini-2.5-flash", fallback_model="gemini-2.0-flash")
+        self.assertEqual(self.fake.total_calls, 1)
+
+        # While open, callers are short-circuited without touching the network.
+        with self.assertRaises(GeminiCircuitOpen) as ctx:
+            gemini.generate("prompt", model="gemini-2.5-flash", fallback_model="gemini-2.0-flash")
+        self.assertTrue(ctx.exception.quota)
+        self.assertEqual(self.fake.total_calls, 1)
+        self.assertEqual(gemini.stats()["short_circuited"], 1)
+
+    def test_server_errors_are_retried_then_fall_back(self):
+        gemini = self.make_manager(max_retries=2)
+        self.fake.reset("error")
+
+        with self.assertRaises(Exception):
+            gemini.generate("prompt", model="gemini-2.5-flash", fallback_model="gemini-2.0-flash")
+
+        self.assertEqual(self.fake.calls["gemini-2.5-flash"], 3)
+        self.assertEqual(self.fake.calls["gemini-2.0-flash"], 1)
+        self.assertEqual(gemini.stats()["retries"], 2)
+
+    def test_breaker_opens_after_consecutive_failures_and_recovers(self):
+        gemini = self.make_manager(max_retries=0, breaker_threshold=2, breaker_reset=0.05)
+        self.fake.reset("error")
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                gemini.generate("prompt", model="gemini-2.5-flash")
+        self.assertEqual(gemini.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(GeminiCircuitOpen):
+            gemini.generate("prompt", model="gemini-2.5-flash")
+
+        time.sleep(0.06)
+        self.fake.reset("ok")
+        self.assertTrue(gemini.generate("prompt", model="gemini-2.5-flash"))
+        self.assertEqual(gemini.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_token_bucket_limits_calls_locally(self):
+        gemini = self.make_manager(rate_per_minute=1, burst=2)
+
+        gemini.generate("prompt", model="gemini-2.5-flash")
+        gemini.generate("prompt", model="gemini-2.5-flash")
+        with self.assertRaises(GeminiQuotaExceeded):
+            gemini.generate("prompt", model="gemini-2.5-flash")
+
+        self.assertEqual(self.fake.total_calls, 2)
+        self.assertEqual(gemini.stats()["rate_limited"], 1)
+
+    def test_retries_and_fallback_take_tokens(self):
+        gemini = self.make_manager(rate_per_minute=1, burst=2, max_retries=2)
+        self.fake.reset("error")
+
+        with self.assertRaises(GeminiUnavailable):
+            gemini.generate("prompt", model="gemini-2.5-flash", fallback_model="gemini-2.0-flash")
+
+        # One token for the first request, one for the first retry; the second
+        # retry and the fallback found the bucket empty and were not sent.
+        self.assertEqual(self.fake.calls["gemini-2.5-flash"], 2)
+        self.assertEqual(self.fake.calls["gemini-2.0-flash"], 0)
+        self.assertEqual(gemini.stats()["retries"], 1)
+        self.assertEqual(gemini.stats()["rate_limited"], 2)
+
+    def test_async_generate_shares_breaker_and_counters(self):
+        gemini = self.make_manager()
+
+        self.assertEqual(
+            asyncio.run(gemini.agenerate("prompt", model="gemini-2.5-flash")),
+            "* Surgery: Craniotomy - Tumor resection.",
+        )
+        self.fake.reset("quota")
+        with self.assertRaises(GeminiQuotaExceeded):
+            asyncio.run(gemini.agenerate("prompt", model="gemini-2.5-flash"))
+        # The sync path sees the breaker the async path opened.
+        with self.assertRaises(GeminiCircuitOpen):
+            gemini.generate("prompt", model="gemini-2.5-flash")
+
+        self.assertEqual(gemini.stats()["successes"], 1)
+        self.assertEqual(gemini.stats()["quota_errors"], 1)
+
+    def test_stream_yields_chunks_and_fails_on_truncated_stream(self):
+        gemini = self.make_manager()
+        self.fake.text = "* A: one\n* B: two\n"
+        try:
+            self.assertEqual(list(gemini.generate_stream("prompt", model="gemini-2.5-flash")), ["* A: one\n", "* B: two\n"])
+
+            self.fake.reset("midstream")
+            chunks = []
+            with self.assertRaises(GeminiUnavailable):
+                for chunk in gemini.generate_stream("prompt", model="gemini-2.5-flash", fallback_model="gemini-2.0-flash"):
+                    chunks.append(chunk)
+        finally:
+            self.fake.text = "* Surgery: Craniotomy - Tumor resection."
+
+        # Text was already emitted, so neither a retry nor the fallback ran.
+        self.assertEqual(chunks, ["* A: one\n"])
+        self.assertEqual(self.fake.total_calls, 1)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_refills_at_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2.0, capacity=1, clock=lambda: now[0])
+
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        now[0] += 0.5
+        self.assertEqual(bucket.try_acquire(), 0.0)
+
+
+class ClinicalReasoningTests(FakeGeminiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches["reasoning"].clear()
+        reset_gemini()
+        self.settings_override = override_settings(
+            GEMINI_API_KEY="test-key",
+            GEMINI_BASE_URL=self.fake.url,
+            GEMINI_BACKOFF_BASE=0.001,
+            GEMINI_BACKOFF_MAX=0.01,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        reset_gemini()
+        super().tearDown()
+
+    def test_reasoning_is_cached_per_age_band(self):
+        first = services.generate_clinical_reasoning("glioma", 0.9, 43, "M")
+        second = services.generate_clinical_reasoning("glioma", 0.8, 47, "male")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.fake.total_calls, 1)
+
+    def test_different_bands_and_genders_are_separate_entries(self):
+        services.generate_clinical_reasoning("glioma", 0.9, 43, "M")
+        services.generate_clinical_reasoning("glioma", 0.9, 53, "M")
+        services.generate_clinical_reasoning("glioma", 0.9, 43, "F")
+        services.generate_clinical_reasoning("meningioma", 0.9, 43, "M")
+
+        self.assertEqual(self.fake.total_calls, 4)
+
+    def test_refresh_bypasses_the_cache(self):
+        services.generate_reasoning_for_key("glioma", "40-49", "male")
+        self.fake.text = "* Radiotherapy: Adjuvant."
+        self.addCleanup(setattr, self.fake, "text", "* Surgery: Craniotomy - Tumor resection.")
+
+        self.assertEqual(services.generate_reasoning_for_key("glioma", "40-49", "male"),
+                         "* Surgery: Craniotomy - Tumor resection.")
+        self.assertEqual(services.generate_reasoning_for_key("glioma", "40-49", "male", refresh=True),
+                         "* Radiotherapy: Adjuvant.")
+        self.assertEqual(services.generate_clinical_reasoning("glioma", 0.9, 41, "m"), "* Radiotherapy: Adjuvant.")
+
+    @override_settings(GEMINI_RATE_PER_MINUTE=60000, GEMINI_BURST=1000)
+    def test_warm_command_fills_every_combination(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = {**settings.CACHES, "reasoning": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location,
+        }}
+        out = StringIO()
+        with override_settings(CACHES=shared):
+            call_command("warm_reasoning_cache", stdout=out)
+            services.generate_clinical_reasoning("pituitary", 0.9, 95, "")
+
+        combinations = list(services.reasoning_combinations())
+        self.assertEqual(self.fake.total_calls, len(combinations))
+        self.assertIn(f"Cached {len(combinations)} combinations", out.getvalue())
+
+    def test_warm_command_refuses_a_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, "REASONING_CACHE_BACKEND=file"):
+            call_command("warm_reasoning_cache", stdout=StringIO())
+        self.assertEqual(self.fake.total_calls, 0)
+
+    def test_quota_returns_fallback_text_and_is_not_cached(self):
+        self.fake.reset("quota")
+        self.assertEqual(services.generate_clinical_reasoning("glioma", 0.9, 43, "M"), services.QUOTA_MESSAGE)
+        self.assertEqual(services.generate_clinical_reasoning("glioma", 0.9, 43, "M"), services.QUOTA_MESSAGE)
+
+        self.assertEqual(self.fake.total_calls, 1)
+        self.assertIsNone(caches["reasoning"].get(services.reasoning_cache_key("glioma", "40-49", "male")))
+
+    def test_streamed_reasoning_is_cached_once_complete(self):
+        chunks = list(services.stream_clinical_reasoning("glioma", 0.9, 43, "M"))
+        again = list(services.stream_clinical_reasoning("glioma", 0.9, 47, "male"))
+
+        self.assertEqual("".join(chunks), "* Surgery: Craniotomy - Tumor resection.")
+        self.assertEqual(again, ["* Surgery: Craniotomy - Tumor resection."])
+        self.assertEqual(self.fake.total_calls, 1)
+
+
+class ReasoningKeyTests(SimpleTestCase):
+
+    def test_age_bands(self):
+        cases = {0: "0-9", 9: "0-9", 10: "10-19", 43: "40-49", "47": "40-49", 79: "70-79",
+                 80: "80+", 104: "80+", -1: "unknown", None: "unknown", "": "unknown", "n/a": "unknown"}
+        for age, band in cases.items():
+            with self.subTest(age=age):
+                self.assertEqual(services.age_band(age), band)
+
+    @override_settings(REASONING_AGE_BAND_YEARS=5, REASONING_AGE_BAND_MAX=90)
+    def test_band_width_and_top_are_settings(self):
+        self.assertEqual(services.age_band(43), "40-44")
+        self.assertEqual(services.age_band(90), "90+")
+        bands = services.all_age_bands()
+        self.assertEqual((bands[0], bands[-2:]), ("0-4", ["90+", "unknown"]))
+        self.assertEqual(len(bands), 20)
+
+    def test_gender_spellings(self):
+        for raw, gender in (("M", "male"), (" Male ", "male"), ("man", "male"), ("f", "female"),
+                            ("FEMALE", "female"), ("woman", "female"), ("", "unknown"), (None, "unknown"),
+                            ("other", "unknown")):
+            with self.subTest(raw=raw):
+                self.assertEqual(services.normalize_gender(raw), gender)
+
+    def test_key_carries_prompt_version(self):
+        key = services.reasoning_cache_key("glioma", "40-49", "male")
+        self.assertEqual(key, f"reasoning:{services.PROMPT_VERSION}:glioma:40-49:male")
+        with override_settings(REASONING_PROMPT_VERSION="v2"):
+            self.assertEqual(services.reasoning_cache_key("glioma", "40-49", "male"), "reasoning:v2:glioma:40-49:male")
+
+    def test_combinations_cover_every_key_once(self):
+        combinations = list(services.reasoning_combinations())
+        self.assertEqual(len(combinations), len(utils.CLASS_LABELS) * len(services.all_age_bands()) * 3)
+        self.assertEqual(len(set(combinations)), len(combinations))
+
+
+class CountingBackend:
+    """Stands in for a loaded model: uniform softmax, records batch sizes."""
+    name = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def infer(self, batch):
+        self.calls.append(len(batch))
+        return np.full((len(batch), 4), 0.25, dtype=np.float32)
+
+
+class InferenceBenchmarkTests(SimpleTestCase):
+
+    def test_batches_cover_requested_images(self):
+        backend = CountingBackend()
+        images = np.zeros((3, 128, 128, 3), dtype=np.float32)
+
+        results = time_batches(backend, images, [1, 4, 64], min_images=10)
+
+        self.assertEqual([r["batch_size"] for r in results], [1, 4, 64])
+        # One warm-up batch, then ceil(10 / size) timed batches.
+        self.assertEqual(backend.calls, [1] * 11 + [4] * 4 + [64] * 2)
+        self.assertEqual([r["count"] for r in results], [10, 3, 1])
+        self.assertTrue(all(r["images_per_s"] > 0 for r in results))
+
+    def test_compare_flags_regressions(self):
+        baseline = {
+            "single_image": {"p50_ms": 2.0, "p95_ms": 4.0},
+            "batches": [{"batch_size": 8, "images_per_s": 100.0}],
+        }
+        current = {
+            "single_image": {"p50_ms": 1.0, "p95_ms": 5.0},
+            "batches": [{"batch_size": 8, "images_per_s": 80.0}, {"batch_size": 16, "images_per_s": 90.0}],
+        }
+
+        rows = {name: (change, regressed) for name, _, _, change, regressed in compare_results(baseline, current)}
+
+        self.assertEqual(rows, {
+            "single_image.p50_ms": (-50.0, False),
+            "single_image.p95_ms": (25.0, True),
+            "batch_8.images_per_s": (-20.0, True),
+        })
+
+
+def jpeg_upload(name="scan.jpg"):
+    from io import BytesIO
+    from PIL import Image
+
+    out = BytesIO()
+    Image.new("RGB", (32, 32), (120, 40, 200)).save(out, "JPEG")
+    return SimpleUploadedFile(name, out.getvalue(), content_type="image/jpeg")
+
+
+class InferencePoolTests(SimpleTestCase):
+    """The pool with FakeBackend workers (spawned processes, no TensorFlow)."""
+
+    def start_pool(self, **options):
+        defaults = {"workers": 1, "max_pending": 4, "max_batch_size": 4, "retry_after": 7,
+                    "timeout": 20.0, "restart_delay": 0.1}
+        defaults.update(options)
+        server = InferencePoolServer(None, b"test", "fake", None, backend_factory=FakeBackend, **defaults)
+        server.start()
+        self.addCleanup(server.stop)
+        return server
+
+    def images(self, n):
+        return np.full((n, 128, 128, 3), 0.5, dtype=np.float32)
+
+    def wait_for(self, condition, timeout=20.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.05)
+
+    def test_large_batches_are_chunked_not_rejected(self):
+        server = self.start_pool()
+
+        status, rows = server.submit_many(self.images(10))
+
+        self.assertEqual(status, "ok")
+        self.assertEqual(rows.shape, (10, 4))
+        self.assertEqual(server.stats()["rejected"], 0)
+
+    def test_saturated_pool_is_busy(self):
+        server = self.start_pool()
+        with server._lock:
+            server._pending.update({-i: _Pending() for i in range(1, 5)})
+
+        self.assertEqual(server.submit(self.images(1)[0]), ("busy", 7))
+        self.assertEqual(server.stats()["rejected"], 1)
+
+    def test_dead_worker_fails_fast_and_is_restarted(self):
+        server = self.start_pool()
+        crash = self.images(2)
+        crash[1, 0, 0, 0] = CRASH_PIXEL
+
+        started = time.monotonic()
+        with self.assertLogs("predictor.worker_pool", "ERROR"):
+            status, error = server.submit_many(crash)
+            elapsed = time.monotonic() - started
+            self.wait_for(lambda: server.stats()["restarts"] == 1 and server.stats()["alive_workers"] == 1)
+
+        self.assertEqual((status, error), ("error", "Inference worker exited"))
+        # Well under the 20 s timeout.
+        self.assertLess(elapsed, 10.0)
+        self.assertEqual(server.stats()["pending"], 0)
+        self.assertEqual(server.submit(self.images(1)[0])[0], "ok")
+
+    def test_busy_pool_answers_503_with_retry_after(self):
+        server = self.start_pool()
+        with server._lock:
+            server._pending.update({-i: _Pending() for i in range(1, 5)})
+        # Linux abstract socket: nothing left on disk.
+        address = f"\0inference-pool-test-{os.getpid()}"
+        server.address, server.authkey = address, b"test"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = utils.InferencePoolClient(address, b"test")
+
+        def listening():
+            try:
+                return client.stats()["workers"] == 1
+            except InferencePoolUnavailable:
+                return False
+
+        self.wait_for(listening)
+
+        self.addCleanup(setattr, utils, "_pool_client", None)
+        utils._pool_client = None
+        with override_settings(PREDICTOR_POOL_ADDRESS=address, PREDICTOR_POOL_AUTHKEY=b"test",
+                               PREDICTOR_POOL_RETRY_AFTER=7, PREDICTOR_CACHE=False):
+            response = self.client.post("/api/predict/", {"file": jpeg_upload()})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+
+
+class MicroBatcherTests(SimpleTestCase):
+
+    def submit_concurrently(self, batcher, n):
+        results = [None] * n
+
+        def call(i):
+            try:
+                results[i] = batcher.submit(np.full((2, 2, 3), i, dtype=np.float32), timeout=5)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_a_batch(self):
+        def infer(batch):
+            return batch[:, 0, 0, :1] * 10
+
+        batcher = MicroBatcher(infer, max_batch_size=4, max_wait_ms=500)
+
+        results = self.submit_concurrently(batcher, 4)
+
+        self.assertEqual([float(row[0]) for row in results], [0.0, 10.0, 20.0, 30.0])
+        self.assertEqual(batcher.stats()["batch_size_histogram"], {4: 1})
+
+    def test_partial_batch_is_flushed_after_max_wait(self):
+        batcher = MicroBatcher(CountingBackend().infer, max_batch_size=8, max_wait_ms=50)
+
+        started = time.perf_counter()
+        batcher.submit(np.zeros((2, 2, 3), dtype=np.float32), timeout=5)
+        elapsed = time.perf_counter() - started
+
+        self.assertGreaterEqual(elapsed, 0.04)
+        self.assertLess(elapsed, 2.0)
+        self.assertEqual(batcher.stats()["batch_size_histogram"], {1: 1})
+
+    def test_errors_reach_every_caller(self):
+        def infer(batch):
+            raise RuntimeError("model crashed")
+
+        batcher = MicroBatcher(infer, max_batch_size=3, max_wait_ms=500)
+
+        results = self.submit_concurrently(batcher, 3)
+
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    def test_row_count_mismatch_fails_the_batch_instead_of_hanging(self):
+        def infer(batch):
+            return np.zeros((1, 4), dtype=np.float32)
+
+        batcher = MicroBatcher(infer, max_batch_size=3, max_wait_ms=500)
+
+        started = time.perf_counter()
+        results = self.submit_concurrently(batcher, 3)
+
+        self.assertTrue(all(isinstance(r, ValueError) for r in results), results)
+        self.assertLess(time.perf_counter() - started, 4.0)
+
+
+def use_backend(test, backend):
+    """Swaps the process-wide model for `backend`, with a fresh prediction cache."""
+    for name in ("_backend", "_prediction_cache", "_model_version", "_batcher"):
+        test.addCleanup(setattr, utils, name, getattr(utils, name))
+    utils._backend = backend
+    utils._prediction_cache = None
+    utils._model_version = "test-model"
+    utils._batcher = None
+    return backend
+
+
+class PredictionCacheTests(TestCase):
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set("a", "v1", "glioma", 0.9, [0.9, 0.1, 0.0, 0.0])
+        cache.set("b", "v1", "pituitary", 0.8, [0.1, 0.1, 0.0, 0.8])
+        cache.get("a", "v1")
+        cache.set("c", "v1", "notumor", 0.7, [0.1, 0.1, 0.7, 0.1])
+
+        self.assertIsNone(cache.get("b", "v1"))
+        self.assertEqual(cache.get("a", "v1")[:2], ("glioma", 0.9))
+        self.assertIsNone(cache.get("a", "v2"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_persistent_tier_survives_a_new_process_cache(self):
+        PredictionCache(persistent=True).set("a", "v1", "glioma", 0.9, np.array([0.9, 0.1, 0.0, 0.0]))
+
+        cache = PredictionCache(persistent=True)
+        self.assertEqual(cache.get("a", "v1"), ("glioma", 0.9, [0.9, 0.1, 0.0, 0.0]))
+        cache.get("a", "v1")
+
+        stats = cache.stats()
+        self.assertEqual((stats["persistent_hits"], stats["hits"], stats["misses"]), (1, 1, 0))
+        self.assertIsNone(PredictionCache(persistent=True).get("a", "v2"))
+
+    def test_hash_file_rewinds(self):
+        upload = jpeg_upload()
+        upload.read(10)
+
+        digest = hash_file(upload)
+
+        self.assertEqual(upload.tell(), 0)
+        self.assertEqual(digest, hash_file(jpeg_upload()))
+
+    @override_settings(PREDICTOR_CACHE=True, PREDICTOR_BATCHING=False, PREDICTOR_POOL_ADDRESS="")
+    def test_identical_uploads_run_the_model_once(self):
+        backend = use_backend(self, CountingBackend())
+
+        first = utils.predict_image(jpeg_upload("a.jpg"))
+        second = utils.predict_image(jpeg_upload("b.jpg"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(backend.calls, [1])
+        self.assertEqual(utils.cache_stats()["hits"], 1)
+
+
+class InferenceStatsTests(TestCase):
+
+    def test_requires_staff(self):
+        client = APIClient()
+        self.assertEqual(client.get("/api/predict/stats/").status_code, 401)
+
+        client.force_authenticate(User.objects.create_user("doctor", password="x"))
+        self.assertEqual(client.get("/api/predict/stats/").status_code, 403)
+
+        client.force_authenticate(User.objects.create_user("stats-admin", password="x", is_staff=True))
+        response = client.get("/api/predict/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"model", "batching", "cache", "gemini"})
+
+
+class WarmUpTests(SimpleTestCase):
+
+    @override_settings(PREDICTOR_BATCHING=True, PREDICTOR_MAX_BATCH_SIZE=8)
+    def test_warm_up_runs_single_and_batch_shapes(self):
+        backend = use_backend(self, CountingBackend())
+
+        timings = utils.warm_up_model()
+
+        self.assertEqual(backend.calls, [1, 8])
+        self.assertEqual(timings["warmup_batch_sizes"], [1, 8])
+        self.assertEqual(timings["mode"], "counting")
+
+    def test_startup_warm_up_is_opt_in(self):
+        backend = use_backend(self, CountingBackend())
+        config = apps.get_app_config("predictor")
+
+        with override_settings(PREDICTOR_WARMUP_ON_STARTUP=False):
+            config.ready()
+        self.assertEqual(backend.calls, [])
+
+        with override_settings(PREDICTOR_WARMUP_ON_STARTUP=True, PREDICTOR_BATCHING=False):
+            with self.assertLogs("predictor.apps", "INFO"):
+                config.ready()
+        self.assertEqual(backend.calls, [1])
+
+    def test_warmup_command_takes_batch_sizes(self):
+        backend = use_backend(self, CountingBackend())
+        out = StringIO()
+
+        call_command("warmup_model", "--batch-size", "2", "--batch-size", "4", stdout=out)
+
+        self.assertEqual(backend.calls, [2, 4])
+        self.assertIn("Model ready", out.getvalue())
+
+
+class BackendParityTests(SimpleTestCase):
+    """Every backend must agree with Keras on a small stand-in model."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.model_path = os.path.join(cls.directory, "standin.h5")
+        build_standin_model(cls.model_path, seed=3)
+        call_command("export_tflite", "--model", cls.model_path, "--output-dir", cls.directory,
+                     "--variant", "float32", "--variant", "float16", stdout=StringIO())
+        cls.images = np.random.default_rng(0).random((5, 128, 128, 3), dtype=np.float32)
+        cls.expected = create_backend("keras", cls.model_path, mode="predict").load().infer(cls.images)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_keras_modes_agree(self):
+        for mode in KERAS_MODES:
+            with self.subTest(mode=mode):
+                backend = create_backend("keras", self.model_path, mode=mode).load()
+                np.testing.assert_allclose(backend.infer(self.images), self.expected, atol=1e-5)
+                np.testing.assert_allclose(backend.infer(self.images[:1]), self.expected[:1], atol=1e-5)
+
+    def test_tflite_variants_agree(self):
+        for variant, tolerance in (("float32", 1e-5), ("float16", 1e-2)):
+            with self.subTest(variant=variant):
+                path = os.path.join(self.directory, f"standin_{variant}.tflite")
+                backend = create_backend("tflite", path, num_threads=1).load()
+                # Resizes the input tensor between batch sizes.
+                np.testing.assert_allclose(backend.infer(self.images[:1]), self.expected[:1], atol=tolerance)
+                np.testing.assert_allclose(backend.infer(self.images), self.expected, atol=tolerance)
+                self.assertTrue((backend.infer(self.images).argmax(1) == self.expected.argmax(1)).all())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_backend("onnx", self.model_path)
+
+
+def encoded(img, fmt):
+    from io import BytesIO
+
+    out = BytesIO()
+    img.save(out, fmt, **({"quality": 95} if fmt == "JPEG" else {}))
+    out.seek(0)
+    return out
+
+
+class PreprocessingEquivalenceTests(SimpleTestCase):
+    """The fast path against the original predict_image() preprocessing."""
+
+    def image(self, size, mode="RGB", seed=0):
+        from PIL import Image
+
+        rng = np.random.default_rng(seed)
+        # Smooth content, like a scan, so resampling differences stay small.
+        base = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize(size, Image.BICUBIC)
+        return img.convert(mode)
+
+    def assert_close_to_legacy(self, file, mean_tolerance, max_tolerance):
+        expected = legacy_preprocess(file)[0]
+        file.seek(0)
+        actual = preprocess_image(file)
+        self.assertEqual((actual.shape, actual.dtype), (expected.shape, np.float32))
+        self.assertLessEqual(float(np.abs(actual - expected).mean()), mean_tolerance)
+        self.assertLessEqual(float(np.abs(actual - expected).max()), max_tolerance)
+
+    def test_model_sized_png_matches(self):
+        self.assert_close_to_legacy(encoded(self.image((128, 128)), "PNG"), 1e-6, 1e-6)
+
+    def test_greyscale_and_palette_inputs(self):
+        self.assert_close_to_legacy(encoded(self.image((300, 260), "L"), "PNG"), 1 / 255, 2 / 255)
+        self.assert_close_to_legacy(encoded(self.image((300, 260), "P"), "PNG"), 1 / 255, 8 / 255)
+        self.assert_close_to_legacy(encoded(self.image((300, 260), "RGBA"), "PNG"), 1 / 255, 2 / 255)
+
+    def test_large_inputs_stay_close(self):
+        # JPEG draft decoding and reducing_gap resample differently from a
+        # full-size resize, within a couple of grey levels on average.
+        self.assert_close_to_legacy(encoded(self.image((2048, 1536)), "JPEG"), 2 / 255, 0.1)
+        self.assert_close_to_legacy(encoded(self.image((2048, 1536)), "PNG"), 2 / 255, 0.1)
+
+    def test_batch_matches_single_images_and_reuses_buffer(self):
+        files = [encoded(self.image((400, 300), seed=i), "JPEG") for i in range(3)]
+        singles = []
+        for file in files:
+            singles.append(preprocess_image(file))
+            file.seek(0)
+        buffer = new_batch(4)
+
+        batch = preprocess_batch(files, out=buffer)
+
+        self.assertEqual(batch.shape, (3, 128, 128, 3))
+        self.assertTrue(np.shares_memory(batch, buffer))
+        np.testing.assert_array_equal(batch, np.stack(singles))
+        with self.assertRaises(ValueError):
+            preprocess_batch(files, out=new_batch(2))
+
+    def test_nchw_layout_is_a_transpose(self):
+        file = encoded(self.image((200, 150)), "PNG")
+        nhwc = preprocess_image(file)
+        file.seek(0)
+        np.testing.assert_array_equal(preprocess_image(file, layout="NCHW"), nhwc.transpose(2, 0, 1))
+
+
+class PredictAsyncTests(FakeGeminiTestCase):
+    """predict_async against the sync predict view it mirrors."""
+
+    def setUp(self):
+        super().setUp()
+        caches["reasoning"].clear()
+        reset_gemini()
+        self.addCleanup(reset_gemini)
+        overrides = override_settings(
+            GEMINI_API_KEY="test-key", GEMINI_BASE_URL=self.fake.url, GEMINI_BACKOFF_BASE=0.001,
+            GEMINI_RATE_PER_MINUTE=6000, GEMINI_BURST=100,
+            PREDICTOR_CACHE=False, PREDICTOR_BATCHING=False, PREDICTOR_POOL_ADDRESS="",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.backend = use_backend(self, CountingBackend())
+
+    def predict_async(self, **headers):
+        return async_to_sync(AsyncClient().post)(
+            "/api/predict/async/", {"file": jpeg_upload(), "age": "43", "gender": "M"}, headers=headers,
+        )
+
+    def test_matches_sync_view(self):
+        response = self.predict_async()
+
+        self.assertEqual(response.status_code, 200)
+        sync = Client().post("/api/predict/", {"file": jpeg_upload(), "age": "43", "gender": "M"})
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response.json()["clinical_reasoning"], self.fake.text)
+        self.assertEqual(self.backend.calls, [1, 1])
+
+    def test_is_public_like_the_sync_view(self):
+        # predict takes no credentials, so a bad token is ignored rather than rejected.
+        self.assertEqual(self.predict_async(Authorization="Bearer not-a-jwt").status_code, 200)
+
+    def test_pool_rejection_is_503(self):
+        with mock.patch("predictor.views.predict_image", side_effect=InferencePoolUnavailable(3)):
+            response = self.predict_async()
+
+        self.assertEqual((response.status_code, response["Retry-After"]), (503, "3"))
+
+    def test_missing_file(self):
+        response = async_to_sync(AsyncClient().post)("/api/predict/async/", {"age": "43"})
+        self.assertEqual(response.status_code, 500)
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import predict
+from .views import predict, predict_async, inference_stats
 
 urlpatterns = [
     path('predict/', predict),
+    path('predict/async/', predict_async),
+    path('predict/stats/', inference_stats),
 ]
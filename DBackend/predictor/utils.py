@@ -1,40 +1,262 @@
+import hashlib
+import logging
 import os
+import threading
+import time
 import numpy as np
-from PIL import Image
-from tensorflow.keras.models import load_model
+from django.conf import settings
+
+from backend.observability import count_cache, span
+
+from .backends import create_backend
+from .batching import MicroBatcher
+from .cache import PredictionCache, hash_file
+from .preprocessing import IMAGE_SIZE, image_to_array, model_input_image, new_batch, preprocess_batch
+from .worker_pool import InferencePoolClient
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "model_fixed.h5")
+TFLITE_MODEL_PATH = os.path.join(BASE_DIR, "model_fixed_float16.tflite")
 
 CLASS_LABELS = ['glioma', 'meningioma', 'notumor', 'pituitary']
 
-_model = None  # cache model in memory
+_backend = None  # cache model in memory
+_backend_lock = threading.Lock()
+_timings = {}
+_batcher = None
+_batcher_lock = threading.Lock()
+_model_version = None
+_prediction_cache = None
+_pool_client = None
+
 
+def get_model_path():
+    if settings.PREDICTOR_BACKEND == "tflite":
+        return settings.PREDICTOR_TFLITE_PATH or TFLITE_MODEL_PATH
+    return MODEL_PATH
 
-def get_model():
-    global _model
-    if _model is None:
-        print(f"Loading model from {MODEL_PATH}")
-        _model = load_model(MODEL_PATH)
-        print("Model loaded successfully")
-    return _model
+
+def get_backend_options():
+    if settings.PREDICTOR_BACKEND == "keras":
+        return {"mode": settings.PREDICTOR_INFERENCE_MODE}
+    return {"num_threads": settings.PREDICTOR_TFLITE_THREADS}
+
+
+def get_backend():
+    """
+    Loads the inference backend selected by PREDICTOR_BACKEND ("keras" or
+    "tflite") once per process.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = settings.PREDICTOR_BACKEND
+                model_path = get_model_path()
+
+                logger.info("Loading %s model from %s", name, model_path)
+                started = time.perf_counter()
+                backend = create_backend(name, model_path, **get_backend_options()).load()
+                _timings["backend"] = name
+                _timings["load_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+                logger.info("Model loaded successfully in %s ms", _timings["load_ms"])
+                _backend = backend
+    return _backend
+
+
+def warm_up_model(batch_sizes=None):
+    """
+    Loads the model, builds the inference function and runs a dummy
+    forward pass per batch size, so the first real upload does not pay for
+    loading, graph tracing or kernel initialisation. Returns the timings.
+    """
+    if batch_sizes is None:
+        batch_sizes = [1]
+        if settings.PREDICTOR_BATCHING and settings.PREDICTOR_MAX_BATCH_SIZE > 1:
+            batch_sizes.append(settings.PREDICTOR_MAX_BATCH_SIZE)
+
+    backend = get_backend()
+
+    started = time.perf_counter()
+    for size in batch_sizes:
+        backend.infer(np.zeros((size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype="float32"))
+    _timings["warmup_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+    _timings["warmup_batch_sizes"] = list(batch_sizes)
+    _timings["mode"] = getattr(backend, "mode", backend.name)
+    return dict(_timings)
+
+
+def model_timings():
+    return dict(_timings)
+
+
+def get_model_version():
+    """
+    Identifies the weights behind a prediction, so cached results are never
+    served across a model swap. Defaults to a digest of the model file.
+    """
+    global _model_version
+    if _model_version is None:
+        if settings.PREDICTOR_MODEL_VERSION:
+            _model_version = settings.PREDICTOR_MODEL_VERSION
+        else:
+            digest = hashlib.sha256()
+            with open(get_model_path(), "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            _model_version = digest.hexdigest()[:16]
+    return _model_version
+
+
+def get_prediction_cache():
+    global _prediction_cache
+    if _prediction_cache is None:
+        _prediction_cache = PredictionCache(
+            max_entries=settings.PREDICTOR_CACHE_SIZE,
+            persistent=settings.PREDICTOR_CACHE_PERSISTENT,
+        )
+    return _prediction_cache
+
+
+def predict_batch(batch):
+    """
+    Runs the CNN on an (N, 128, 128, 3) array and returns the (N, 4)
+    softmax matrix.
+    """
+    return get_backend().infer(batch)
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    predict_batch,
+                    max_batch_size=settings.PREDICTOR_MAX_BATCH_SIZE,
+                    max_wait_ms=settings.PREDICTOR_MAX_WAIT_MS,
+                )
+    return _batcher
+
+
+def get_pool_client():
+    global _pool_client
+    if _pool_client is None:
+        _pool_client = InferencePoolClient(
+            settings.PREDICTOR_POOL_ADDRESS,
+            settings.PREDICTOR_POOL_AUTHKEY,
+            retry_after=settings.PREDICTOR_POOL_RETRY_AFTER,
+        )
+    return _pool_client
+
+
+def batching_stats():
+    if _batcher is None:
+        return {"enabled": settings.PREDICTOR_BATCHING, "batches": 0, "images": 0}
+    return {"enabled": settings.PREDICTOR_BATCHING, **_batcher.stats()}
+
+
+def cache_stats():
+    return {"enabled": settings.PREDICTOR_CACHE, **get_prediction_cache().stats()}
+
+
+def decode_prediction(probs):
+    class_idx = int(np.argmax(probs))
+    confidence = float(probs[class_idx])
+    return CLASS_LABELS[class_idx], round(confidence, 4)
+
+
+def predict_images(files):
+    """
+    Batch counterpart of predict_image(): returns [(tumor_type, confidence)]
+    in the order of `files`.
+
+    Identical files are inferred once, cached results are reused, and the
+    remaining images are preprocessed into a single buffer and run through
+    the model in batches of PREDICTOR_MAX_BATCH_SIZE.
+    """
+    files = list(files)
+    hashes = [hash_file(f) for f in files]
+    results = {}
+    misses = {}
+
+    for content_hash, file in zip(hashes, files):
+        if content_hash in results or content_hash in misses:
+            continue
+        cached = None
+        if settings.PREDICTOR_CACHE:
+            cached = get_prediction_cache().get(content_hash, get_model_version())
+            count_cache("prediction", "miss" if cached is None else "hit")
+        if cached is not None:
+            results[content_hash] = cached[:2]
+        else:
+            misses[content_hash] = file
+
+    pending = list(misses.items())
+    step = max(1, settings.PREDICTOR_MAX_BATCH_SIZE)
+    buffer = None
+    for start in range(0, len(pending), step):
+        chunk = pending[start:start + step]
+        if buffer is None:
+            buffer = new_batch(min(step, len(pending)))
+        with span("preprocess"):
+            batch = preprocess_batch([file for _, file in chunk], out=buffer)
+
+        with span("inference"):
+            if settings.PREDICTOR_POOL_ADDRESS:
+                probs = get_pool_client().predict_batch(batch)
+            else:
+                probs = predict_batch(batch)
+
+        for (content_hash, _), row in zip(chunk, probs):
+            label, confidence = decode_prediction(row)
+            results[content_hash] = (label, confidence)
+            if settings.PREDICTOR_CACHE:
+                get_prediction_cache().set(content_hash, get_model_version(), label, confidence, row)
+
+    for file in files:
+        file.seek(0)
+    return [results[content_hash] for content_hash in hashes]
 
 
 def predict_image(file):
     """
     Takes Django uploaded file and returns:
     tumor_type, confidence
+
+    Identical uploads are answered from the prediction cache (keyed by
+    content hash + model version) without touching the CNN. A miss is sent
+    to the shared inference pool when PREDICTOR_POOL_ADDRESS is set
+    (raising InferencePoolBusy / InferencePoolUnavailable under
+    backpressure), otherwise run in-process; with PREDICTOR_BATCHING it is
+    queued and run together with other concurrent requests in a single
+    forward pass.
     """
-    model = get_model()
+    content_hash = None
+    if settings.PREDICTOR_CACHE:
+        content_hash = hash_file(file)
+        cached = get_prediction_cache().get(content_hash, get_model_version())
+        count_cache("prediction", "miss" if cached is None else "hit")
+        if cached is not None:
+            label, confidence, _ = cached
+            return label, confidence
 
-    img = Image.open(file).convert("RGB")
-    img = img.resize((128, 128))
-    img_array = np.array(img).astype("float32") / 255.0
-    img_array = img_array.reshape(1, 128, 128, 3)
+    with span("decode"):
+        img = model_input_image(file)
+    with span("preprocess"):
+        img_array = image_to_array(img)
 
-    preds = model.predict(img_array)
-    class_idx = int(np.argmax(preds))
-    confidence = float(np.max(preds))
-    label = CLASS_LABELS[class_idx]
+    with span("inference"):
+        if settings.PREDICTOR_POOL_ADDRESS:
+            probs = get_pool_client().predict(img_array)
+        elif settings.PREDICTOR_BATCHING:
+            probs = get_batcher().submit(img_array, timeout=settings.PREDICTOR_BATCH_TIMEOUT)
+        else:
+            probs = predict_batch(img_array[np.newaxis, ...])[0]
 
-    return label, round(confidence, 4)
+    label, confidence = decode_prediction(probs)
+    if content_hash is not None:
+        get_prediction_cache().set(content_hash, get_model_version(), label, confidence, probs)
+    return label, confidence
@@ -1,10 +1,16 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from .utils import predict_image
+from django.views.decorators.http import require_POST
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .utils import predict_image, batching_stats, cache_stats, model_timings
+from .gemini import get_gemini
+from .worker_pool import InferencePoolBusy, InferencePoolUnavailable
 
-from django.http import JsonResponse
-from .utils import predict_image
-from .services import generate_clinical_reasoning
+from .services import agenerate_clinical_reasoning, generate_clinical_reasoning
 
 @csrf_exempt
 def predict(request):
@@ -25,5 +31,53 @@ def predict(request):
                 "confidence": confidence,
                 "clinical_reasoning": reasoning
             })
+        except (InferencePoolBusy, InferencePoolUnavailable) as e:
+            response = JsonResponse({"error": "Inference capacity exhausted, retry later"}, status=503)
+            response["Retry-After"] = str(e.retry_after)
+            return response
         except Exception as e:
-            return JsonResponse({"error": "Analysis failed"}, status=500)
\ No newline at end of file
+            return JsonResponse({"error": "Analysis failed"}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def predict_async(request):
+    """
+    Same contract as predict, for ASGI deployments: the CNN runs on a
+    worker thread and the Gemini call is awaited, so the event loop keeps
+    serving other requests while this one waits on the network.
+    """
+    file = request.FILES.get("file")
+    age = request.POST.get("age", "Unknown")
+    gender = request.POST.get("gender", "Unknown")
+
+    try:
+        # 1. CNN Model Detection (blocking; off the event loop)
+        label, confidence = await sync_to_async(predict_image, thread_sensitive=False)(file)
+
+        # 2. Gemini Clinical Interpretation
+        reasoning = await agenerate_clinical_reasoning(label, confidence, age, gender)
+
+        return JsonResponse({
+            "prediction": label,
+            "confidence": confidence,
+            "clinical_reasoning": reasoning
+        })
+    except (InferencePoolBusy, InferencePoolUnavailable) as e:
+        response = JsonResponse({"error": "Inference capacity exhausted, retry later"}, status=503)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    except Exception as e:
+        return JsonResponse({"error": "Analysis failed"}, status=500)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def inference_stats(request):
+    """Model, batching, cache and Gemini counters of this process (staff only)."""
+    return Response({
+        "model": model_timings(),
+        "batching": batching_stats(),
+        "cache": cache_stats(),
+        "gemini": get_gemini().stats() if settings.GEMINI_API_KEY else None,
+    })
@@ -0,0 +1,395 @@
+"""
+Out-of-process inference pool.
+
+A fixed number of worker processes each own one model instance. The pool
+listens on a local socket (multiprocessing.connection) and every Django
+worker on the host submits preprocessed images to it, so web workers and
+model workers are sized independently and the host holds at most N model
+copies.
+
+When more than `max_pending` images are already queued the server answers
+"busy" instead of queueing, and "unavailable" while no worker is running;
+clients surface those as InferencePoolBusy / InferencePoolUnavailable so
+views can reply 503 with Retry-After.
+"""
+import functools
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .backends import create_backend
+
+logger = logging.getLogger(__name__)
+
+
+class InferencePoolError(Exception):
+    """Base class for inference pool failures."""
+
+
+class InferencePoolBusy(InferencePoolError):
+    def __init__(self, retry_after):
+        super().__init__(f"Inference pool is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePoolUnavailable(InferencePoolError):
+    def __init__(self, retry_after, reason=""):
+        super().__init__(f"Inference pool is unavailable: {reason}")
+        self.retry_after = retry_after
+
+
+# =========================================================
+# Worker processes
+# =========================================================
+
+def _worker_main(backend_factory, max_batch_size, conn):
+    backend = backend_factory().load()
+    conn.send(("ready", None))
+
+    stopping = False
+    while not stopping:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        batch = [task]
+
+        # Opportunistically batch whatever else is already waiting.
+        while len(batch) < max_batch_size and conn.poll():
+            task = conn.recv()
+            if task is None:
+                stopping = True
+                break
+            batch.append(task)
+
+        try:
+            preds = backend.infer(np.stack([array for _, array in batch]))
+            if len(preds) != len(batch):
+                raise ValueError(f"Backend returned {len(preds)} rows for {len(batch)} images")
+            results = [("ok", request_id, row) for (request_id, _), row in zip(batch, preds)]
+        except Exception as e:
+            results = [("error", request_id, repr(e)) for request_id, _ in batch]
+        conn.send(("results", results))
+
+
+class _Pending:
+    __slots__ = ("done", "status", "value")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = None
+        self.value = None
+
+
+class _Worker:
+    """One model process and the server's end of its pipe."""
+    __slots__ = ("index", "process", "conn", "send_lock", "in_flight", "alive")
+
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.in_flight = set()
+        self.alive = False
+
+
+# =========================================================
+# Server
+# =========================================================
+
+class InferencePoolServer:
+    """
+    Each worker process is fed through its own pipe, so the server knows
+    which requests every worker holds. A worker that exits (TF segfault,
+    OOM kill) shows up as EOF on its pipe: its requests fail at once
+    instead of waiting for `timeout`, and the worker is restarted.
+    """
+
+    def __init__(self, address, authkey, backend_name, model_path, backend_options=None,
+                 workers=2, max_pending=32, max_batch_size=16, retry_after=1, timeout=30.0,
+                 backend_factory=None, restart_delay=1.0):
+        self.address = address
+        self.authkey = authkey
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.backend_options = backend_options or {}
+        self.backend_factory = backend_factory or functools.partial(
+            create_backend, backend_name, model_path, **self.backend_options,
+        )
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self.restart_delay = restart_delay
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._stopping = False
+
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "errors": 0, "worker_exits": 0, "restarts": 0}
+
+    def start(self):
+        self._workers = [self._spawn(i) for i in range(self.workers)]
+        for worker in self._workers:
+            if not self._wait_ready(worker):
+                self.stop()
+                raise InferencePoolError(f"{worker.process.name} exited while loading the model")
+        for worker in self._workers:
+            self._supervise(worker)
+
+    def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError):
+                    # Failed handshake (wrong authkey, client hung up).
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "workers": self.workers,
+                "alive_workers": sum(worker.alive for worker in self._workers),
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+            }
+
+    def submit(self, array):
+        status, value = self.submit_many(array[np.newaxis, ...])
+        return (status, value[0]) if status == "ok" else (status, value)
+
+    def submit_many(self, batch):
+        """
+        Runs every row of `batch` and waits for all of them. Batches larger
+        than `max_pending` are split into chunks of at most that many rows;
+        each chunk is admitted or rejected as a whole.
+        """
+        rows = []
+        for start in range(0, len(batch), self.max_pending):
+            status, value = self._submit_chunk(batch[start:start + self.max_pending])
+            if status != "ok":
+                return status, value
+            rows.append(value)
+        return "ok", np.concatenate(rows)
+
+    def _submit_chunk(self, batch):
+        with self._lock:
+            if len(self._pending) + len(batch) > self.max_pending:
+                self._stats["rejected"] += len(batch)
+                return "busy", self.retry_after
+            alive = [worker for worker in self._workers if worker.alive]
+            if not alive:
+                self._stats["rejected"] += len(batch)
+                return "unavailable", self.retry_after
+            requests = []
+            for array in batch:
+                request_id = next(self._ids)
+                worker = min(alive, key=lambda w: len(w.in_flight))
+                worker.in_flight.add(request_id)
+                requests.append((request_id, self._pending.setdefault(request_id, _Pending()), worker, array))
+            self._stats["submitted"] += len(batch)
+
+        for request_id, _, worker, array in requests:
+            try:
+                with worker.send_lock:
+                    worker.conn.send((request_id, array))
+            except (OSError, ValueError):
+                self._resolve(request_id, "error", "Inference worker exited", worker)
+
+        deadline = time.monotonic() + self.timeout
+        rows = []
+        for request_id, pending, _, _ in requests:
+            if not pending.done.wait(max(0.0, deadline - time.monotonic())):
+                with self._lock:
+                    for other_id, _, worker, _ in requests:
+                        self._pending.pop(other_id, None)
+                        worker.in_flight.discard(other_id)
+                    self._stats["errors"] += 1
+                return "error", "Inference timed out"
+            if pending.status != "ok":
+                return pending.status, pending.value
+            rows.append(pending.value)
+        return "ok", np.stack(rows)
+
+    def _resolve(self, request_id, status, value, worker):
+        with self._lock:
+            worker.in_flight.discard(request_id)
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                return
+            self._stats["completed" if status == "ok" else "errors"] += 1
+        pending.status = status
+        pending.value = value
+        pending.done.set()
+
+    def _spawn(self, index):
+        conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.backend_factory, self.max_batch_size, child_conn),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        # Only the child holds its end now, so its exit reads as EOF here.
+        child_conn.close()
+        return _Worker(index, process, conn)
+
+    def _wait_ready(self, worker):
+        try:
+            status, _ = worker.conn.recv()
+        except (EOFError, OSError):
+            return False
+        worker.alive = status == "ready"
+        return worker.alive
+
+    def _supervise(self, worker):
+        threading.Thread(
+            target=self._run_worker, args=(worker,), name=f"{worker.process.name}-results", daemon=True,
+        ).start()
+
+    def _run_worker(self, worker):
+        while True:
+            self._collect_results(worker)
+            self._worker_exited(worker)
+            worker = self._restart(worker.index)
+            if worker is None:
+                return
+
+    def _collect_results(self, worker):
+        while True:
+            try:
+                _, results = worker.conn.recv()
+            except (EOFError, OSError):
+                return
+            for status, request_id, value in results:
+                self._resolve(request_id, status, value, worker)
+
+    def _worker_exited(self, worker):
+        with self._lock:
+            worker.alive = False
+            lost = list(worker.in_flight)
+            if not self._stopping:
+                self._stats["worker_exits"] += 1
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        if not self._stopping:
+            logger.error(
+                "%s exited (code %s); failing %d requests and restarting it",
+                worker.process.name, worker.process.exitcode, len(lost),
+            )
+        for request_id in lost:
+            self._resolve(request_id, "error", "Inference worker exited", worker)
+
+    def _restart(self, index):
+        while not self._stopping:
+            worker = self._spawn(index)
+            if self._wait_ready(worker):
+                with self._lock:
+                    self._workers[index] = worker
+                    self._stats["restarts"] += 1
+                return worker
+            worker.process.join(timeout=5)
+            logger.error("%s exited while loading the model; retrying", worker.process.name)
+            time.sleep(self.restart_delay)
+        return None
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                command, payload = message
+                if command == "predict":
+                    conn.send(self.submit(payload))
+                elif command == "predict_batch":
+                    conn.send(self.submit_many(payload))
+                elif command == "stats":
+                    conn.send(("ok", self.stats()))
+                else:
+                    conn.send(("error", f"Unknown command {command!r}"))
+
+
+# =========================================================
+# Client (used inside Django workers)
+# =========================================================
+
+class InferencePoolClient:
+    """
+    Thread-safe client; each thread keeps its own persistent connection.
+    """
+
+    def __init__(self, address, authkey, retry_after=1):
+        self.address = address
+        self.authkey = authkey
+        self.retry_after = retry_after
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except (OSError, EOFError) as e:
+                raise InferencePoolUnavailable(self.retry_after, str(e)) from e
+            self._local.conn = conn
+        return conn
+
+    def _call(self, command, payload=None):
+        # One reconnect attempt covers a pool restart between requests.
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send((command, payload))
+                return conn.recv()
+            except (OSError, EOFError) as e:
+                self._local.conn = None
+                if attempt:
+                    raise InferencePoolUnavailable(self.retry_after, str(e)) from e
+
+    def predict(self, array):
+        return self._result(*self._call("predict", array))
+
+    def predict_batch(self, batch):
+        return self._result(*self._call("predict_batch", batch))
+
+    def _result(self, status, value):
+        if status == "ok":
+            return value
+        if status == "busy":
+            raise InferencePoolBusy(value)
+        if status == "unavailable":
+            raise InferencePoolUnavailable(value, "no inference worker is running")
+        raise InferencePoolError(value)
+
+    def stats(self):
+        status, value = self._call("stats")
+        return value
@@ -1,9 +1,12 @@
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { Search, Filter, Calendar, Eye, AlertCircle, ClipboardList, X, Brain, FileText } from "lucide-react";
+import { appendPage, fetchScanStats, listUrl, positiveScans } from "../services/api";
 
 export default function DoctorDashboard() {
   const [scans, setScans] = useState([]);
+  const [stats, setStats] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
 
@@ -17,8 +20,12 @@ export default function DoctorDashboard() {
   // Modal
   const [selectedScan, setSelectedScan] = useState(null);
 
-  const fetchScans = async () => {
-    setLoading(true);
+  // Only the newest request may update the list (filters change while typing).
+  const latestRequest = useRef(0);
+
+  const fetchScans = async (cursor = null) => {
+    const request = ++latestRequest.current;
+    if (!cursor) setLoading(true);
     setError("");
     const token = localStorage.getItem("access");
     if (!token) {
@@ -26,50 +33,45 @@ export default function DoctorDashboard() {
       setLoading(false);
       return;
     }
+    const filters = {
+      search: search.trim(),
+      tumor_type: tumorFilter,
+      status: statusFilter,
+      date_from: fromDate,
+      date_to: toDate,
+    };
     try {
-      const res = await fetch("http://127.0.0.1:8000/api/patients/scans/", {
+      const res = await fetch(listUrl("patients/scans/", cursor, filters), {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
+      if (request !== latestRequest.current) return;
       if (!res.ok) {
         setError(data?.error || "Failed to load scans");
         return;
       }
-      setScans(Array.isArray(data) ? data : data.scans || []);
+      appendPage(setScans, setNextCursor, data, cursor);
     } catch (err) {
-      setError("Server not reachable");
+      if (request === latestRequest.current) setError("Server not reachable");
     } finally {
-      setLoading(false);
+      if (request === latestRequest.current) setLoading(false);
     }
   };
 
+  // Distribution and totals come from the server's materialized stats.
+  const loadStats = () => fetchScanStats().then(setStats).catch((err) => setError(err.message));
+
   useEffect(() => {
-    fetchScans();
+    loadStats();
   }, []);
 
-  const filteredScans = useMemo(() => {
-    let list = [...scans];
-    if (search.trim()) {
-      const q = search.toLowerCase();
-      list = list.filter((s) => {
-        const uid = (s.patient?.patient_uid || "").toLowerCase();
-        const name = (s.patient?.full_name || "").toLowerCase();
-        return uid.includes(q) || name.includes(q);
-      });
-    }
-    if (tumorFilter !== "ALL") list = list.filter((s) => s.tumor_type === tumorFilter);
-    if (statusFilter !== "ALL") list = list.filter((s) => s.status === statusFilter);
-    if (fromDate) {
-      const from = new Date(fromDate).getTime();
-      list = list.filter((s) => new Date(s.scan_date || s.created_at).getTime() >= from);
-    }
-    if (toDate) {
-      const to = new Date(toDate).getTime();
-      list = list.filter((s) => new Date(s.scan_date || s.created_at).getTime() <= to);
-    }
-    list.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-    return list;
-  }, [scans, search, tumorFilter, statusFilter, fromDate, toDate]);
+  const filtersActive = Boolean(search.trim() || tumorFilter !== "ALL" || statusFilter !== "ALL" || fromDate || toDate);
+
+  // Filters run on the server, so a change starts again from the first page.
+  useEffect(() => {
+    const timer = setTimeout(() => fetchScans(), search ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [search, tumorFilter, statusFilter, fromDate, toDate]);
 
   const tumorBadge = (tumor) => {
     const base = "px-2 py-1 rounded-full text-xs font-semibold uppercase";
@@ -102,6 +104,29 @@ export default function DoctorDashboard() {
         </div>
       )}
 
+      {/* DISTRIBUTION */}
+      {stats && (
+        <div className="grid grid-cols-2 md:grid-cols-6 gap-4 mb-8">
+          <div className="bg-white rounded-2xl shadow-sm border border-gray-100 p-4">
+            <p className="text-[10px] font-black text-gray-400 uppercase tracking-widest">Total Scans</p>
+            <p className="text-2xl font-black text-indigo-600">{stats.total_scans}</p>
+          </div>
+          <div className="bg-white rounded-2xl shadow-sm border border-gray-100 p-4">
+            <p className="text-[10px] font-black text-gray-400 uppercase tracking-widest">Positive</p>
+            <p className="text-2xl font-black text-red-500">{positiveScans(stats)}</p>
+          </div>
+          {stats.tumor_types.map((row) => (
+            <div key={row.tumor_type} className="bg-white rounded-2xl shadow-sm border border-gray-100 p-4">
+              <span className={tumorBadge(row.tumor_type)}>{row.tumor_type}</span>
+              <p className="text-2xl font-black text-gray-900 mt-2">{row.count}</p>
+              <p className="text-xs font-bold text-gray-400">
+                {row.avg_confidence == null ? "–" : `${(row.avg_confidence * 100).toFixed(1)}% avg confidence`}
+              </p>
+            </div>
+          ))}
+        </div>
+      )}
+
       {/* FILTERS */}
       <div className="bg-white rounded-3xl shadow-sm border border-gray-100 p-6 mb-8">
         <div className="flex items-center gap-2 mb-6">
@@ -150,7 +175,7 @@ export default function DoctorDashboard() {
             </select>
           </div>
           <div className="flex items-end gap-2">
-            <button onClick={fetchScans} className="flex-1 bg-indigo-600 text-white py-2 rounded-xl font-bold text-sm hover:bg-indigo-700 transition-colors">
+            <button onClick={() => { fetchScans(); loadStats(); }} className="flex-1 bg-indigo-600 text-white py-2 rounded-xl font-bold text-sm hover:bg-indigo-700 transition-colors">
               Refresh
             </button>
             <button 
@@ -170,7 +195,7 @@ export default function DoctorDashboard() {
             <ClipboardList className="w-5 h-5 text-indigo-600" />
             <h2 className="text-lg font-bold text-gray-800">Scan Registry</h2>
           </div>
-          <span className="text-xs font-bold bg-gray-100 text-gray-500 px-3 py-1 rounded-full">{filteredScans.length} Records</span>
+          <span className="text-xs font-bold bg-gray-100 text-gray-500 px-3 py-1 rounded-full">{filtersActive || !stats ? `${scans.length}${nextCursor ? "+" : ""}` : stats.total_scans} Records</span>
         </div>
 
         <div className="overflow-x-auto">
@@ -185,7 +210,7 @@ export default function DoctorDashboard() {
               </tr>
             </thead>
             <tbody className="divide-y divide-gray-50">
-              {filteredScans.map((scan) => (
+              {scans.map((scan) => (
                 <tr key={scan.id} className="hover:bg-indigo-50/10 transition-colors group">
                   <td className="py-4 px-6">
                     <div>
@@ -219,6 +244,13 @@ export default function DoctorDashboard() {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="flex justify-center py-6">
+              <button onClick={() => fetchScans(nextCursor)} className="px-6 py-2 bg-indigo-50 text-indigo-600 rounded-xl font-bold text-sm hover:bg-indigo-100 transition-colors">
+                Load more
+              </button>
+            </div>
+          )}
         </div>
       </div>
 
@@ -187,7 +187,7 @@ export default function DoctorPatientDetail() {
                >
                  {/* Thumbnail */}
                  <div className="sm:w-40 h-40 bg-gray-900 rounded-2xl overflow-hidden relative flex-shrink-0">
-                    <img src={scan.mri_image_url} alt="Scan" className="w-full h-full object-cover opacity-80 group-hover:opacity-100 transition-opacity" />
+                    <img src={scan.thumbnail_url || scan.mri_image_url} alt="Scan" className="w-full h-full object-cover opacity-80 group-hover:opacity-100 transition-opacity" />
                     <div className="absolute inset-0 flex items-center justify-center">
                        <Brain className="text-white/50 w-8 h-8" />
                     </div>
@@ -2,9 +2,11 @@ import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Users, AlertCircle, ChevronRight, Search, X, Activity, Stethoscope } from "lucide-react";
 import { motion } from "framer-motion";
+import { appendPage, listUrl } from "../services/api";
 
 export default function DoctorPatient() {
   const [patients, setPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
   
@@ -17,11 +19,11 @@ export default function DoctorPatient() {
     fetchRegistry();
   }, []);
 
-  const fetchRegistry = async () => {
+  const fetchRegistry = async (cursor = null) => {
     const token = localStorage.getItem("access");
     try {
       // Calls the specific Doctor Registry endpoint
-      const res = await fetch("http://127.0.0.1:8000/api/patients/doctor-registry/", {
+      const res = await fetch(listUrl("patients/doctor-registry/", cursor), {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
@@ -31,7 +33,7 @@ export default function DoctorPatient() {
       }
       if (!res.ok) throw new Error("Failed to load patient registry");
       
-      setPatients(data);
+      appendPage(setPatients, setNextCursor, data, cursor);
     } catch (err) {
       setError(err.message || "Server not reachable");
     } finally {
@@ -192,6 +194,13 @@ export default function DoctorPatient() {
               )}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="flex justify-center py-6">
+              <button onClick={() => fetchRegistry(nextCursor)} className="px-6 py-2 bg-indigo-50 text-indigo-600 rounded-xl font-bold text-sm hover:bg-indigo-100 transition-colors">
+                Load more
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </motion.div>
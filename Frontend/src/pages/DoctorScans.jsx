@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useMemo } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { 
   Search, 
@@ -14,9 +14,12 @@ import {
   CheckCircle, 
   Clock 
 } from "lucide-react";
+import { appendPage, fetchScanStats, listUrl, positiveScans } from "../services/api";
 
 export default function DoctorScans() {
   const [scans, setScans] = useState([]);
+  const [stats, setStats] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
 
@@ -28,27 +31,39 @@ export default function DoctorScans() {
   // Modal
   const [selectedScan, setSelectedScan] = useState(null);
 
+  // Only the newest request may update the list (filters change while typing).
+  const latestRequest = useRef(0);
+
+  // Totals come from the server's materialized stats, not the loaded page.
   useEffect(() => {
-    fetchScans();
+    fetchScanStats().then(setStats).catch((err) => setError(err.message));
   }, []);
 
-  const fetchScans = async () => {
-    setLoading(true);
+  // Filters run on the server, so a change starts again from the first page.
+  useEffect(() => {
+    const timer = setTimeout(() => fetchScans(), search ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [search, tumorFilter, statusFilter]);
+
+  const fetchScans = async (cursor = null) => {
+    const request = ++latestRequest.current;
+    if (!cursor) setLoading(true);
+    setError("");
     const token = localStorage.getItem("access");
+    const filters = { search: search.trim(), tumor_type: tumorFilter, status: statusFilter };
     try {
-      const res = await fetch("http://127.0.0.1:8000/api/patients/scans/", {
+      const res = await fetch(listUrl("patients/scans/", cursor, filters), {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Failed to load scans");
+      if (request !== latestRequest.current) return;
       
-      // Handle response structure (list vs object)
-      const list = Array.isArray(data) ? data : data.scans || [];
-      setScans(list);
+      appendPage(setScans, setNextCursor, data, cursor);
     } catch (err) {
-      setError(err.message || "Server not reachable");
+      if (request === latestRequest.current) setError(err.message || "Server not reachable");
     } finally {
-      setLoading(false);
+      if (request === latestRequest.current) setLoading(false);
     }
   };
 
@@ -73,35 +88,6 @@ export default function DoctorScans() {
     }
   };
 
-  const filteredScans = useMemo(() => {
-    let list = [...scans];
-    
-    // 1. Search (Patient Name or UID)
-    if (search.trim()) {
-      const q = search.toLowerCase();
-      list = list.filter((s) => {
-        const uid = (s.patient?.patient_uid || "").toLowerCase();
-        const name = (s.patient?.full_name || "").toLowerCase();
-        return uid.includes(q) || name.includes(q);
-      });
-    }
-
-    // 2. Tumor Filter
-    if (tumorFilter !== "ALL") {
-      list = list.filter((s) => s.tumor_type === tumorFilter);
-    }
-
-    // 3. Status Filter
-    if (statusFilter !== "ALL") {
-      list = list.filter((s) => s.status === statusFilter);
-    }
-
-    // Sort by Date (Newest First)
-    list.sort((a, b) => new Date(b.scan_date || b.created_at) - new Date(a.scan_date || a.created_at));
-
-    return list;
-  }, [scans, search, tumorFilter, statusFilter]);
-
   const getTumorStyle = (type) => {
     if (type === "notumor") return "bg-emerald-100 text-emerald-700 border-emerald-200";
     if (type === "glioma") return "bg-red-100 text-red-700 border-red-200";
@@ -121,12 +107,12 @@ export default function DoctorScans() {
         <div className="flex gap-3">
            <div className="px-4 py-2 bg-white rounded-xl shadow-sm border border-gray-100 flex flex-col items-center">
               <span className="text-[10px] font-black text-gray-400 uppercase">Total Scans</span>
-              <span className="text-xl font-black text-blue-600">{scans.length}</span>
+              <span className="text-xl font-black text-blue-600">{stats ? stats.total_scans : "–"}</span>
            </div>
            <div className="px-4 py-2 bg-white rounded-xl shadow-sm border border-gray-100 flex flex-col items-center">
               <span className="text-[10px] font-black text-gray-400 uppercase">Positive</span>
               <span className="text-xl font-black text-red-500">
-                {scans.filter(s => s.tumor_type !== 'notumor').length}
+                {stats ? positiveScans(stats) : "–"}
               </span>
            </div>
         </div>
@@ -206,10 +192,10 @@ export default function DoctorScans() {
             <tbody className="divide-y divide-gray-50">
               {loading ? (
                  [...Array(5)].map((_,i) => <tr key={i}><td colSpan="5" className="p-6"><div className="h-8 bg-gray-50 rounded animate-pulse"/></td></tr>)
-              ) : filteredScans.length === 0 ? (
+              ) : scans.length === 0 ? (
                  <tr><td colSpan="5" className="p-12 text-center text-gray-400 font-bold">No scans match your filters</td></tr>
               ) : (
-                filteredScans.map((scan) => (
+                scans.map((scan) => (
                   <tr key={scan.id} className="hover:bg-blue-50/20 transition-colors group">
                     <td className="py-4 px-6">
                       <div>
@@ -249,6 +235,13 @@ export default function DoctorScans() {
               )}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="flex justify-center py-6">
+              <button onClick={() => fetchScans(nextCursor)} className="px-6 py-2 bg-indigo-50 text-indigo-600 rounded-xl font-bold text-sm hover:bg-indigo-100 transition-colors">
+                Load more
+              </button>
+            </div>
+          )}
         </div>
       </div>
 
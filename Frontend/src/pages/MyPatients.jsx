@@ -2,9 +2,11 @@ import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Users, AlertCircle, Plus, ChevronRight, Search, X } from "lucide-react";
 import { motion } from "framer-motion";
+import { appendPage, listUrl } from "../services/api";
 
 export default function MyPatients() {
   const [patients, setPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
   
@@ -17,15 +19,15 @@ export default function MyPatients() {
     fetchPatients();
   }, []);
 
-  const fetchPatients = async () => {
+  const fetchPatients = async (cursor = null) => {
     const token = localStorage.getItem("access");
     try {
-      const res = await fetch("http://127.0.0.1:8000/api/patients/my-patients/", {
+      const res = await fetch(listUrl("patients/my-patients/", cursor), {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
       if (!res.ok) throw new Error("Failed to load patients");
-      setPatients(data);
+      appendPage(setPatients, setNextCursor, data, cursor);
     } catch (err) {
       setError(err.message || "Server not reachable");
     } finally {
@@ -192,6 +194,13 @@ export default function MyPatients() {
               )}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="flex justify-center py-6">
+              <button onClick={() => fetchPatients(nextCursor)} className="px-6 py-2 bg-indigo-50 text-indigo-600 rounded-xl font-bold text-sm hover:bg-indigo-100 transition-colors">
+                Load more
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </motion.div>
@@ -1,9 +1,11 @@
 import React, { useEffect, useState } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { ClipboardList, AlertCircle, Search, ExternalLink, Calendar, FileText, X, Brain, Shield } from "lucide-react";
+import { appendPage, listUrl } from "../services/api";
 
 export default function MyScans() {
   const [scans, setScans] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState("");
   const [loading, setLoading] = useState(false);
   const [selectedScan, setSelectedScan] = useState(null);
@@ -15,16 +17,16 @@ export default function MyScans() {
     fetchScans();
   }, []);
 
-  const fetchScans = async () => {
+  const fetchScans = async (cursor = null) => {
     const token = localStorage.getItem("access");
-    setLoading(true);
+    if (!cursor) setLoading(true);
     try {
-      const res = await fetch("http://127.0.0.1:8000/api/patients/my-scans/", {
+      const res = await fetch(listUrl("patients/my-scans/", cursor), {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
       if (!res.ok) throw new Error("Failed to load scans");
-      setScans(data);
+      appendPage(setScans, setNextCursor, data, cursor);
     } catch (err) {
       setError(err.message || "Server not reachable");
     } finally {
@@ -174,7 +176,7 @@ export default function MyScans() {
                       <td className="px-8 py-5">
                         <div className="flex items-center gap-4">
                           <div className="w-14 h-14 rounded-xl overflow-hidden border border-gray-100 bg-gray-50 flex-shrink-0">
-                            <img src={s.mri_image_url} className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500" alt="MRI" />
+                            <img src={s.thumbnail_url || s.mri_image_url} className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500" alt="MRI" />
                           </div>
                           <div className="flex flex-col">
                             <span className="text-base font-black text-gray-900">{s.patient_name}</span>
@@ -236,6 +238,13 @@ export default function MyScans() {
                 )}
               </tbody>
             </table>
+            {nextCursor && (
+              <div className="flex justify-center py-6">
+                <button onClick={() => fetchScans(nextCursor)} className="px-6 py-2 bg-indigo-50 text-indigo-600 rounded-xl font-bold text-sm hover:bg-indigo-100 transition-colors">
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
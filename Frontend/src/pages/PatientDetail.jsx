@@ -193,7 +193,7 @@ export default function PatientDetail() {
                 {/* Image Preview Area */}
                 <div className="md:w-1/3 relative overflow-hidden">
                   <img
-                    src={s.mri_image_url}
+                    src={s.thumbnail_url || s.mri_image_url}
                     className="h-full w-full object-cover min-h-[250px] transition-transform duration-700 group-hover:scale-110"
                     alt="Brain MRI"
                   />
@@ -39,14 +39,14 @@ export default function UploadPage() {
     const isClinicalMode = token && patientId;
     if (isClinicalMode) fd.append("patient_id", patientId);
 
-    const endpoint = isClinicalMode 
-      ? "http://127.0.0.1:8000/api/patients/upload-scan/" 
-      : "http://127.0.0.1:8000/api/predict/";
-
     try {
-      const res = await fetch(endpoint, {
+      if (isClinicalMode) {
+        await runStreamingAnalysis(fd);
+        return;
+      }
+
+      const res = await fetch("http://127.0.0.1:8000/api/predict/", {
         method: "POST",
-        headers: isClinicalMode ? { Authorization: `Bearer ${token}` } : {},
         body: fd,
       });
       const data = await res.json();
@@ -70,6 +70,55 @@ export default function UploadPage() {
     }
   };
 
+  // Clinical mode: the CNN result arrives first, then Gemini's reasoning
+  // streams in as server-sent events until the scan is saved.
+  const runStreamingAnalysis = async (fd) => {
+    const res = await fetch("http://127.0.0.1:8000/api/patients/upload-scan/stream/", {
+      method: "POST",
+      headers: { Authorization: `Bearer ${token}` },
+      body: fd,
+    });
+    if (!res.ok) {
+      const data = await res.json().catch(() => ({}));
+      alert(data.error || "Analysis failed");
+      return;
+    }
+
+    const handleEvent = (event, data) => {
+      if (event === "prediction") {
+        setResult({ tumor_type: data.tumor_type, confidence: data.confidence, reasoning: "", isSaved: false });
+      } else if (event === "reasoning") {
+        setResult((prev) => prev && { ...prev, reasoning: prev.reasoning + data.text });
+      } else if (event === "complete") {
+        setResult((prev) => ({ ...prev, reasoning: data.clinical_reasoning, isSaved: true }));
+      } else if (event === "error") {
+        alert(data.error || "Analysis failed");
+      }
+    };
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        for (const line of frame.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (data) handleEvent(event, JSON.parse(data));
+      }
+    }
+  };
+
   return (
     <div className="w-full min-h-screen bg-gray-50 flex flex-col items-center py-10 px-6 font-sans overflow-x-hidden">
       
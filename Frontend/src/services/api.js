@@ -10,3 +10,39 @@ export const predictTumor = async (imageFile) => {
     headers: { "Content-Type": "multipart/form-data" },
   });
 };
+
+// List endpoints return one keyset page at a time: { results, next_cursor }.
+// `params` are the server-side filters (tumor_type, status, date_from,
+// date_to, uploader, search); empty and "ALL" values are left out.
+export const listUrl = (path, cursor = null, params = {}) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value && value !== "ALL") query.set(key, value);
+  });
+  if (cursor) query.set("cursor", cursor);
+  const qs = query.toString();
+  return `${API_BASE}${path}${qs ? `?${qs}` : ""}`;
+};
+
+export const appendPage = (setRows, setNextCursor, data, cursor) => {
+  const rows = Array.isArray(data) ? data : data.results || [];
+  setRows((prev) => (cursor ? [...prev, ...rows] : rows));
+  setNextCursor(data.next_cursor || null);
+};
+
+// Materialized totals (patients.stats): { total_scans, unclassified_scans,
+// tumor_types: [{ tumor_type, count, avg_confidence }], daily: [...] }.
+export const fetchScanStats = async (days = 30) => {
+  const token = localStorage.getItem("access");
+  const res = await fetch(`${API_BASE}patients/stats/?days=${days}`, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.error || "Failed to load statistics");
+  return data;
+};
+
+export const positiveScans = (stats) =>
+  (stats?.tumor_types || [])
+    .filter((row) => row.tumor_type !== "notumor")
+    .reduce((sum, row) => sum + row.count, 0);